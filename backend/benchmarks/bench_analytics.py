@@ -0,0 +1,97 @@
+"""
+Benchmark for the nutrition analytics kernels.
+
+Synthesizes 5 years of daily totals for 10k users and runs the same vectorized
+kernels used by /api/diary/analytics over the whole population, chunk by chunk.
+
+Run from the backend directory:
+    python -m benchmarks.bench_analytics [--users 10000] [--years 5] [--chunk 500]
+"""
+
+import argparse
+import time
+import numpy as np
+from datetime import date, timedelta
+from services.analytics import (
+    DailyTotals, TOTAL_FIELDS, adherence_mask, run_lengths, macro_percentages,
+    rolling_mean, weekday_means, summarize
+)
+
+def synthesize(rng, users: int, days: int):
+    """Random but plausible daily totals with ~80% of days logged"""
+    logged = rng.random((users, days)) < 0.8
+    calories = rng.normal(2000, 350, (users, days)).clip(0)
+    protein = calories * rng.uniform(0.15, 0.35, (users, days)) / 4
+    carbs = calories * rng.uniform(0.30, 0.55, (users, days)) / 4
+    fat = calories * rng.uniform(0.20, 0.40, (users, days)) / 9
+    zero = ~logged
+    for column in (calories, protein, carbs, fat):
+        column[zero] = 0
+    return logged, calories, protein, carbs, fat
+
+def run_kernels(logged, calories, protein, carbs, fat, targets, first_weekday, window):
+    adherent = adherence_mask(calories, logged, targets, 0.1)
+    adherence = adherent.sum(axis=-1) / np.maximum(logged.sum(axis=-1), 1)
+    current, longest = run_lengths(adherent)
+    percentages, has_energy = macro_percentages(protein, carbs, fat)
+    counted = logged & has_energy
+    distribution = {
+        macro: np.nanpercentile(np.where(counted, values, np.nan), [25, 50, 75], axis=-1)
+        for macro, values in percentages.items()
+    }
+    weekday = weekday_means(calories, logged, first_weekday)
+    rolling = rolling_mean(calories, logged, window)
+    return adherence, current, longest, distribution, weekday, rolling
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--chunk", type=int, default=500, help="Users processed per batch")
+    parser.add_argument("--window", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    end = date.today()
+    start = end - timedelta(days=365 * args.years)
+    days = (end - start).days + 1
+
+    generate_time = 0.0
+    kernel_time = 0.0
+    for offset in range(0, args.users, args.chunk):
+        users = min(args.chunk, args.users - offset)
+
+        began = time.perf_counter()
+        logged, calories, protein, carbs, fat = synthesize(rng, users, days)
+        targets = rng.integers(1500, 2800, (users, 1))
+        generate_time += time.perf_counter() - began
+
+        began = time.perf_counter()
+        run_kernels(logged, calories, protein, carbs, fat, targets, start.weekday(), args.window)
+        kernel_time += time.perf_counter() - began
+
+    # Single-user path as served by the endpoint, including response model construction
+    frame = DailyTotals(start, days)
+    logged, calories, protein, carbs, fat = synthesize(rng, 1, days)
+    frame.logged[:] = logged[0]
+    for field, column in zip(("calories", "protein", "carbs", "fat"), (calories, protein, carbs, fat)):
+        frame.columns[field][:] = column[0]
+    for field in TOTAL_FIELDS[4:]:
+        frame.columns[field][:] = 0
+
+    repeats = 20
+    began = time.perf_counter()
+    for _ in range(repeats):
+        summarize(frame, 2000, 0.1, args.window)
+    summarize_time = (time.perf_counter() - began) / repeats
+
+    user_days = args.users * days
+    print(f"users={args.users} days={days} user_days={user_days:,}")
+    print(f"synthesis:       {generate_time:8.2f}s")
+    print(f"batch kernels:   {kernel_time:8.2f}s  ({kernel_time / args.users * 1e6:,.1f} us/user, "
+          f"{user_days / kernel_time / 1e6:,.1f}M user-days/s)")
+    print(f"single summarize:{summarize_time * 1e3:8.2f}ms  (one user, {days} days, response model included)")
+
+if __name__ == "__main__":
+    main()
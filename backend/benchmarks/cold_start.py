@@ -0,0 +1,119 @@
+"""
+Cold-start benchmark: how long a fresh worker takes to serve its first request.
+
+Each run starts a new interpreter, so nothing is warm but the OS page cache:
+  build     import server and call create_app()
+  serve     spawn uvicorn with the app factory until /api/health answers 200
+
+Mongo does not need to be running: the app only connects in its lifespan
+and /api/health does not query it. Without a reachable MONGO_URL, `serve`
+includes the READY_TIMEOUT_MS the lifespan spends trying to load the token
+denylist, so point MONGO_URL at a running instance to time a normal start.
+
+Run from the backend directory:
+    python -m benchmarks.cold_start [--runs 5] [--imports 15] [--output cold_start.json]
+
+--imports lists the slowest modules of one `python -X importtime` run.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUILD_SCRIPT = """
+import time
+start = time.perf_counter()
+from server import create_app
+create_app()
+print(time.perf_counter() - start)
+"""
+
+def environment() -> dict:
+    env = dict(os.environ, MONGO_URL=os.getenv("MONGO_URL", "mongodb://127.0.0.1:1"))
+    env.setdefault("SECRET_KEY", "benchmark-secret")
+    env.setdefault("ALGORITHM", "HS256")
+    return env
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def time_build() -> float:
+    output = subprocess.run([sys.executable, "-c", BUILD_SCRIPT], cwd=BACKEND_DIR, env=environment(),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def time_serve(timeout: float = 60) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:create_app", "--factory", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=environment(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/api/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except requests.ConnectionError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {process.returncode}")
+            time.sleep(0.01)
+        raise RuntimeError("Timed out waiting for /api/health")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def slowest_imports(count: int) -> list:
+    """(cumulative ms, module) of the slowest imports of server"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "from server import create_app; create_app()"],
+                            cwd=BACKEND_DIR, env=environment(), capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative) / 1000, module.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+def summarize(runs: list) -> dict:
+    return {"min_ms": round(min(runs) * 1000, 1), "median_ms": round(statistics.median(runs) * 1000, 1),
+            "max_ms": round(max(runs) * 1000, 1), "runs": len(runs)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--imports", type=int, default=0, help="Also list this many of the slowest imports")
+    parser.add_argument("--output", help="Write the results as JSON here")
+    args = parser.parse_args()
+
+    results = {
+        "build": summarize([time_build() for _ in range(args.runs)]),
+        "serve": summarize([time_serve() for _ in range(args.runs)]),
+    }
+    for name, result in results.items():
+        print(f"{name:8s} min {result['min_ms']:8.1f} ms   median {result['median_ms']:8.1f} ms   max {result['max_ms']:8.1f} ms")
+
+    if args.imports:
+        results["slowest_imports"] = [{"module": module, "cumulative_ms": ms} for ms, module in slowest_imports(args.imports)]
+        for row in results["slowest_imports"]:
+            print(f"  {row['cumulative_ms']:8.1f} ms  {row['module']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
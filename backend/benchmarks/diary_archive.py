@@ -0,0 +1,94 @@
+"""
+Hot collection size before and after compacting old diary entries into monthly archives.
+
+Seeds a scratch database with the load-test generator (years of history per
+user), reports the size of diary_entries and its indexes, runs the
+compaction job (services.diary_store.compact) and reports diary_entries and
+diary_archive again, along with the latency of a recent and of an archived
+day's entries and of a year of daily totals.
+
+Run from the backend directory:
+    python -m benchmarks.diary_archive --mongo-url mongodb://localhost:27017
+        [--users 50] [--years 3] [--after-days 180] [--reads 1000] [--keep] [--output diary_archive.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from pymongo import ASCENDING, MongoClient
+from benchmarks.diary_layout import latency, storage
+from loadtest.seed import seed
+from loadtest.usda_stub import fdc_ids
+from services.diary_store import ENTRIES, compact, compaction_boundary, make_diary_store
+
+DATABASE = "calorie_tracker_benchmark_archive"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL"))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--after-days", type=int, default=180)
+    parser.add_argument("--reads", type=int, default=1000, help="Timed reads per query")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    parser.add_argument("--output", help="Write the results as JSON here")
+    args = parser.parse_args()
+    if not args.mongo_url:
+        raise SystemExit("Pass --mongo-url or set MONGO_URL")
+
+    client = MongoClient(args.mongo_url)
+    client.drop_database(DATABASE)
+    db = client[DATABASE]
+    store = make_diary_store(ENTRIES, args.after_days)
+    try:
+        seed(db, args.users, args.years, fdc_ids())
+        db.diary_entries.create_index([("user_id", ASCENDING), ("date", ASCENDING)])
+        db.diary_entries.create_index([("entry_id", ASCENDING)])
+
+        rng = random.Random(42)
+        user_ids = [user["user_id"] for user in db.users.find({}, {"user_id": 1})]
+        boundary = compaction_boundary(args.after_days)
+        hot_days = (date.today() - boundary).days
+        recent = [(db, rng.choice(user_ids), date.today() - timedelta(days=rng.randint(0, 30))) for _ in range(args.reads)]
+        old = [(db, rng.choice(user_ids), date.today() - timedelta(days=rng.randint(hot_days + 1, int(365 * args.years))))
+               for _ in range(args.reads)]
+        year = [(db, rng.choice(user_ids), date.today() - timedelta(days=364), date.today())
+                for _ in range(max(args.reads // 10, 10))]
+
+        def measure() -> dict:
+            return {
+                "recent_day": latency(store.find_entries, recent),
+                "archived_day": latency(store.find_entries, old),
+                "year_of_totals": latency(lambda *call: list(store.daily_totals(*call)), year),
+            }
+
+        results = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("mongo_url", "output")},
+            "before": {"diary_entries": storage(db, "diary_entries"), **measure()},
+        }
+        start = time.perf_counter()
+        moved = compact(db, store)
+        results["compaction"] = {"entries_moved": moved, "seconds": round(time.perf_counter() - start, 1)}
+        results["after"] = {
+            "diary_entries": storage(db, "diary_entries"),
+            "diary_archive": storage(db, "diary_archive"),
+            **measure(),
+        }
+        for phase in ("before", "after"):
+            print(f"{phase:7s} " + "  ".join(f"{name} {value}" for name, value in results[phase].items()))
+        print(f"compaction {results['compaction']}")
+    finally:
+        if not args.keep:
+            client.drop_database(DATABASE)
+        client.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
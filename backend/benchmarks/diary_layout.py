@@ -0,0 +1,98 @@
+"""
+Storage and read latency of the entries layout vs day buckets (services.diary_store).
+
+Seeds a scratch database with the load-test generator, indexes diary_entries
+on (user_id, date) so the per-entry layout is not measured without the index
+it would need, backfills the buckets with the migration code, then reports
+document count, data and index size of both layouts and the latency of the
+reads behind /api/diary/summary/{date} and /api/diary/entries.
+
+Run from the backend directory:
+    python -m benchmarks.diary_layout --mongo-url mongodb://localhost:27017
+        [--users 50] [--years 2] [--reads 2000] [--keep] [--output diary_layout.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+import numpy as np
+from pymongo import ASCENDING, MongoClient
+from loadtest.seed import seed
+from loadtest.usda_stub import fdc_ids
+from services.diary_store import BucketLayout, EntryLayout, backfill
+
+DATABASE = "calorie_tracker_benchmark_layout"
+
+def storage(db, collection: str) -> dict:
+    stats = db.command("collStats", collection)
+    return {
+        "documents": stats["count"],
+        "data_mb": round(stats["size"] / 1e6, 2),
+        "storage_mb": round(stats["storageSize"] / 1e6, 2),
+        "index_mb": round(stats["totalIndexSize"] / 1e6, 2),
+    }
+
+def latency(function, calls: list) -> dict:
+    timings = []
+    for args in calls:
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    timings_us = np.array(timings) * 1e6
+    return {
+        "p50_us": round(float(np.percentile(timings_us, 50)), 1),
+        "p99_us": round(float(np.percentile(timings_us, 99)), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL"))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--reads", type=int, default=2000, help="Timed reads per layout and query")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    parser.add_argument("--output", help="Write the results as JSON here")
+    args = parser.parse_args()
+    if not args.mongo_url:
+        raise SystemExit("Pass --mongo-url or set MONGO_URL")
+
+    client = MongoClient(args.mongo_url)
+    client.drop_database(DATABASE)
+    db = client[DATABASE]
+    try:
+        seed(db, args.users, args.years, fdc_ids())
+        db.diary_entries.create_index([("user_id", ASCENDING), ("date", ASCENDING)])
+        backfill(db, batch_size=5000)
+
+        rng = random.Random(42)
+        user_ids = [user["user_id"] for user in db.users.find({}, {"user_id": 1})]
+        days = int(365 * args.years)
+        day_reads = [(db, rng.choice(user_ids), date.today() - timedelta(days=rng.randint(1, days)))
+                     for _ in range(args.reads)]
+        history_reads = [(db, rng.choice(user_ids)) for _ in range(max(args.reads // 20, 10))]
+
+        results = {"config": {key: value for key, value in vars(args).items() if key not in ("mongo_url", "output")}}
+        for name, layout, collection in (("entries", EntryLayout(), "diary_entries"), ("buckets", BucketLayout(), "diary_days")):
+            results[name] = {
+                "storage": storage(db, collection),
+                "day": latency(layout.find_entries, day_reads),
+                "full_history": latency(layout.find_entries, history_reads),
+            }
+            print(f"{name:8s} {results[name]['storage']}")
+            print(f"         day p50 {results[name]['day']['p50_us']:9.1f} us  p99 {results[name]['day']['p99_us']:9.1f} us   "
+                  f"history p50 {results[name]['full_history']['p50_us']:9.1f} us")
+    finally:
+        if not args.keep:
+            client.drop_database(DATABASE)
+        client.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
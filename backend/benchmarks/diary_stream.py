@@ -0,0 +1,134 @@
+"""
+Idle capacity and fan-out latency of /api/diary/stream on a running server.
+
+Opens `--connections` idle streams, one synthetic user each (tokens are
+signed locally with SECRET_KEY/ALGORITHM, so the server needs the same
+.env), plus `--watchers` streams of one registered user. It then logs
+`--events` diary entries for that user and times how long each takes to
+reach every watcher. With `--server-pid`, the server's resident memory is
+read before and after opening the idle streams to give the cost per
+connection.
+
+Raise the open-file limit of both processes first (ulimit -n 65536).
+Run from the backend directory:
+    python -m benchmarks.diary_stream --url http://localhost:8001 [--connections 10000]
+        [--watchers 5] [--events 50] [--server-pid PID] [--output diary_stream.json]
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+import requests
+from services.auth_service import create_access_token
+
+def resident_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+async def open_stream(host: str, port: int, token: str):
+    reader, writer = await asyncio.open_connection(host, port, limit=2 ** 20)
+    writer.write(f"GET /api/diary/stream?token={token} HTTP/1.1\r\nHost: {host}\r\n"
+                 f"Accept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    status = await reader.readline()
+    if b" 200 " not in status:
+        raise RuntimeError(f"Stream refused: {status.decode().strip()}")
+    # Headers, then the chunk holding the ready event
+    while await reader.readline() not in (b"\r\n", b""):
+        pass
+    while b"event: ready" not in await reader.readline():
+        pass
+    return reader, writer
+
+async def wait_for_entry(reader, entry_id: str):
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise RuntimeError("Stream closed")
+        if line.startswith(b"data: ") and entry_id.encode() in line:
+            return
+
+async def run(args) -> dict:
+    target = urlsplit(args.url)
+    host, port = target.hostname, target.port or 80
+    expires = timedelta(hours=2)
+
+    username = f"stream_benchmark_{uuid.uuid4().hex[:8]}"
+    session = requests.Session()
+    session.post(f"{args.url}/api/auth/register", json={
+        "username": username, "email": f"{username}@example.com", "password": "benchmark123", "full_name": "Benchmark"
+    }).raise_for_status()
+    login = session.post(f"{args.url}/api/auth/login", data={"username": username, "password": "benchmark123"})
+    login.raise_for_status()
+    token = login.json()["access_token"]
+    session.headers["Authorization"] = f"Bearer {token}"
+
+    before_kb = resident_kb(args.server_pid) if args.server_pid else None
+    idle = []
+    start = time.perf_counter()
+    for offset in range(0, args.connections, 500):
+        batch = range(offset, min(offset + 500, args.connections))
+        idle += await asyncio.gather(*[
+            open_stream(host, port, create_access_token({"sub": f"idle{index}", "user_id": f"idle-{index}"}, expires))
+            for index in batch
+        ])
+    open_seconds = time.perf_counter() - start
+    after_kb = resident_kb(args.server_pid) if args.server_pid else None
+
+    watchers = [await open_stream(host, port, token) for _ in range(args.watchers)]
+    latencies = []
+    for index in range(args.events):
+        start = time.perf_counter()
+        response = await asyncio.to_thread(session.post, f"{args.url}/api/diary/entries", json={
+            "date": date.today().isoformat(), "meal_type": "snack", "food_name": f"Benchmark {index}",
+            "serving_size": 1, "serving_unit": "serving",
+            "nutrition": {"calories": 100, "protein": 1, "carbs": 20, "fat": 1, "fiber": 0, "sugar": 10, "sodium": 5}
+        })
+        response.raise_for_status()
+        await asyncio.gather(*[wait_for_entry(reader, response.json()["entry_id"]) for reader, _ in watchers])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    for _, writer in idle + watchers:
+        writer.close()
+
+    result = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "server_pid")},
+        "open_per_sec": round(args.connections / open_seconds, 1) if args.connections else None,
+        "write_to_delivery_p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "write_to_delivery_max_ms": round(max(latencies), 2) if latencies else None,
+    }
+    if before_kb is not None:
+        result["server_rss_mb"] = round(after_kb / 1024, 1)
+        result["kb_per_idle_connection"] = round((after_kb - before_kb) / max(args.connections, 1), 2)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--connections", type=int, default=10000, help="Idle streams to hold open")
+    parser.add_argument("--watchers", type=int, default=5, help="Streams of the user whose diary changes")
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--server-pid", type=int, help="Read the server's memory from /proc")
+    parser.add_argument("--output", help="Write the results as JSON here")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for key, value in results.items():
+        if key != "config":
+            print(f"{key:28s} {value}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
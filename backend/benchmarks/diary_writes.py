@@ -0,0 +1,129 @@
+"""
+Burst benchmark for diary inserts: one insert_one per entry vs the coalescing writer.
+
+`--concurrency` writers insert `--requests` diary entries between them as
+fast as they are acknowledged, like a meal-time spike. Each mode reports
+entries/sec, Mongo insert commands/sec and the latency a caller waits for
+its acknowledgement. insert_one runs in the threadpool here, so the
+baseline is not held back by blocking the event loop.
+
+Writes go to a scratch collection (dropped afterwards) in the
+calorie_tracker_benchmark database. Run from the backend directory:
+    python -m benchmarks.diary_writes --mongo-url mongodb://localhost:27017
+        [--requests 5000] [--concurrency 200] [--batch-size 100] [--linger-ms 5]
+        [--write-concern 1] [--journal true] [--output diary_writes.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import date, datetime
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from pymongo import MongoClient, monitoring
+from services.write_batcher import InsertBatcher, parse_write_concern
+
+class InsertCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.inserts = 0
+
+    def started(self, event):
+        if event.command_name == "insert":
+            self.inserts += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def diary_document(index: int) -> dict:
+    now = datetime.utcnow()
+    return {
+        "entry_id": str(uuid.uuid4()),
+        "user_id": f"benchmark-user-{index % 500}",
+        "date": date.today().isoformat(),
+        "meal_type": "lunch",
+        "fdc_id": "171477",
+        "food_name": "Chicken breast",
+        "brand": None,
+        "serving_size": 150,
+        "serving_unit": "g",
+        "nutrition": {"calories": 247.5, "protein": 46.5, "carbs": 0, "fat": 5.4, "fiber": 0, "sugar": 0, "sodium": 111},
+        "created_at": now,
+        "updated_at": now,
+    }
+
+async def burst(insert, requests: int, concurrency: int) -> tuple:
+    latencies = []
+    counter = iter(range(requests))
+
+    async def writer():
+        for index in counter:
+            start = time.perf_counter()
+            await insert(diary_document(index))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[writer() for _ in range(concurrency)])
+    return time.perf_counter() - start, latencies
+
+def run_mode(name: str, insert, listener: InsertCounter, args) -> dict:
+    commands_before = listener.inserts
+    elapsed, latencies = asyncio.run(burst(insert, args.requests, args.concurrency))
+    commands = listener.inserts - commands_before
+    latencies_ms = np.array(latencies) * 1000
+    result = {
+        "entries_per_sec": round(len(latencies) / elapsed, 1),
+        "mongo_inserts_per_sec": round(commands / elapsed, 1),
+        "mongo_inserts": commands,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max_ms": round(float(latencies_ms.max()), 2),
+    }
+    print(f"{name:10s} {result['entries_per_sec']:10.1f} entries/s  {result['mongo_inserts_per_sec']:9.1f} inserts/s  "
+          f"p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL"))
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--linger-ms", type=float, default=5)
+    parser.add_argument("--write-concern", default="1")
+    parser.add_argument("--journal", help="true/false; server default when omitted")
+    parser.add_argument("--output", help="Write the results as JSON here")
+    args = parser.parse_args()
+    if not args.mongo_url:
+        raise SystemExit("Pass --mongo-url or set MONGO_URL")
+
+    listener = InsertCounter()
+    client = MongoClient(args.mongo_url, event_listeners=[listener], maxPoolSize=args.concurrency)
+    write_concern = parse_write_concern(args.write_concern, args.journal)
+    collection = client.calorie_tracker_benchmark[f"diary_writes_{uuid.uuid4().hex[:8]}"].with_options(write_concern=write_concern)
+    batcher = InsertBatcher(lambda: collection, max_batch=args.batch_size, linger=args.linger_ms / 1000)
+
+    try:
+        results = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("mongo_url", "output")},
+            "insert_one": run_mode("insert_one", lambda document: run_in_threadpool(collection.insert_one, document),
+                                   listener, args),
+            "coalesced": run_mode("coalesced", batcher.insert, listener, args),
+        }
+        results["coalesced"]["avg_batch_size"] = batcher.snapshot()["avg_batch_size"]
+    finally:
+        collection.drop()
+        client.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Micro-benchmarks for the hot paths of a request.
+
+Covers USDA payload parsing (on the payloads in benchmarks/fixtures), the
+totals loop behind /api/diary/summary, nutrient store lookups, JWT
+encode/decode and DiaryEntry list construction. Each run is saved as
+benchmarks/results/<commit>.json (<commit>-dirty.json for an uncommitted
+tree) so any two commits can be compared; `compare` exits non-zero when a
+benchmark got slower than the threshold.
+
+Run from the backend directory:
+    python -m benchmarks.micro run [--repeat 7] [--filter jwt] [--no-save]
+    python -m benchmarks.micro compare BASE [HEAD] [--threshold 10] [--stat min]
+
+BASE and HEAD are git refs (or result files); HEAD defaults to the newest result.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+import uuid
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+# Only needed to sign tokens, any value benchmarks the same
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from models.diary import DiaryEntry
+from routes.diary import build_daily_summary
+from services.auth_service import create_access_token, decode_access_token
+from services.nutrition import scale_nutrition
+from services.nutrient_store import NutrientStore, write_store
+from services.barcode_index import BarcodeLookup, write_index
+from services.request_limits import ClientRateLimiter
+from services.food_search import rank
+from services.usda_api import usda_service
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+MEAL_TYPES = ("breakfast", "lunch", "dinner", "snack")
+
+def load_fixture(name: str) -> dict:
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return json.load(f)
+
+def diary_documents(count: int) -> list:
+    """Diary entries as they come back from Mongo"""
+    per_100g = {"calories": 165, "protein": 31, "carbs": 0, "fat": 3.6, "fiber": 0, "sugar": 0, "sodium": 74}
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": uuid.uuid4().hex[:24],
+            "entry_id": str(uuid.uuid4()),
+            "user_id": "benchmark-user",
+            "date": date.today().isoformat(),
+            "meal_type": MEAL_TYPES[index % len(MEAL_TYPES)],
+            "fdc_id": str(171477 + index),
+            "food_name": f"Food {index}",
+            "brand": None,
+            "serving_size": 100 + index,
+            "serving_unit": "g",
+            "nutrition": scale_nutrition(per_100g, (100 + index) / 100),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for index in range(count)
+    ]
+
+def build_benchmarks() -> dict:
+    """name -> zero-argument callable; setup happens here, outside the timing"""
+    search = load_fixture("usda_search.json")
+    sr_legacy = load_fixture("usda_food_sr_legacy.json")
+    branded = load_fixture("usda_food_branded.json")
+    day = diary_documents(12)  # a typical logged day
+    history = diary_documents(50)
+    token = create_access_token({"sub": "benchmark-user"}, timedelta(minutes=30))
+    parse_food = usda_service._parse_food_data
+
+    # Store with the fixture foods plus filler rows, so lookups binary-search a realistic index
+    store_path = os.path.join(tempfile.mkdtemp(prefix="benchmark-store-"), "nutrients.bin")
+    filler = parse_food(branded)
+    foods = [filler.model_copy(update={"fdc_id": str(1000000 + index)}) for index in range(200000)]
+    write_store(store_path, foods + [parse_food(sr_legacy)] + [parse_food(food) for food in search["foods"]])
+    store = NutrientStore(store_path)
+    stored_id = str(sr_legacy["fdcId"])
+
+    # Barcode index of the same size, looked up by the fixture's UPC-A
+    barcodes_path = os.path.join(os.path.dirname(store_path), "barcodes.bin")
+    barcodes = {10000000000000 + index * 7919: 1000000 + index for index in range(200000)}
+    barcodes[int(branded["gtinUpc"])] = branded["fdcId"]
+    write_index(barcodes_path, barcodes, [])
+    barcode_lookup = BarcodeLookup(barcodes_path)
+
+    # A full bucket store; the benchmark client never runs out of tokens
+    limiter = ClientRateLimiter({"food_lookup": (1e9, 1e9)})
+    for index in range(limiter.max_buckets):
+        limiter.check("food_lookup", f"user-{index}")
+
+    # A first page of unified search: 10 logged foods, 10 custom foods, a USDA page
+    usda_page = [parse_food(food) for food in search["foods"]]
+    logged = [(food.model_copy(update={"description": f"{food.description} {index}"}), index + 1)
+              for index, food in enumerate(usda_page[:10])]
+    custom = [food.model_copy(update={"fdc_id": f"custom:{index}"}) for index, food in enumerate(usda_page[:10])]
+
+    return {
+        "usda.parse_search_page": lambda: [parse_food(food) for food in search["foods"]],
+        "usda.parse_food_sr_legacy": lambda: parse_food(sr_legacy),
+        "usda.parse_food_branded": lambda: parse_food(branded),
+        "usda.parse_nutrition_data": lambda: usda_service._parse_nutrition_data(sr_legacy["foodNutrients"]),
+        "diary.daily_summary_12_entries": lambda: build_daily_summary(date.today(), day),
+        "diary.entry_list_50": lambda: [DiaryEntry(**entry) for entry in history],
+        "store.food_item": lambda: store.food_item(stored_id),
+        "store.profile": lambda: store.profile(stored_id),
+        "barcode.lookup": lambda: barcode_lookup.lookup(branded["gtinUpc"]),
+        "search.rank": lambda: rank("chicken", logged, custom, usda_page),
+        "limits.check": lambda: limiter.check("food_lookup", "user-42"),
+        "auth.jwt_encode": lambda: create_access_token({"sub": "benchmark-user"}, timedelta(minutes=30)),
+        "auth.jwt_decode": lambda: decode_access_token(token),
+    }
+
+def measure(function, repeat: int) -> dict:
+    """Per-call time in microseconds over `repeat` runs of an auto-sized loop"""
+    timer = timeit.Timer(function)
+    loops, _ = timer.autorange()
+    runs = [total / loops * 1e6 for total in timer.repeat(repeat=repeat, number=loops)]
+    return {
+        "min_us": round(min(runs), 3),
+        "median_us": round(statistics.median(runs), 3),
+        "stdev_us": round(statistics.stdev(runs), 3) if len(runs) > 1 else 0.0,
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+def git(*args) -> str:
+    return subprocess.run(["git", *args], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True).stdout.strip()
+
+def current_commit() -> tuple:
+    try:
+        return git("rev-parse", "HEAD"), bool(git("status", "--porcelain", "--untracked-files=no"))
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", True
+
+def result_path(commit: str, dirty: bool) -> str:
+    return os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+
+def run(args):
+    commit, dirty = current_commit()
+    results = {}
+    for name, function in build_benchmarks().items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(function, args.repeat)
+        print(f"{name:36s} {results[name]['min_us']:12.2f} us  (median {results[name]['median_us']:.2f})")
+
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": results,
+    }
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = result_path(commit, dirty)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Saved {os.path.relpath(path)}")
+
+def load_result(reference: str) -> dict:
+    """A result file by path, or the saved result of a git ref"""
+    if os.path.isfile(reference):
+        path = reference
+    else:
+        try:
+            commit = git("rev-parse", reference)
+        except subprocess.CalledProcessError:
+            raise SystemExit(f"'{reference}' is neither a result file nor a git ref")
+        path = result_path(commit, False)
+        if not os.path.isfile(path):
+            raise SystemExit(f"No results for {reference} ({commit[:10]}); check it out and run the benchmarks first")
+    with open(path) as f:
+        return json.load(f)
+
+def newest_result() -> str:
+    paths = glob.glob(os.path.join(RESULTS_DIR, "*.json"))
+    if not paths:
+        raise SystemExit("No saved results yet; run the benchmarks first")
+    return max(paths, key=os.path.getmtime)
+
+def compare(args):
+    base = load_result(args.base)
+    head = load_result(args.head or newest_result())
+    key = f"{args.stat}_us"
+    regressions = 0
+
+    print(f"base {base['commit'][:10]}{' (dirty)' if base['dirty'] else ''}  ->  "
+          f"head {head['commit'][:10]}{' (dirty)' if head['dirty'] else ''}   [{args.stat}, threshold {args.threshold:g}%]")
+    for name in sorted(set(base["benchmarks"]) | set(head["benchmarks"])):
+        before = base["benchmarks"].get(name)
+        after = head["benchmarks"].get(name)
+        if before is None or after is None:
+            print(f"{name:36s} {'only in ' + ('head' if before is None else 'base'):>36s}")
+            continue
+        change = (after[key] - before[key]) / before[key] * 100
+        verdict = ""
+        if change > args.threshold:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            verdict = "faster"
+        print(f"{name:36s} {before[key]:12.2f} -> {after[key]:12.2f} us  {change:+7.1f}%  {verdict}")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) regressed by more than {args.threshold:g}%")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and save the results for this commit")
+    run_parser.add_argument("--repeat", type=int, default=7, help="Timed runs per benchmark")
+    run_parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    run_parser.add_argument("--no-save", action="store_true")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two saved results")
+    compare_parser.add_argument("base", help="Git ref or result file")
+    compare_parser.add_argument("head", nargs="?", help="Git ref or result file (default: newest result)")
+    compare_parser.add_argument("--threshold", type=float, default=10, help="Slowdown in percent that counts as a regression")
+    compare_parser.add_argument("--stat", choices=("min", "median"), default="min")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Bytes on the wire and serialization time of the largest responses, full vs `fields=`.
+
+Builds a 100-food search page (from the load-test USDA catalog, parsed the
+way the API parses it) and a user's full diary history, then serializes each
+the way the routes do: through the response model without `fields`, through
+services.fieldsets with it. Reports raw, gzip and brotli sizes (the levels
+CompressionMiddleware uses) and the median serialization and compression time.
+
+Run from the backend directory:
+    python -m benchmarks.payload_size [--entries 2000] [--repeat 50] [--output payload_size.json]
+"""
+
+import argparse
+import json
+import statistics
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from loadtest.usda_stub import fdc_ids, make_food
+from models.diary import DiaryEntry
+from models.food import FoodItem, FoodSearchResult
+from services import compression
+from services.fieldsets import Fieldset
+from services.usda_api import usda_service
+
+FOOD_FIELDS = "fdc_id,description,brand_owner,nutrition.calories"
+DIARY_FIELDS = "entry_id,date,meal_type,food_name,nutrition.calories"
+
+def search_page(size: int) -> FoodSearchResult:
+    foods = [usda_service._parse_food_data(make_food(int(fdc_id))) for fdc_id in fdc_ids()[:size]]
+    return FoodSearchResult(foods=foods, total_hits=len(foods), current_page=1, total_pages=1)
+
+def diary_history(count: int) -> List[dict]:
+    now = datetime.utcnow()
+    return [{
+        "entry_id": str(uuid.uuid4()),
+        "user_id": "benchmark-user",
+        "date": (date.today() - timedelta(days=index // 4)).isoformat(),
+        "meal_type": ("breakfast", "lunch", "dinner", "snack")[index % 4],
+        "fdc_id": "171477",
+        "food_name": "Chicken breast",
+        "brand": None,
+        "serving_size": 150,
+        "serving_unit": "g",
+        "nutrition": {"calories": 247.5, "protein": 46.5, "carbs": 0, "fat": 5.4, "fiber": 0, "sugar": 0, "sodium": 111},
+        "created_at": now,
+        "updated_at": now,
+    } for index in range(count)]
+
+def timed(function, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings) * 1000
+
+def measure(name: str, serialize, repeat: int) -> dict:
+    body, serialize_ms = timed(serialize, repeat)
+    result = {"raw_bytes": len(body), "serialize_ms": round(serialize_ms, 3)}
+    encodings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    for encoding in encodings:
+        compressed, compress_ms = timed(lambda: compression.compress(body, encoding), repeat)
+        result[f"{encoding}_bytes"] = len(compressed)
+        result[f"{encoding}_ms"] = round(compress_ms, 3)
+    print(f"{name:14s} " + "  ".join(f"{key} {value}" for key, value in result.items()))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--foods", type=int, default=100, help="Foods on the search page")
+    parser.add_argument("--entries", type=int, default=2000, help="Entries in the diary history")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="Write the results as JSON here")
+    args = parser.parse_args()
+
+    page = search_page(args.foods)
+    entries = diary_history(args.entries)
+    food_fields = Fieldset.parse(FoodItem, FOOD_FIELDS)
+    diary_fields = Fieldset.parse(DiaryEntry, DIARY_FIELDS)
+    diary_adapter = TypeAdapter(List[DiaryEntry])
+    # What the Mongo projection returns for DIARY_FIELDS
+    projected = [diary_fields.apply(entry) for entry in entries]
+
+    def full_search():
+        return JSONResponse(jsonable_encoder(FoodSearchResult.model_validate(page.model_dump()))).body
+
+    def sparse_search():
+        return food_fields.response({
+            **page.model_dump(exclude={"foods"}),
+            "foods": [food_fields.apply(food) for food in page.foods]
+        }).body
+
+    def full_diary():
+        return JSONResponse(jsonable_encoder(diary_adapter.validate_python(entries))).body
+
+    def sparse_diary():
+        return diary_fields.response([diary_fields.apply(entry) for entry in projected]).body
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "search_full": measure("search_full", full_search, args.repeat),
+        "search_fields": measure("search_fields", sparse_search, args.repeat),
+        "diary_full": measure("diary_full", full_diary, args.repeat),
+        "diary_fields": measure("diary_fields", sparse_diary, args.repeat),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+USDA call latency percentiles and upstream load with and without retries and hedging.
+
+Runs the same sequence of search calls through USDAAPIService._get (no
+caches) over a FaultInjectingTransport with a long-tailed latency and an
+error rate, once per policy: no retries, retries, and retries plus hedging
+at the observed p95. Reports p50/p95/p99 latency, the share of calls that
+still failed and the upstream calls made per call. The quota is sized so
+it never gets in the way.
+
+Run from the backend directory:
+    python -m benchmarks.usda_tail [--calls 2000] [--concurrency 16] [--latency lognormal:80:0.6]
+        [--error-rate 0.02] [--budget 2] [--output usda_tail.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services import deadline
+from services.usda_api import USDAAPIService, USDAServiceError
+from services.usda_transport import FaultInjectingTransport, FixtureResponse, parse_latency
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class FixturePage:
+    """Answers every search with the fixture page"""
+
+    def __init__(self, body: str):
+        self.body = body
+
+    def get(self, url: str, params: dict, timeout):
+        return FixtureResponse(200, {}, self.body)
+
+class CountingTransport:
+    """Counts the calls that reach the upstream, failed ones included"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+
+    def get(self, url: str, params: dict, timeout):
+        self.calls += 1
+        return self.inner.get(url, params, timeout)
+
+def run_policy(args, body: str, retries: int, hedge: bool) -> dict:
+    upstream = CountingTransport(FaultInjectingTransport(
+        FixturePage(body), latency=parse_latency(args.latency), error_rate=args.error_rate,
+        errors=["503", "connection"], seed=42
+    ))
+    service = USDAAPIService(transport=upstream)
+    service.limiter.capacity = service.limiter.tokens = 1e9
+    service.limiter.refill_per_second = 1e9
+    service.breaker.failure_threshold = 10 ** 9
+    service.max_retries = retries
+    service.hedge = hedge
+
+    def call(index: int):
+        started = time.perf_counter()
+        with deadline.budget(args.budget):
+            try:
+                service._get("search", "/foods/search", {"query": f"food {index}"})
+                failed = False
+            except USDAServiceError:
+                failed = True
+        return time.perf_counter() - started, failed
+
+    # Warm-up fills the latency window the hedge threshold comes from
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(call, range(200)))
+        upstream.calls = 0
+        results = list(executor.map(call, range(args.calls)))
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50_ms": round(quantiles[49], 1),
+        "p95_ms": round(quantiles[94], 1),
+        "p99_ms": round(quantiles[98], 1),
+        "failed": round(sum(failed for _, failed in results) / len(results), 4),
+        "upstream_calls_per_call": round(upstream.calls / len(results), 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", default="lognormal:80:0.6", help="Injected latency, as for USDA_INJECT_LATENCY")
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--budget", type=float, default=2, help="Request budget in seconds")
+    parser.add_argument("--output", help="Write the results as JSON here")
+    args = parser.parse_args()
+
+    with open(os.path.join(BENCHMARKS_DIR, "fixtures", "usda_search.json")) as f:
+        body = f.read()
+
+    results = {"config": {key: value for key, value in vars(args).items() if key != "output"}}
+    for name, retries, hedge in (("no_retries", 0, False), ("retries", 2, False), ("retries_and_hedging", 2, True)):
+        results[name] = run_policy(args, body, retries, hedge)
+        print(f"{name:20s} " + "  ".join(f"{key} {value}" for key, value in results[name].items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Multi-worker deployment: gunicorn managing uvicorn workers.
+
+Run from the backend directory:
+    gunicorn -c gunicorn.conf.py
+
+Each worker builds its own app through server:create_app(). Caches (USDA
+results, nutrient profiles, the token denylist) move to the shared SQLite
+backend so every worker sees the same entries and invalidations, and the
+USDA hourly quota is split between the workers.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8001")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+wsgi_app = "server:create_app()"
+
+# Inherited by the workers, which import the app after forking
+os.environ["WEB_CONCURRENCY"] = str(workers)
+os.environ.setdefault("CACHE_BACKEND", "sqlite")
+
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = 10000
+max_requests_jitter = 1000
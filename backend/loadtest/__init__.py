@@ -0,0 +1 @@
+"""Load-test harness: the API against a local mongod and a stubbed USDA server."""
@@ -0,0 +1,209 @@
+"""
+Load test for the Calorie Tracker API.
+
+Starts a throwaway mongod, the USDA stub and the API (uvicorn), seeds users
+with years of diary history, then runs virtual users through a weighted mix
+of scenarios (login, search-as-you-type, diary writes, dashboard and history
+reads). Every virtual user logs in at once when the run starts, which doubles
+as a login burst. Prints (or writes) a JSON report with throughput and
+latency percentiles per endpoint so runs can be diffed.
+
+Run from the backend directory:
+    python -m loadtest [--users 200] [--years 3] [--concurrency 50] [--duration 60]
+                       [--mix login=1,search=3,diary_write=3,dashboard=4,history=1]
+                       [--mongo-url mongodb://...] [--output report.json]
+
+USDA_TRANSPORT=replay (with USDA_FIXTURES) and the USDA_INJECT_* variables
+are passed through to the API, to serve recorded responses with injected
+latency and errors instead of the stub's synthetic catalog. So is
+DIARY_LAYOUT; with buckets the seeded history is backfilled into them.
+The per-client rate limits are off unless RATE_LIMIT_* is set.
+
+`mongod` must be on the PATH unless --mongo-url is given. The API always uses
+the `calorie_tracker` database, so only point --mongo-url at a disposable
+instance.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+import requests
+from pymongo import MongoClient
+from loadtest.seed import seed
+from services.diary_store import backfill
+from loadtest.usda_stub import fdc_ids
+from loadtest.workloads import DEFAULT_MIX, Recorder, VirtualUser, parse_mix, run_user
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(check, what: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+def start_mongod(dbpath: str):
+    if shutil.which("mongod") is None:
+        raise RuntimeError("mongod not found on PATH; install MongoDB or pass --mongo-url")
+    port = free_port()
+    process = subprocess.Popen(
+        ["mongod", "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"mongodb://127.0.0.1:{port}"
+    wait_for(lambda: MongoClient(url, serverSelectionTimeoutMS=500).admin.command("ping"), "mongod")
+    return process, url
+
+def start_stub(args):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "loadtest.usda_stub", "--port", str(port),
+         "--latency-ms", str(args.usda_latency_ms), "--error-rate", str(args.usda_error_rate)],
+        cwd=BACKEND_DIR
+    )
+    url = f"http://127.0.0.1:{port}/fdc/v1"
+    wait_for(lambda: requests.get(f"{url}/food/0", timeout=1).status_code == 404, "USDA stub")
+    return process, url
+
+def start_app(args, mongo_url: str, usda_url: str):
+    port = free_port()
+    env = dict(os.environ, MONGO_URL=mongo_url, USDA_BASE_URL=usda_url, USDA_API_KEY="loadtest",
+               WEB_CONCURRENCY=str(args.workers))
+    if args.workers > 1:
+        # Same shared-cache setup as gunicorn.conf.py, in a file private to this run
+        env.setdefault("CACHE_BACKEND", "sqlite")
+        env["CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="loadtest-cache-"), "cache.sqlite3")
+    env.setdefault("SECRET_KEY", "loadtest-secret")
+    env.setdefault("ALGORITHM", "HS256")
+    # Every virtual user comes from 127.0.0.1 and searches faster than a person types
+    env.setdefault("RATE_LIMIT_AUTH", "off")
+    env.setdefault("RATE_LIMIT_FOOD_LOOKUP", "off")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:create_app", "--factory", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    wait_for(lambda: requests.get(f"{url}/api/health", timeout=1).status_code == 200, "API server", timeout=60)
+    return process, url
+
+def run(args, base_url: str, usernames: list) -> dict:
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    catalog = fdc_ids()
+    users = [
+        VirtualUser(base_url, usernames[index % len(usernames)], recorder, catalog, args.seed + index)
+        for index in range(args.concurrency)
+    ]
+
+    started = time.perf_counter()
+    deadline = started + args.warmup + args.duration
+    threads = [
+        threading.Thread(target=run_user, args=(user, mix, deadline, args.think_ms / 1000), daemon=True)
+        for user in users
+    ]
+    # Record the opening login burst too unless a warm-up was asked for
+    if args.warmup <= 0:
+        recorder.start_recording()
+    for thread in threads:
+        thread.start()
+    if args.warmup > 0:
+        time.sleep(args.warmup)
+        recorder.start_recording()
+    for thread in threads:
+        thread.join(timeout=max(deadline - time.perf_counter(), 0) + 60)
+    recorder.stop_recording()
+    return recorder.report()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="Seeded accounts")
+    parser.add_argument("--years", type=float, default=3, help="Diary history per account")
+    parser.add_argument("--concurrency", type=int, default=50, help="Virtual users running at once")
+    parser.add_argument("--duration", type=float, default=60, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=0, help="Unmeasured seconds before the measured window")
+    parser.add_argument("--think-ms", type=float, default=500, help="Mean pause between scenarios")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--usda-latency-ms", type=float, default=80)
+    parser.add_argument("--usda-error-rate", type=float, default=0.0)
+    parser.add_argument("--mongo-url", help="Use this MongoDB instead of starting a throwaway mongod")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse accounts seeded by an earlier run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    processes = []
+    dbpath = None
+    try:
+        if args.mongo_url:
+            mongo_url = args.mongo_url
+        else:
+            dbpath = tempfile.mkdtemp(prefix="loadtest-mongo-")
+            mongod, mongo_url = start_mongod(dbpath)
+            processes.append(mongod)
+
+        stub, usda_url = start_stub(args)
+        processes.append(stub)
+
+        db = MongoClient(mongo_url).calorie_tracker
+        began = time.perf_counter()
+        if args.skip_seed:
+            usernames = [user["username"] for user in db.users.find({"username": {"$regex": "^loadtest_"}}, {"username": 1})]
+        else:
+            usernames = seed(db, args.users, args.years, fdc_ids(), seed=args.seed)
+        if not usernames:
+            raise RuntimeError("No load-test users to log in as; run without --skip-seed first")
+        print(f"Seeded {len(usernames)} users in {time.perf_counter() - began:.1f}s "
+              f"({db.diary_entries.estimated_document_count():,} diary entries)", file=sys.stderr)
+        if os.getenv("DIARY_LAYOUT", "entries").lower() != "entries" and not args.skip_seed:
+            # The seed writes the per-entry layout; copy it into the day buckets the API will read
+            backfill(db, batch_size=5000)
+
+        app, base_url = start_app(args, mongo_url, usda_url)
+        processes.append(app)
+
+        report = run(args, base_url, usernames)
+        report = {
+            "started_at": datetime.utcnow().isoformat(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("mongo_url", "output")},
+            **report,
+        }
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+            print(f"Report written to {args.output}", file=sys.stderr)
+        else:
+            print(output)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if dbpath:
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Seeds load-test users with years of diary and weight history, straight into MongoDB."""
+
+import random
+import uuid
+from datetime import date, datetime, timedelta
+from services.auth_service import get_password_hash
+from services.nutrition import scale_nutrition
+from loadtest.usda_stub import make_food
+
+USERNAME_PREFIX = "loadtest_"
+PASSWORD = "LoadTest123!"
+MEAL_TYPES = ("breakfast", "lunch", "dinner", "snack")
+BATCH_SIZE = 5000
+
+# USDA nutrient ids of the NutritionInfo fields
+NUTRIENT_IDS = {1008: "calories", 1003: "protein", 1005: "carbs", 1004: "fat", 1079: "fiber", 2000: "sugar", 1093: "sodium"}
+
+def username(index: int) -> str:
+    return f"{USERNAME_PREFIX}{index:05d}"
+
+def per_100g(fdc_id: str) -> tuple:
+    food = make_food(int(fdc_id))
+    nutrition = {NUTRIENT_IDS[n["nutrient"]["id"]]: n["amount"] for n in food["foodNutrients"]}
+    return food["description"], food["brandOwner"], nutrition
+
+def seed(db, users: int, years: float, fdc_ids: list, entries_per_day: tuple = (3, 6),
+         logged_fraction: float = 0.85, seed: int = 42) -> list:
+    """Create `users` accounts with diary history; returns their usernames
+
+    Users that already exist are left alone, so re-running against the same
+    database only tops it up.
+    """
+    rng = random.Random(seed)
+    hashed_password = get_password_hash(PASSWORD)  # bcrypt is slow, hash once for everyone
+    foods = {fdc_id: per_100g(fdc_id) for fdc_id in fdc_ids}
+    today = date.today()
+    days = int(365 * years)
+
+    names = []
+    entries = []
+    weights = []
+    for index in range(users):
+        name = username(index)
+        names.append(name)
+        if db.users.find_one({"username": name}, {"_id": 1}):
+            continue
+
+        user_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        db.users.insert_one({
+            "user_id": user_id,
+            "username": name,
+            "email": f"{name}@loadtest.example.com",
+            "hashed_password": hashed_password,
+            "full_name": f"Load Test {index}",
+            "activity_level": "moderately_active",
+            "goal": "maintain",
+            "target_calories": rng.randrange(1500, 2800, 50),
+            "created_at": now,
+            "updated_at": now,
+        })
+
+        # Each user sticks to a small set of favourite foods, like real diaries do
+        favourites = rng.sample(fdc_ids, min(len(fdc_ids), 25))
+        weight = rng.uniform(55, 100)
+        for offset in range(days, 0, -1):
+            day = (today - timedelta(days=offset)).isoformat()
+            if offset % 7 == 0:
+                weight += rng.gauss(-0.05, 0.3)
+                weights.append({
+                    "entry_id": str(uuid.uuid4()), "user_id": user_id, "date": day,
+                    "weight": round(weight, 1), "created_at": now,
+                })
+            if rng.random() > logged_fraction:
+                continue
+
+            for _ in range(rng.randint(*entries_per_day)):
+                fdc_id = rng.choice(favourites)
+                description, brand, nutrition = foods[fdc_id]
+                grams = rng.choice((50, 100, 150, 200, 250))
+                entries.append({
+                    "entry_id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "date": day,
+                    "meal_type": rng.choice(MEAL_TYPES),
+                    "fdc_id": fdc_id,
+                    "food_name": description,
+                    "brand": brand,
+                    "serving_size": grams,
+                    "serving_unit": "g",
+                    "nutrition": scale_nutrition(nutrition, grams / 100),
+                    "created_at": now,
+                    "updated_at": now,
+                })
+
+            if len(entries) >= BATCH_SIZE:
+                db.diary_entries.insert_many(entries, ordered=False)
+                entries = []
+
+    if entries:
+        db.diary_entries.insert_many(entries, ordered=False)
+    if weights:
+        db.weight_entries.insert_many(weights, ordered=False)
+    return names
@@ -0,0 +1,164 @@
+"""
+Stand-in for the USDA FoodData Central API used by load tests.
+
+Serves /foods/search and /food/{fdcId} from a deterministic synthetic catalog
+in the same JSON shapes the real API returns, with configurable latency and
+error rate, so runs never spend real quota and are repeatable.
+
+Run from the backend directory:
+    python -m loadtest.usda_stub [--port 8089] [--latency-ms 80] [--error-rate 0]
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FIRST_FDC_ID = 100000
+
+FOODS = [
+    "chicken breast", "chicken thigh", "beef", "pork chop", "salmon", "tuna", "shrimp", "egg",
+    "rice", "brown rice", "pasta", "bread", "oats", "quinoa", "potato", "sweet potato",
+    "apple", "banana", "orange", "strawberries", "blueberries", "grapes", "avocado", "broccoli",
+    "spinach", "carrot", "tomato", "cucumber", "lettuce", "peas", "beans", "lentils",
+    "milk", "yogurt", "cheddar cheese", "butter", "olive oil", "peanut butter", "almonds", "walnuts",
+]
+STYLES = ["raw", "cooked", "grilled", "baked", "fried", "steamed", "canned", "frozen", "dried", "roasted"]
+BRANDS = [None, None, "Kroger", "Great Value", "Kirkland", "Trader Joe's"]
+
+def catalog_size() -> int:
+    return len(FOODS) * len(STYLES)
+
+def fdc_ids() -> list:
+    """Every fdc_id the stub knows about, for seeding and workloads"""
+    return [str(FIRST_FDC_ID + index) for index in range(catalog_size())]
+
+def make_food(fdc_id: int) -> dict:
+    """Synthetic food in the shape of a /food/{fdcId} response"""
+    index = fdc_id - FIRST_FDC_ID
+    name = FOODS[index // len(STYLES)]
+    style = STYLES[index % len(STYLES)]
+    rng = random.Random(fdc_id)
+
+    protein = round(rng.uniform(0, 30), 2)
+    carbs = round(rng.uniform(0, 70), 2)
+    fat = round(rng.uniform(0, 40), 2)
+    amounts = {
+        1008: round(protein * 4 + carbs * 4 + fat * 9, 1),
+        1003: protein,
+        1005: carbs,
+        1004: fat,
+        1079: round(rng.uniform(0, 10), 2),
+        2000: round(rng.uniform(0, 20), 2),
+        1093: round(rng.uniform(0, 800), 1),
+    }
+    return {
+        "fdcId": fdc_id,
+        "description": f"{name.capitalize()}, {style}",
+        "dataType": "SR Legacy",
+        "brandOwner": BRANDS[index % len(BRANDS)],
+        "foodCategory": {"description": "Load test foods"},
+        "foodNutrients": [
+            {"nutrient": {"id": nutrient_id}, "amount": amount} for nutrient_id, amount in amounts.items()
+        ],
+        "foodPortions": [
+            {"amount": 1, "gramWeight": round(rng.uniform(100, 250), 1), "modifier": "cup", "measureUnit": {"name": "undetermined"}},
+            {"amount": 1, "gramWeight": round(rng.uniform(5, 20), 1), "modifier": "tbsp", "measureUnit": {"name": "undetermined"}},
+        ],
+    }
+
+def search_result(food: dict) -> dict:
+    """A food in the flat shape of a /foods/search hit"""
+    return {
+        "fdcId": food["fdcId"],
+        "description": food["description"],
+        "dataType": food["dataType"],
+        "brandOwner": food["brandOwner"],
+        "foodCategory": food["foodCategory"]["description"],
+        "foodNutrients": [
+            {"nutrientId": n["nutrient"]["id"], "value": n["amount"]} for n in food["foodNutrients"]
+        ],
+    }
+
+class StubCatalog:
+    def __init__(self):
+        self.foods = {FIRST_FDC_ID + i: make_food(FIRST_FDC_ID + i) for i in range(catalog_size())}
+        self.descriptions = [(fdc_id, food["description"].lower()) for fdc_id, food in self.foods.items()]
+
+    def search(self, query: str, page: int, page_size: int) -> dict:
+        # Every word must match; the last one as a prefix, like a user still typing
+        words = query.lower().replace(",", " ").split()
+        hits = [
+            fdc_id for fdc_id, text in self.descriptions
+            if all(word in text for word in words[:-1]) and (not words or words[-1] in text)
+        ]
+        start = (page - 1) * page_size
+        return {
+            "totalHits": len(hits),
+            "currentPage": page,
+            "totalPages": (len(hits) + page_size - 1) // page_size,
+            "foods": [search_result(self.foods[fdc_id]) for fdc_id in hits[start:start + page_size]],
+        }
+
+def make_handler(catalog: StubCatalog, latency: float, jitter: float, error_rate: float):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(max(random.gauss(latency, jitter), 0))
+            if random.random() < error_rate:
+                self._send(503, {"error": "stubbed failure"})
+                return
+
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            path = url.path.rstrip("/")
+            if path.endswith("/foods/search"):
+                query = params.get("query", [""])[0]
+                page = int(params.get("pageNumber", ["1"])[0])
+                page_size = int(params.get("pageSize", ["20"])[0])
+                self._send(200, catalog.search(query, page, page_size))
+            elif "/food/" in path:
+                food_id = path.rsplit("/", 1)[-1]
+                food = catalog.foods.get(int(food_id)) if food_id.isdigit() else None
+                if food is None:
+                    self._send(404, {"error": "not found"})
+                else:
+                    self._send(200, food)
+            else:
+                self._send(404, {"error": "not found"})
+
+        def _send(self, status_code: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            # A quota the app will never exhaust during a run
+            self.send_header("X-RateLimit-Limit", "1000000")
+            self.send_header("X-RateLimit-Remaining", "1000000")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+def serve(port: int, latency: float = 0.08, jitter: float = 0.02, error_rate: float = 0.0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(StubCatalog(), latency, jitter, error_rate))
+    server.daemon_threads = True
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=80, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+    serve(args.port, args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate)
+
+if __name__ == "__main__":
+    main()
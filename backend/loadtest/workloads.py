@@ -0,0 +1,199 @@
+"""Virtual users, the scenarios they run and per-endpoint latency recording."""
+
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+import numpy as np
+import requests
+from loadtest.seed import PASSWORD, MEAL_TYPES
+from loadtest.usda_stub import FOODS
+
+class Recorder:
+    """Collects latency and status of every request, grouped by endpoint name
+
+    Requests that finish before `start_recording()` (warm-up) are dropped.
+    """
+
+    def __init__(self):
+        self.recording = False
+        self._latencies = defaultdict(list)
+        self._statuses = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self.started = None
+        self.stopped = None
+
+    def start_recording(self):
+        with self._lock:
+            self._latencies.clear()
+            self._statuses.clear()
+            self.recording = True
+            self.started = time.perf_counter()
+
+    def stop_recording(self):
+        with self._lock:
+            self.recording = False
+            self.stopped = time.perf_counter()
+
+    def record(self, name: str, latency: float, status):
+        with self._lock:
+            if self.recording:
+                self._latencies[name].append(latency)
+                self._statuses[name][str(status)] += 1
+
+    def report(self) -> dict:
+        elapsed = (self.stopped or time.perf_counter()) - self.started
+        with self._lock:
+            names = sorted(self._latencies)
+            endpoints = {name: self._summarize(self._latencies[name], self._statuses[name], elapsed) for name in names}
+            everything = [latency for name in names for latency in self._latencies[name]]
+            statuses = sum(self._statuses.values(), Counter())
+        return {
+            "duration_s": round(elapsed, 2),
+            "totals": self._summarize(everything, statuses, elapsed),
+            "endpoints": endpoints,
+        }
+
+    @staticmethod
+    def _summarize(latencies: list, statuses: Counter, elapsed: float) -> dict:
+        count = len(latencies)
+        errors = sum(n for status, n in statuses.items() if not status.isdigit() or int(status) >= 400)
+        summary = {
+            "requests": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "throughput_rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+            "statuses": dict(statuses),
+        }
+        if count:
+            values = np.asarray(latencies) * 1000
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            summary.update({
+                "mean_ms": round(float(values.mean()), 2),
+                "p50_ms": round(float(p50), 2),
+                "p90_ms": round(float(p90), 2),
+                "p99_ms": round(float(p99), 2),
+                "max_ms": round(float(values.max()), 2),
+            })
+        return summary
+
+class VirtualUser:
+    """One simulated client: its own HTTP session, account and random stream"""
+
+    def __init__(self, base_url: str, username: str, recorder: Recorder, fdc_ids: list, seed: int):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.recorder = recorder
+        self.fdc_ids = fdc_ids
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.session.headers["Connection"] = "keep-alive"
+
+    def call(self, name: str, method: str, path: str, **kwargs):
+        """Send one request and record it under `name` (the route template)"""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=30, **kwargs)
+        except requests.RequestException as e:
+            self.recorder.record(name, time.perf_counter() - started, type(e).__name__)
+            return None
+        self.recorder.record(name, time.perf_counter() - started, response.status_code)
+        return response
+
+    def think(self, seconds: float):
+        time.sleep(self.rng.uniform(0.5, 1.5) * seconds)
+
+    # Scenarios ---------------------------------------------------------------
+
+    def login(self) -> bool:
+        response = self.call("POST /api/auth/login", "POST", "/api/auth/login",
+                             data={"username": self.username, "password": PASSWORD})
+        if response is None or response.status_code != 200:
+            return False
+        self.session.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        return True
+
+    def search_typing(self):
+        """Type a food name a keystroke at a time, then open one of the results"""
+        word = self.rng.choice(FOODS)
+        results = None
+        for length in range(3, len(word) + 1):
+            response = self.call("GET /api/food/search", "GET", "/api/food/search",
+                                 params={"query": word[:length], "page_size": 20})
+            if response is not None and response.status_code == 200:
+                results = response.json()["foods"]
+            self.think(0.15)
+
+        if results:
+            fdc_id = self.rng.choice(results)["fdc_id"]
+            self.call("GET /api/food/details/{fdc_id}", "GET", f"/api/food/details/{fdc_id}")
+
+    def diary_write(self):
+        """Log a food (nutrition computed server-side), occasionally edit or delete it"""
+        payload = {
+            "date": date.today().isoformat(),
+            "meal_type": self.rng.choice(MEAL_TYPES),
+            "fdc_id": self.rng.choice(self.fdc_ids),
+            "serving_size": self.rng.choice((1, 2)),
+            "serving_unit": self.rng.choice(("cup", "tbsp", "g")),
+        }
+        if payload["serving_unit"] == "g":
+            payload["serving_size"] = self.rng.choice((50, 100, 150))
+        response = self.call("POST /api/diary/entries", "POST", "/api/diary/entries", json=payload)
+        if response is None or response.status_code != 200:
+            return
+
+        entry_id = response.json()["entry_id"]
+        roll = self.rng.random()
+        if roll < 0.2:
+            self.think(0.5)
+            self.call("PUT /api/diary/entries/{entry_id}", "PUT", f"/api/diary/entries/{entry_id}",
+                      json={"serving_size": payload["serving_size"] * 2, "serving_unit": payload["serving_unit"]})
+        elif roll < 0.3:
+            self.think(0.5)
+            self.call("DELETE /api/diary/entries/{entry_id}", "DELETE", f"/api/diary/entries/{entry_id}")
+
+    def dashboard_read(self):
+        """What the dashboard page loads on open"""
+        today = date.today().isoformat()
+        self.call("GET /api/dashboard", "GET", "/api/dashboard", params={"date": today, "weight_limit": 7})
+
+    def history_read(self):
+        """Browse an older diary day and the analytics of the last quarter"""
+        day = date.today() - timedelta(days=self.rng.randint(1, 365))
+        self.call("GET /api/diary/entries", "GET", "/api/diary/entries", params={"date_filter": day.isoformat()})
+        self.call("GET /api/diary/analytics", "GET", "/api/diary/analytics",
+                  params={"start_date": (date.today() - timedelta(days=90)).isoformat()})
+
+SCENARIOS = {
+    "login": VirtualUser.login,
+    "search": VirtualUser.search_typing,
+    "diary_write": VirtualUser.diary_write,
+    "dashboard": VirtualUser.dashboard_read,
+    "history": VirtualUser.history_read,
+}
+
+DEFAULT_MIX = "login=1,search=3,diary_write=3,dashboard=4,history=1"
+
+def parse_mix(spec: str) -> dict:
+    """Parse "search=3,dashboard=4" into scenario weights"""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def run_user(user: VirtualUser, mix: dict, deadline: float, think: float):
+    """Log in, then keep running weighted-random scenarios until the deadline"""
+    if not user.login():
+        return
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < deadline:
+        scenario = user.rng.choices(names, weights)[0]
+        SCENARIOS[scenario](user)
+        user.think(think)
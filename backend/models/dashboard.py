@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date
+from models.user import User
+from models.diary import DailyNutritionSummary, WeightEntry
+
+class Dashboard(BaseModel):
+    date: date
+    user: User
+    summary: Optional[DailyNutritionSummary] = None
+    weight_entries: Optional[List[WeightEntry]] = None
+    popular_foods: Optional[List[dict]] = None
+    errors: dict = {}  # section -> message, for sections that failed and are None
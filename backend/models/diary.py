@@ -9,6 +9,7 @@ class DiaryEntry(BaseModel):
     date: date
     meal_type: str  # breakfast, lunch, dinner, snack
     fdc_id: Optional[str] = None
+    recipe_id: Optional[str] = None
     food_name: str
     brand: Optional[str] = None
     serving_size: float
@@ -21,11 +22,11 @@ class DiaryEntryCreate(BaseModel):
     date: date
     meal_type: str
     fdc_id: Optional[str] = None
-    food_name: str
+    food_name: Optional[str] = None  # defaults to the USDA description when nutrition is omitted
     brand: Optional[str] = None
-    serving_size: float
-    serving_unit: str
-    nutrition: NutritionInfo
+    serving_size: float  # quantity, in serving_unit
+    serving_unit: str  # mass unit (g, oz, ...) or a portion of the food (cup, serving, ...)
+    nutrition: Optional[NutritionInfo] = None  # computed server-side from fdc_id when omitted
 
 class DiaryEntryUpdate(BaseModel):
     serving_size: Optional[float] = None
@@ -52,4 +53,37 @@ class WeightEntry(BaseModel):
 
 class WeightEntryCreate(BaseModel):
     date: date
-    weight: float
\ No newline at end of file
+    weight: float
+
+class MacroDistribution(BaseModel):
+    mean: float
+    p25: float
+    median: float
+    p75: float
+
+class WeekdayPattern(BaseModel):
+    weekday: str
+    avg_calories: float
+    days_logged: int
+
+class DailyTrendPoint(BaseModel):
+    date: date
+    calories: float
+    rolling_calories: float
+    logged: bool
+
+class NutritionAnalytics(BaseModel):
+    start_date: date
+    end_date: date
+    days_in_range: int
+    days_logged: int
+    target_calories: Optional[int] = None
+    tolerance: float
+    adherence_rate: Optional[float] = None  # share of logged days within tolerance of target
+    current_streak: int
+    longest_streak: int
+    daily_averages: dict  # nutrient -> average over logged days
+    macro_distribution: dict  # macro -> MacroDistribution (% of macro energy)
+    weekday_patterns: List[WeekdayPattern]
+    rolling_window: int
+    trend: List[DailyTrendPoint]
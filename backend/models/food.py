@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 class NutritionInfo(BaseModel):
@@ -11,20 +11,28 @@ class NutritionInfo(BaseModel):
     sugar: Optional[float] = 0
     sodium: Optional[float] = 0
     
+class FoodPortion(BaseModel):
+    unit: str  # e.g. "cup, chopped", "serving"
+    grams: float  # weight of one unit
+
 class FoodItem(BaseModel):
     fdc_id: str
     description: str
     brand_owner: Optional[str] = None
     serving_size: Optional[float] = 100  # grams
     serving_unit: Optional[str] = "g"
-    nutrition: NutritionInfo
+    nutrition: NutritionInfo  # per 100g
     food_category: Optional[str] = None
+    portions: List[FoodPortion] = []
+    source: Optional[str] = None  # in search results: "history", "custom" or "usda"
 
 class FoodSearchResult(BaseModel):
     foods: List[FoodItem]
     total_hits: int
     current_page: int
     total_pages: int
+    sources: Dict[str, str] = {}  # source -> "ok", "error" or "timeout"
+    partial: bool = False  # some source missed the deadline or failed
 
 class CustomFood(BaseModel):
     food_id: str
@@ -0,0 +1,37 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime, date
+from models.food import NutritionInfo
+
+class RecipeIngredient(BaseModel):
+    fdc_id: Optional[str] = None  # USDA food, quantity in unit
+    food_id: Optional[str] = None  # custom food, quantity in servings
+    quantity: float
+    unit: Optional[str] = "g"  # USDA foods only: mass unit or one of the food's portions
+    name: Optional[str] = None
+    nutrition: Optional[NutritionInfo] = None  # contribution to the whole recipe, filled in on save
+
+class Recipe(BaseModel):
+    recipe_id: str
+    user_id: str
+    name: str
+    servings: float
+    ingredients: List[RecipeIngredient]
+    nutrition: NutritionInfo  # per serving
+    created_at: datetime
+    updated_at: datetime
+
+class RecipeCreate(BaseModel):
+    name: str
+    servings: float = 1
+    ingredients: List[RecipeIngredient]
+
+class RecipeUpdate(BaseModel):
+    name: Optional[str] = None
+    servings: Optional[float] = None
+    ingredients: Optional[List[RecipeIngredient]] = None
+
+class RecipeLog(BaseModel):
+    date: date
+    meal_type: str
+    servings: float = 1
@@ -31,6 +31,7 @@ class UserUpdate(BaseModel):
 class UserInDB(UserBase):
     user_id: str
     hashed_password: str
+    token_version: int = 0  # bumped by logout-all to revoke earlier tokens
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from services.profiler import profiler, to_collapsed
+from settings import get_settings
+import hmac
+
+router = APIRouter()
+
+ADMIN_TOKEN = get_settings().admin_token
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need X-Admin-Token to match ADMIN_TOKEN; they do not exist without it"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def require_profiler():
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiler is disabled (set PROFILER_ENABLED=true)")
+    return profiler
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles(active_profiler = Depends(require_profiler)):
+    """List captured request profiles, newest last"""
+    return {
+        "slow_threshold_ms": active_profiler.slow_threshold * 1000,
+        "sample_rate": active_profiler.sample_rate,
+        "profiles": active_profiler.snapshot()
+    }
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: int, active_profiler = Depends(require_profiler)):
+    """Download one profile as collapsed stacks (flamegraph.pl / speedscope input)"""
+    profile = active_profiler.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have been evicted)")
+    
+    return PlainTextResponse(
+        to_collapsed(profile),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'}
+    )
@@ -1,22 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import timedelta
+from datetime import datetime, timedelta
 from models.user import UserCreate, User, Token, UserUpdate
 from services.auth_service import (
     authenticate_user, create_access_token, get_current_user,
-    get_password_hash, create_user, get_user, ACCESS_TOKEN_EXPIRE_MINUTES
+    get_password_hash, create_user, get_user, token_denylist, ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from pymongo import MongoClient
-import os
+from services.prefetch import prefetcher, PREFETCH_ENABLED, PREFETCH_FAVORITES
+from pymongo import ReturnDocument
+from services.database import get_db
+from services.request_limits import rate_limit_ip
 
 router = APIRouter()
 
-def get_db():
-    mongo_url = os.getenv("MONGO_URL")
-    client = MongoClient(mongo_url)
-    return client.calorie_tracker
-
-@router.post("/register", response_model=dict)
+@router.post("/register", response_model=dict, dependencies=[Depends(rate_limit_ip("auth"))])
 async def register(user: UserCreate):
     db = get_db()
     
@@ -48,7 +45,7 @@ async def register(user: UserCreate):
     
     return {"message": "User created successfully", "user_id": new_user.user_id}
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=[Depends(rate_limit_ip("auth"))])
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     db = get_db()
     
@@ -60,9 +57,15 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    if PREFETCH_ENABLED:
+        # Warm the foods this user logs most before they open the diary
+        prefetcher.warm_user_favorites(db, user.user_id, PREFETCH_FAVORITES)
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # user_id and token version let most routes authenticate without a user lookup
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "user_id": user.user_id, "ver": user.token_version},
+        expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
@@ -81,7 +84,6 @@ async def update_current_user(
     # Update user data
     update_data = user_update.dict(exclude_unset=True)
     if update_data:
-        from datetime import datetime
         update_data["updated_at"] = datetime.utcnow()
         
         db.users.update_one(
@@ -91,4 +93,22 @@ async def update_current_user(
     
     # Return updated user
     updated_user = get_user(db, current_user.username)
-    return updated_user
\ No newline at end of file
+    return updated_user
+
+@router.post("/logout-all", response_model=dict)
+async def logout_all_sessions(current_user: User = Depends(get_current_user)):
+    """Revoke every token issued to the current user, on all devices"""
+    db = get_db()
+    
+    revoked_at = datetime.utcnow()
+    user = db.users.find_one_and_update(
+        {"user_id": current_user.user_id},
+        {"$inc": {"token_version": 1}, "$set": {"tokens_revoked_at": revoked_at}},
+        projection={"token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    token_denylist.revoke(current_user.user_id, user["token_version"], revoked_at)
+    return {"message": "Logged out of all sessions"}
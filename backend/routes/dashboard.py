@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+from datetime import date
+from models.dashboard import Dashboard
+from models.user import User
+from services.auth_service import get_current_user_id
+from services.database import get_db
+from services.diary_store import diary_store
+from routes.diary import build_daily_summary
+from routes.food import load_popular_foods
+import asyncio
+import time
+
+router = APIRouter()
+
+async def timed(timings: dict, name: str, function, *args):
+    """Run a blocking query in the threadpool, recording its duration in ms"""
+    start = time.perf_counter()
+    try:
+        return await run_in_threadpool(function, *args)
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+def load_user(db, user_id: str) -> Optional[User]:
+    user = db.users.find_one({"user_id": user_id}, {"hashed_password": 0})
+    return User(**user) if user else None
+
+def load_summary(db, user_id: str, day: date):
+    return build_daily_summary(day, diary_store.find_entries(db, user_id, day))
+
+@router.get("", response_model=Dashboard)
+async def get_dashboard(
+    response: Response,
+    day: Optional[date] = Query(None, alias="date", description="Day to summarize (default: today)"),
+    weight_limit: int = Query(7, ge=1, le=100, description="Number of weight entries to return"),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Profile, daily summary, recent weights and popular foods in one call
+
+    The token is checked once and the four queries run concurrently, so the
+    response takes as long as the slowest of them. Per-section durations are
+    returned in the Server-Timing header.
+    """
+    db = get_db()
+    day = day or date.today()
+    timings = {}
+    start = time.perf_counter()
+
+    user, *sections = await asyncio.gather(
+        timed(timings, "user", load_user, db, user_id),
+        timed(timings, "summary", load_summary, db, user_id, day),
+        timed(timings, "weight", diary_store.recent_weights, db, user_id, weight_limit),
+        timed(timings, "popular", load_popular_foods, db, user_id),
+        return_exceptions=True
+    )
+    timings["total"] = (time.perf_counter() - start) * 1000
+    response.headers["Server-Timing"] = ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+    if isinstance(user, Exception):
+        raise HTTPException(status_code=500, detail=f"Error getting dashboard: {str(user)}")
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # A failed section is left empty so the rest of the dashboard still renders
+    values = {}
+    errors = {}
+    for name, result in zip(("summary", "weight_entries", "popular_foods"), sections):
+        if isinstance(result, Exception):
+            errors[name] = str(result)
+            values[name] = None
+        else:
+            values[name] = result
+
+    return Dashboard(date=day, user=user, errors=errors, **values)
@@ -1,52 +1,136 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from jose import JWTError
 from typing import Optional, List
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from models.diary import (
     DiaryEntry, DiaryEntryCreate, DiaryEntryUpdate, 
-    DailyNutritionSummary, WeightEntry, WeightEntryCreate
+    DailyNutritionSummary, WeightEntry, WeightEntryCreate, NutritionAnalytics
 )
 from models.user import User
-from services.auth_service import get_current_user
-from pymongo import MongoClient
-import os
+from services.auth_service import decode_access_token, get_current_user, get_current_user_id
+from services.analytics import load_daily_totals, summarize
+from services.nutrient_cache import nutrient_cache, compute_nutrition, UnitConversionError
+from services.nutrition import scale_nutrition
+from services.usda_api import USDAServiceError
+from routes.food import usda_http_error
+from services.database import get_db
+from services.diary_events import HEARTBEAT_SECONDS, diary_events, publish_diary_change
+from services.diary_store import diary_store
+from services.fieldsets import Fieldset, sparse_fields
+import asyncio
+import time
 import uuid
 
 router = APIRouter()
 
-def get_db():
-    mongo_url = os.getenv("MONGO_URL")
-    client = MongoClient(mongo_url)
-    return client.calorie_tracker
+# Longest range accepted by /analytics (about ten years of daily totals)
+MAX_ANALYTICS_DAYS = 3660
+
+def get_food_profile(db, fdc_id: Optional[str]) -> dict:
+    """Cached nutrient profile of a USDA food, or an HTTP error"""
+    if not fdc_id:
+        raise HTTPException(status_code=400, detail="nutrition or fdc_id is required")
+    
+    try:
+        profile = nutrient_cache.get_profile(db, fdc_id)
+    except USDAServiceError as e:
+        raise usda_http_error(e)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Food item not found")
+    return profile
+
+def scale_food_profile(profile: dict, quantity: float, unit: str) -> dict:
+    """Nutrition for a quantity of a cached food, or an HTTP error for unknown units"""
+    try:
+        return compute_nutrition(profile, quantity, unit)
+    except UnitConversionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def build_daily_summary(day: date, entries: List[dict]) -> DailyNutritionSummary:
+    """Add up a day's diary entries and group them by meal"""
+    # Calculate totals
+    totals = {
+        "calories": 0,
+        "protein": 0,
+        "carbs": 0,
+        "fat": 0,
+        "fiber": 0,
+        "sugar": 0,
+        "sodium": 0
+    }
+    
+    meals = {
+        "breakfast": [],
+        "lunch": [],
+        "dinner": [],
+        "snack": []
+    }
+    
+    for entry in entries:
+        # Add to totals
+        nutrition = entry["nutrition"]
+        for key in totals:
+            totals[key] += nutrition.get(key, 0)
+        
+        # Group by meal type
+        meal_type = entry["meal_type"]
+        if meal_type in meals:
+            meals[meal_type].append(DiaryEntry(**entry))
+    
+    return DailyNutritionSummary(
+        date=day,
+        total_calories=totals["calories"],
+        total_protein=totals["protein"],
+        total_carbs=totals["carbs"],
+        total_fat=totals["fat"],
+        total_fiber=totals["fiber"],
+        total_sugar=totals["sugar"],
+        total_sodium=totals["sodium"],
+        meals=meals
+    )
 
 @router.post("/entries", response_model=DiaryEntry)
 async def create_diary_entry(
     entry_data: DiaryEntryCreate,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """Create a new diary entry"""
     db = get_db()
     
+    food_name = entry_data.food_name
+    brand = entry_data.brand
+    if entry_data.nutrition is not None:
+        nutrition = entry_data.nutrition.dict()
+    else:
+        # Scale the cached per-100g vector of the USDA food server-side
+        profile = get_food_profile(db, entry_data.fdc_id)
+        nutrition = scale_food_profile(profile, entry_data.serving_size, entry_data.serving_unit)
+        food_name = food_name or profile["description"]
+        brand = brand or profile["brand_owner"]
+    
+    if not food_name:
+        raise HTTPException(status_code=400, detail="food_name is required")
+    
     try:
         diary_entry = {
             "entry_id": str(uuid.uuid4()),
-            "user_id": current_user.user_id,
+            "user_id": user_id,
             "date": entry_data.date.isoformat(),  # Convert date to string
             "meal_type": entry_data.meal_type,
             "fdc_id": entry_data.fdc_id,
-            "food_name": entry_data.food_name,
-            "brand": entry_data.brand,
+            "food_name": food_name,
+            "brand": brand,
             "serving_size": entry_data.serving_size,
             "serving_unit": entry_data.serving_unit,
-            "nutrition": entry_data.nutrition.dict(),
+            "nutrition": nutrition,
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
         
-        result = db.diary_entries.insert_one(diary_entry)
-        if result.inserted_id:
-            return DiaryEntry(**diary_entry)
-        else:
-            raise HTTPException(status_code=500, detail="Could not create diary entry")
+        await diary_store.insert_entry(db, diary_entry)
+        await publish_diary_change(db, user_id, "entry_created", diary_entry)
+        return DiaryEntry(**diary_entry)
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating diary entry: {str(e)}")
@@ -55,21 +139,16 @@ async def create_diary_entry(
 async def get_diary_entries(
     date_filter: Optional[date] = Query(None, description="Filter by specific date"),
     meal_type: Optional[str] = Query(None, description="Filter by meal type"),
-    current_user: User = Depends(get_current_user)
+    fieldset: Fieldset = Depends(sparse_fields(DiaryEntry)),
+    user_id: str = Depends(get_current_user_id)
 ):
     """Get diary entries for the current user"""
     db = get_db()
     
     try:
-        query = {"user_id": current_user.user_id}
-        
-        if date_filter:
-            query["date"] = date_filter.isoformat()  # Convert date to string for query
-        
-        if meal_type:
-            query["meal_type"] = meal_type
-        
-        entries = list(db.diary_entries.find(query).sort("created_at", -1))
+        entries = diary_store.find_entries(db, user_id, date_filter, meal_type, fieldset.projection())
+        if fieldset.selected:
+            return fieldset.response([fieldset.apply(entry) for entry in entries])
         return [DiaryEntry(**entry) for entry in entries]
         
     except Exception as e:
@@ -78,88 +157,96 @@ async def get_diary_entries(
 @router.get("/summary/{date}", response_model=DailyNutritionSummary)
 async def get_daily_summary(
     date: date,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """Get daily nutrition summary for a specific date"""
     db = get_db()
     
     try:
-        entries = list(db.diary_entries.find({
-            "user_id": current_user.user_id,
-            "date": date.isoformat()  # Convert date to string for query
-        }))
-        
-        # Calculate totals
-        totals = {
-            "calories": 0,
-            "protein": 0,
-            "carbs": 0,
-            "fat": 0,
-            "fiber": 0,
-            "sugar": 0,
-            "sodium": 0
-        }
-        
-        meals = {
-            "breakfast": [],
-            "lunch": [],
-            "dinner": [],
-            "snack": []
-        }
-        
-        for entry in entries:
-            # Add to totals
-            nutrition = entry["nutrition"]
-            for key in totals:
-                totals[key] += nutrition.get(key, 0)
-            
-            # Group by meal type
-            meal_type = entry["meal_type"]
-            if meal_type in meals:
-                meals[meal_type].append(DiaryEntry(**entry))
-        
-        return DailyNutritionSummary(
-            date=date,
-            total_calories=totals["calories"],
-            total_protein=totals["protein"],
-            total_carbs=totals["carbs"],
-            total_fat=totals["fat"],
-            total_fiber=totals["fiber"],
-            total_sugar=totals["sugar"],
-            total_sodium=totals["sodium"],
-            meals=meals
-        )
+        entries = diary_store.find_entries(db, user_id, date)
+        return build_daily_summary(date, entries)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting daily summary: {str(e)}")
 
+@router.get("/analytics", response_model=NutritionAnalytics)
+async def get_nutrition_analytics(
+    start_date: Optional[date] = Query(None, description="First day of the range (default: 90 days before end_date)"),
+    end_date: Optional[date] = Query(None, description="Last day of the range (default: today)"),
+    window: int = Query(7, ge=1, le=90, description="Rolling average window in days"),
+    tolerance: float = Query(0.1, gt=0, le=1, description="Allowed deviation from target calories"),
+    current_user: User = Depends(get_current_user)
+):
+    """Get adherence, macro split, streaks and trends over a date range"""
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=89)
+    
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    if (end_date - start_date).days >= MAX_ANALYTICS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_ANALYTICS_DAYS} days")
+    
+    db = get_db()
+    
+    try:
+        frame = load_daily_totals(db, current_user.user_id, start_date, end_date)
+        return summarize(frame, current_user.target_calories, tolerance, window)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting nutrition analytics: {str(e)}")
+
+def scale_recipe_entry(db, user_id: str, entry: dict, update_data: dict) -> dict:
+    """Nutrition of a logged recipe at its new number of servings"""
+    if update_data.get("serving_unit", "serving") != "serving":
+        raise HTTPException(status_code=400, detail="Recipe entries are logged in servings")
+    servings = update_data.get("serving_size") or entry["serving_size"]
+    if servings <= 0:
+        raise HTTPException(status_code=400, detail="Servings must be positive")
+    recipe = db.recipes.find_one({"recipe_id": entry["recipe_id"], "user_id": user_id}, {"nutrition": 1})
+    if recipe is not None:
+        return scale_nutrition(recipe["nutrition"], servings)
+    # The recipe was deleted since; scale what was logged
+    return scale_nutrition(entry["nutrition"], servings / entry["serving_size"])
+
 @router.put("/entries/{entry_id}", response_model=DiaryEntry)
 async def update_diary_entry(
     entry_id: str,
     entry_update: DiaryEntryUpdate,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """Update a diary entry"""
     db = get_db()
     
+    update_data = entry_update.dict(exclude_unset=True)
+    resized = "serving_size" in update_data or "serving_unit" in update_data
+    if resized and update_data.get("nutrition") is None:
+        entry = diary_store.get_entry(db, user_id, entry_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Diary entry not found")
+        if entry.get("fdc_id"):
+            # Recompute from the cached per-100g vector instead of trusting stale totals
+            profile = get_food_profile(db, entry["fdc_id"])
+            update_data["nutrition"] = scale_food_profile(
+                profile,
+                update_data.get("serving_size") or entry["serving_size"],
+                update_data.get("serving_unit") or entry["serving_unit"]
+            )
+        elif entry.get("recipe_id"):
+            update_data["nutrition"] = scale_recipe_entry(db, user_id, entry, update_data)
+    if update_data.get("nutrition") is None:
+        update_data.pop("nutrition", None)
+    
     try:
-        update_data = entry_update.dict(exclude_unset=True)
         if update_data:
             update_data["updated_at"] = datetime.utcnow()
             
-            result = db.diary_entries.update_one(
-                {"entry_id": entry_id, "user_id": current_user.user_id},
-                {"$set": update_data}
-            )
-            
-            if result.matched_count == 0:
+            if not diary_store.update_entry(db, user_id, entry_id, update_data):
                 raise HTTPException(status_code=404, detail="Diary entry not found")
         
         # Return updated entry
-        updated_entry = db.diary_entries.find_one({
-            "entry_id": entry_id,
-            "user_id": current_user.user_id
-        })
+        updated_entry = diary_store.get_entry(db, user_id, entry_id)
+        if update_data:
+            await publish_diary_change(db, user_id, "entry_updated", updated_entry)
         
         return DiaryEntry(**updated_entry)
         
@@ -169,19 +256,18 @@ async def update_diary_entry(
 @router.delete("/entries/{entry_id}")
 async def delete_diary_entry(
     entry_id: str,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """Delete a diary entry"""
     db = get_db()
     
     try:
-        result = db.diary_entries.delete_one({
-            "entry_id": entry_id,
-            "user_id": current_user.user_id
-        })
-        
-        if result.deleted_count == 0:
+        # Only streams need to know which day changed
+        entry = diary_store.get_entry(db, user_id, entry_id) if diary_events.has_subscribers(user_id) else None
+        if not diary_store.delete_entry(db, user_id, entry_id):
             raise HTTPException(status_code=404, detail="Diary entry not found")
+        if entry is not None:
+            await publish_diary_change(db, user_id, "entry_deleted", {"entry_id": entry_id, "date": entry["date"]})
         
         return {"message": "Diary entry deleted successfully"}
         
@@ -191,7 +277,7 @@ async def delete_diary_entry(
 @router.post("/weight", response_model=WeightEntry)
 async def log_weight(
     weight_data: WeightEntryCreate,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """Log a weight entry"""
     db = get_db()
@@ -199,17 +285,14 @@ async def log_weight(
     try:
         weight_entry = {
             "entry_id": str(uuid.uuid4()),
-            "user_id": current_user.user_id,
+            "user_id": user_id,
             "date": weight_data.date.isoformat(),  # Convert date to string
             "weight": weight_data.weight,
             "created_at": datetime.utcnow()
         }
         
-        result = db.weight_entries.insert_one(weight_entry)
-        if result.inserted_id:
-            return WeightEntry(**weight_entry)
-        else:
-            raise HTTPException(status_code=500, detail="Could not log weight")
+        diary_store.insert_weight(db, weight_entry)
+        return WeightEntry(**weight_entry)
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error logging weight: {str(e)}")
@@ -217,17 +300,79 @@ async def log_weight(
 @router.get("/weight", response_model=List[WeightEntry])
 async def get_weight_entries(
     limit: int = Query(30, ge=1, le=100, description="Number of entries to return"),
-    current_user: User = Depends(get_current_user)
+    fieldset: Fieldset = Depends(sparse_fields(WeightEntry)),
+    user_id: str = Depends(get_current_user_id)
 ):
     """Get weight entries for the current user"""
     db = get_db()
     
     try:
-        entries = list(db.weight_entries.find({
-            "user_id": current_user.user_id
-        }).sort("date", -1).limit(limit))
+        entries = diary_store.recent_weights(db, user_id, limit)
+        if fieldset.selected:
+            return fieldset.response([fieldset.apply(entry) for entry in entries])
         
         return [WeightEntry(**entry) for entry in entries]
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting weight entries: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error getting weight entries: {str(e)}")
+
+def stream_token(request: Request, token: Optional[str]) -> str:
+    """Bearer token from the header, or from ?token= since EventSource cannot set headers"""
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    if token:
+        return token
+    raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+@router.get("/stream")
+async def stream_diary_events(
+    request: Request,
+    token: Optional[str] = Query(None, description="Access token, for clients that cannot send headers")
+):
+    """Server-sent events for the current user's diary, replacing summary polling
+
+    Events: entry_created / entry_updated (the entry), entry_deleted
+    (entry_id and date) and daily_total (the changed day's totals), plus
+    `resync` when the client fell behind and should refetch. The stream ends
+    when the token expires or is revoked; clients reconnect with a fresh one.
+    """
+    token = stream_token(request, token)
+    user_id = await get_current_user_id(token)
+    try:
+        expires_at = float(decode_access_token(token)["exp"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        expires_at = float("inf")
+
+    async def events():
+        # Subscribed here, not before: the finally below only runs once the body is iterated
+        subscription = diary_events.subscribe(user_id)
+        try:
+            yield "retry: 3000\nevent: ready\ndata: {}\n\n"
+            while True:
+                timeout = min(HEARTBEAT_SECONDS, expires_at - time.time())
+                if timeout <= 0:
+                    yield "event: expired\ndata: {}\n\n"
+                    break
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    try:
+                        await get_current_user_id(token)
+                    except HTTPException:
+                        yield "event: expired\ndata: {}\n\n"
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                if message is None:
+                    # Closed for a newer stream of the same user
+                    break
+                yield message
+        finally:
+            diary_events.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Stop nginx from buffering the stream
+        "X-Accel-Buffering": "no",
+    })
@@ -1,53 +1,106 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 from models.food import FoodSearchResult, FoodItem, CustomFood
-from models.user import User
-from services.auth_service import get_current_user
-from services.usda_api import usda_service
-from pymongo import MongoClient
-import os
+from services.auth_service import get_current_user_id
+from services.usda_api import usda_service, USDAServiceError, USDAQuotaExceeded, USDA_REQUEST_BUDGET
+from services.recipe_service import recompute_recipes_for_custom_food
+from services.prefetch import prefetcher, PREFETCH_ENABLED, PREFETCH_TOP_N
+from services.database import get_db
+from services.diary_store import diary_store
+from services.fieldsets import Fieldset, sparse_fields
+from services.barcode_index import barcode_lookup, InvalidBarcode
+from services.request_limits import rate_limit_user
+from services import food_search
+from services.deadline import request_budget
+import math
 import uuid
 from datetime import datetime
 
 router = APIRouter()
 
-def get_db():
-    mongo_url = os.getenv("MONGO_URL")
-    client = MongoClient(mongo_url)
-    return client.calorie_tracker
+def usda_http_error(error: USDAServiceError) -> HTTPException:
+    """Map a USDA failure to the HTTP error returned to clients"""
+    if isinstance(error, USDAQuotaExceeded):
+        return HTTPException(
+            status_code=429,
+            detail="Food database lookup limit reached, please try again shortly",
+            headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+        )
+    return HTTPException(status_code=503, detail="Food database is temporarily unavailable")
 
-@router.get("/search", response_model=FoodSearchResult)
+@router.get("/search", response_model=FoodSearchResult, dependencies=[Depends(request_budget(USDA_REQUEST_BUDGET))])
 async def search_foods(
     query: str = Query(..., description="Search query for foods"),
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
-    current_user: User = Depends(get_current_user)
+    fieldset: Fieldset = Depends(sparse_fields(FoodItem)),
+    user_id: str = Depends(rate_limit_user("food_lookup"))
 ):
-    """Search for foods using USDA FoodData Central API"""
+    """Search the user's diary history, their custom foods and USDA FoodData Central
+
+    Sources that miss the search deadline are left out (`partial`, with
+    `sources` saying which); results carry the `source` they came from.
+    `fields` applies to each food, e.g. fields=fdc_id,description,nutrition.calories
+    """
     try:
-        result = usda_service.search_foods(query, page, page_size)
+        result = await food_search.search_foods(get_db(), user_id, query, page, page_size)
+        if PREFETCH_ENABLED:
+            # Users usually open one of the top hits next
+            usda_foods = [food for food in result.foods if food.source == food_search.USDA]
+            prefetcher.prefetch_details(food.fdc_id for food in usda_foods[:PREFETCH_TOP_N])
+        if fieldset.selected:
+            return fieldset.response({
+                **result.model_dump(exclude={"foods"}),
+                "foods": [fieldset.apply(food) for food in result.foods]
+            })
         return result
+    except USDAServiceError as e:
+        raise usda_http_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching foods: {str(e)}")
 
-@router.get("/details/{fdc_id}", response_model=FoodItem)
+@router.get("/details/{fdc_id}", response_model=FoodItem, dependencies=[Depends(request_budget(USDA_REQUEST_BUDGET))])
 async def get_food_details(
     fdc_id: str,
-    current_user: User = Depends(get_current_user)
+    fieldset: Fieldset = Depends(sparse_fields(FoodItem)),
+    user_id: str = Depends(rate_limit_user("food_lookup"))
 ):
     """Get detailed information about a specific food item"""
     try:
-        food_item = usda_service.get_food_details(fdc_id)
-        if not food_item:
-            raise HTTPException(status_code=404, detail="Food item not found")
-        return food_item
+        food_item = await run_in_threadpool(usda_service.get_food_details, fdc_id)
+    except USDAServiceError as e:
+        raise usda_http_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting food details: {str(e)}")
+    
+    if not food_item:
+        raise HTTPException(status_code=404, detail="Food item not found")
+    if fieldset.selected:
+        return fieldset.response(fieldset.apply(food_item))
+    return food_item
+
+@router.get("/barcode/{gtin}", response_model=FoodItem, dependencies=[Depends(request_budget(USDA_REQUEST_BUDGET))])
+async def get_food_by_barcode(
+    gtin: str,
+    fieldset: Fieldset = Depends(sparse_fields(FoodItem)),
+    user_id: str = Depends(rate_limit_user("food_lookup"))
+):
+    """Branded food for a scanned UPC/EAN barcode, resolved from the local barcode index"""
+    try:
+        fdc_id = barcode_lookup.lookup(gtin)
+    except InvalidBarcode as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if fdc_id is None:
+        if not barcode_lookup.available:
+            raise HTTPException(status_code=503, detail="Barcode index not built")
+        raise HTTPException(status_code=404, detail="No food found for this barcode")
+    return await get_food_details(fdc_id, fieldset, user_id)
 
 @router.post("/custom", response_model=CustomFood)
 async def create_custom_food(
     food_data: dict,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """Create a custom food item"""
     db = get_db()
@@ -55,7 +108,7 @@ async def create_custom_food(
     try:
         custom_food = {
             "food_id": str(uuid.uuid4()),
-            "user_id": current_user.user_id,
+            "user_id": user_id,
             "name": food_data["name"],
             "brand": food_data.get("brand"),
             "serving_size": food_data["serving_size"],
@@ -76,21 +129,64 @@ async def create_custom_food(
 
 @router.get("/custom", response_model=list[CustomFood])
 async def get_user_custom_foods(
-    current_user: User = Depends(get_current_user)
+    fieldset: Fieldset = Depends(sparse_fields(CustomFood)),
+    user_id: str = Depends(get_current_user_id)
 ):
     """Get all custom foods created by the current user"""
     db = get_db()
     
     try:
-        custom_foods = list(db.custom_foods.find({"user_id": current_user.user_id}))
+        custom_foods = list(db.custom_foods.find({"user_id": user_id}, fieldset.projection()))
+        if fieldset.selected:
+            return fieldset.response(custom_foods)
         return [CustomFood(**food) for food in custom_foods]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting custom foods: {str(e)}")
 
+@router.put("/custom/{food_id}", response_model=CustomFood)
+async def update_custom_food(
+    food_id: str,
+    food_data: dict,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Update a custom food item and refresh recipes that use it"""
+    db = get_db()
+    
+    try:
+        editable = ("name", "brand", "serving_size", "serving_unit", "nutrition")
+        update_data = {key: value for key, value in food_data.items() if key in editable}
+        if update_data:
+            update_data["updated_at"] = datetime.utcnow()
+            
+            result = db.custom_foods.update_one(
+                {"food_id": food_id, "user_id": user_id},
+                {"$set": update_data}
+            )
+            
+            if result.matched_count == 0:
+                raise HTTPException(status_code=404, detail="Custom food not found")
+        
+        updated_food = db.custom_foods.find_one({
+            "food_id": food_id,
+            "user_id": user_id
+        })
+        if not updated_food:
+            raise HTTPException(status_code=404, detail="Custom food not found")
+        
+        if "nutrition" in update_data or "name" in update_data:
+            recompute_recipes_for_custom_food(db, updated_food)
+        
+        return CustomFood(**updated_food)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating custom food: {str(e)}")
+
 @router.delete("/custom/{food_id}")
 async def delete_custom_food(
     food_id: str,
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """Delete a custom food item"""
     db = get_db()
@@ -98,7 +194,7 @@ async def delete_custom_food(
     try:
         result = db.custom_foods.delete_one({
             "food_id": food_id,
-            "user_id": current_user.user_id
+            "user_id": user_id
         })
         
         if result.deleted_count == 0:
@@ -109,31 +205,33 @@ async def delete_custom_food(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting custom food: {str(e)}")
 
+def load_popular_foods(db, user_id: str, limit: int = 10) -> list:
+    """The foods a user logs most often"""
+    diary_entries, pipeline = diary_store.entry_pipeline(db, user_id)
+    pipeline += [
+        {"$group": {
+            "_id": "$food_name",
+            "count": {"$sum": 1},
+            "last_used": {"$max": "$created_at"},
+            "fdc_id": {"$first": "$fdc_id"},
+            "brand": {"$first": "$brand"},
+            "nutrition": {"$first": "$nutrition"}
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": limit}
+    ]
+    return list(diary_entries.aggregate(pipeline))
+
 @router.get("/popular", response_model=list[dict])
 async def get_popular_foods(
-    current_user: User = Depends(get_current_user)
+    user_id: str = Depends(get_current_user_id)
 ):
     """Get popular/frequently used foods"""
     db = get_db()
     
     try:
         # Get most frequently logged foods by this user
-        pipeline = [
-            {"$match": {"user_id": current_user.user_id}},
-            {"$group": {
-                "_id": "$food_name",
-                "count": {"$sum": 1},
-                "last_used": {"$max": "$created_at"},
-                "fdc_id": {"$first": "$fdc_id"},
-                "brand": {"$first": "$brand"},
-                "nutrition": {"$first": "$nutrition"}
-            }},
-            {"$sort": {"count": -1}},
-            {"$limit": 10}
-        ]
-        
-        popular_foods = list(db.diary_entries.aggregate(pipeline))
-        return popular_foods
+        return load_popular_foods(db, user_id)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting popular foods: {str(e)}")
\ No newline at end of file
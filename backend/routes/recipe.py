@@ -0,0 +1,185 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+from datetime import datetime
+from models.recipe import Recipe, RecipeCreate, RecipeUpdate, RecipeLog
+from models.diary import DiaryEntry
+from services.auth_service import get_current_user_id
+from services.nutrition import scale_nutrition
+from services.recipe_service import IngredientError, build_recipe_fields, rollup
+from services.usda_api import USDAServiceError
+from routes.food import usda_http_error
+from services.database import get_db
+from services.diary_events import publish_diary_change
+from services.diary_store import diary_store
+import uuid
+
+router = APIRouter()
+
+@router.post("", response_model=Recipe)
+async def create_recipe(
+    recipe_data: RecipeCreate,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Create a recipe and precompute its per-serving nutrition"""
+    db = get_db()
+
+    try:
+        recipe = {
+            "recipe_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "name": recipe_data.name,
+            **build_recipe_fields(db, user_id, recipe_data.ingredients, recipe_data.servings),
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+
+        result = db.recipes.insert_one(recipe)
+        if result.inserted_id:
+            return Recipe(**recipe)
+        else:
+            raise HTTPException(status_code=500, detail="Could not create recipe")
+
+    except IngredientError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except USDAServiceError as e:
+        raise usda_http_error(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating recipe: {str(e)}")
+
+@router.get("", response_model=List[Recipe])
+async def get_recipes(
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get all recipes created by the current user"""
+    db = get_db()
+
+    try:
+        recipes = list(db.recipes.find({"user_id": user_id}).sort("name", 1))
+        return [Recipe(**recipe) for recipe in recipes]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting recipes: {str(e)}")
+
+@router.get("/{recipe_id}", response_model=Recipe)
+async def get_recipe(
+    recipe_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get a single recipe"""
+    db = get_db()
+
+    recipe = db.recipes.find_one({"recipe_id": recipe_id, "user_id": user_id})
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return Recipe(**recipe)
+
+@router.put("/{recipe_id}", response_model=Recipe)
+async def update_recipe(
+    recipe_id: str,
+    recipe_update: RecipeUpdate,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Update a recipe, recomputing its nutrition when ingredients or servings change"""
+    db = get_db()
+
+    recipe = db.recipes.find_one({"recipe_id": recipe_id, "user_id": user_id})
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+
+    try:
+        update_data = {}
+        if recipe_update.name is not None:
+            update_data["name"] = recipe_update.name
+
+        servings = recipe_update.servings if recipe_update.servings is not None else recipe["servings"]
+        if recipe_update.ingredients is not None:
+            update_data.update(build_recipe_fields(db, user_id, recipe_update.ingredients, servings))
+        elif recipe_update.servings is not None:
+            if servings <= 0:
+                raise IngredientError("Servings must be positive")
+            # Stored ingredient contributions are reused, no lookups needed
+            update_data["servings"] = servings
+            update_data["nutrition"] = rollup(recipe["ingredients"], servings)
+
+        if update_data:
+            update_data["updated_at"] = datetime.utcnow()
+            db.recipes.update_one({"recipe_id": recipe_id}, {"$set": update_data})
+            recipe.update(update_data)
+
+        return Recipe(**recipe)
+
+    except IngredientError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except USDAServiceError as e:
+        raise usda_http_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating recipe: {str(e)}")
+
+@router.delete("/{recipe_id}")
+async def delete_recipe(
+    recipe_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Delete a recipe"""
+    db = get_db()
+
+    try:
+        result = db.recipes.delete_one({
+            "recipe_id": recipe_id,
+            "user_id": user_id
+        })
+
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+
+        return {"message": "Recipe deleted successfully"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting recipe: {str(e)}")
+
+@router.post("/{recipe_id}/log", response_model=DiaryEntry)
+async def log_recipe(
+    recipe_id: str,
+    log_data: RecipeLog,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Log servings of a recipe as a single diary entry"""
+    db = get_db()
+
+    recipe = db.recipes.find_one(
+        {"recipe_id": recipe_id, "user_id": user_id},
+        {"name": 1, "nutrition": 1}
+    )
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    if log_data.servings <= 0:
+        raise HTTPException(status_code=400, detail="Servings must be positive")
+
+    try:
+        diary_entry = {
+            "entry_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "date": log_data.date.isoformat(),
+            "meal_type": log_data.meal_type,
+            "fdc_id": None,
+            "recipe_id": recipe_id,
+            "food_name": recipe["name"],
+            "brand": None,
+            "serving_size": log_data.servings,
+            "serving_unit": "serving",
+            "nutrition": scale_nutrition(recipe["nutrition"], log_data.servings),
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+
+        await diary_store.insert_entry(db, diary_entry)
+        await publish_diary_change(db, user_id, "entry_created", diary_entry)
+        return DiaryEntry(**diary_entry)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error logging recipe: {str(e)}")
@@ -1,46 +1,179 @@
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
-from routes import auth, food, diary
-from services.auth_service import get_current_user
+from settings import Settings, get_settings
+from services.metrics import register_mongo_listener
 
-load_dotenv()
+# Must be registered before any MongoClient is created
+register_mongo_listener()
 
-app = FastAPI(title="Calorie Tracker API", version="1.0.0")
+def create_app(settings: Settings = None) -> FastAPI:
+    """Build the API; called once per worker process
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    Nothing here touches the network: the Mongo client is created in the
+    lifespan, so importing and building the app stays fast and works
+    while Mongo is still starting.
+    """
+    settings = settings or get_settings()
 
-# MongoDB connection
-mongo_url = os.getenv("MONGO_URL")
-client = MongoClient(mongo_url)
-db = client.calorie_tracker
+    # Imported here so `import server` stays cheap for tools that only need create_app
+    from routes import auth, food, diary, recipe, dashboard, admin
+    from services.auth_service import get_current_user, token_denylist
+    from services.database import database
+    from services.usda_api import usda_service
+    from services.prefetch import prefetcher
+    from services.write_batcher import diary_writer
+    from services.diary_events import diary_events
+    from services.barcode_index import barcode_lookup
+    from services.request_limits import request_limiter
+    from services.diary_store import DIARY_ARCHIVE_INTERVAL_HOURS, compact_periodically
+    from services.metrics import MetricsMiddleware, mongo_pool_listener, render_metrics
+    from services.profiler import ProfilerMiddleware, profiler
+    from services.compression import CompressionMiddleware
+    import asyncio
+    import pymongo
+    from pymongo.errors import PyMongoError
 
-# Make db available to routes
-app.state.db = db
+    def load_token_denylist() -> bool:
+        # Tokens revoked before a restart must stay revoked until they expire
+        try:
+            # Bounded, so a Mongo outage cannot hold up startup
+            with pymongo.timeout(settings.ready_timeout_ms / 1000):
+                token_denylist.load(database.get_db())
+        except PyMongoError as e:
+            print(f"Error loading token denylist: {e}")
+            return False
+        app.state.token_denylist_loaded = True
+        return True
 
-# Include routers
-app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
-app.include_router(food.router, prefix="/api/food", tags=["food"])
-app.include_router(diary.router, prefix="/api/diary", tags=["diary"])
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        database.connect()
+        # /api/ready retries if Mongo is not reachable yet
+        await run_in_threadpool(load_token_denylist)
+        # Opt-in; otherwise `python -m services.diary_store compact` runs from cron
+        compaction = None
+        if DIARY_ARCHIVE_INTERVAL_HOURS > 0:
+            compaction = asyncio.create_task(compact_periodically(database.get_db, DIARY_ARCHIVE_INTERVAL_HOURS * 3600))
+        yield
+        if compaction is not None:
+            compaction.cancel()
+        if diary_writer is not None:
+            await diary_writer.drain()
+        database.close()
 
-@app.get("/api/health")
-async def health_check():
-    return {"status": "healthy", "message": "Calorie Tracker API is running"}
+    app = FastAPI(title="Calorie Tracker API", version="1.0.0", lifespan=lifespan)
+    app.state.settings = settings
+    app.state.token_denylist_loaded = False
 
-@app.get("/api/protected")
-async def protected_route(current_user: dict = Depends(get_current_user)):
-    return {"message": f"Hello {current_user['username']}, this is a protected route!"}
+    # gzip/brotli for large JSON bodies, negotiated per request
+    if settings.compression_min_bytes > 0:
+        app.add_middleware(CompressionMiddleware, min_bytes=settings.compression_min_bytes)
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing"],
+    )
+    app.add_middleware(MetricsMiddleware)
+
+    # Opt-in stack sampling of slow requests (PROFILER_ENABLED=true)
+    if profiler is not None:
+        app.add_middleware(ProfilerMiddleware, profiler=profiler)
+
+    # Include routers
+    app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
+    app.include_router(food.router, prefix="/api/food", tags=["food"])
+    app.include_router(diary.router, prefix="/api/diary", tags=["diary"])
+    app.include_router(recipe.router, prefix="/api/recipes", tags=["recipes"])
+    app.include_router(dashboard.router, prefix="/api/dashboard", tags=["dashboard"])
+    app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
+
+    @app.get("/api/health")
+    async def health_check():
+        """Liveness: the process is up and serving; see /api/ready for dependencies"""
+        return {
+            "status": "healthy",
+            "message": "Calorie Tracker API is running",
+            "worker_pid": os.getpid(),
+            "usda": usda_service.snapshot(),
+            "prefetch": prefetcher.snapshot(),
+            "diary_writer": diary_writer.snapshot() if diary_writer is not None else None,
+            "diary_stream": diary_events.snapshot(),
+            "barcode": barcode_lookup.snapshot(),
+            "rate_limits": request_limiter.snapshot()
+        }
+
+    @app.get("/api/ready")
+    async def readiness_check():
+        """Readiness: 503 while Mongo is unreachable, slow or its pool is saturated
+
+        An open USDA breaker is reported but does not fail the probe: every
+        worker shares the same upstream, and cached and stored foods are
+        still served during an outage.
+        """
+        checks = {}
+
+        try:
+            ping_ms = await run_in_threadpool(database.ping, settings.ready_timeout_ms / 1000)
+            checks["mongo"] = {"ok": ping_ms <= settings.ready_max_ping_ms, "ping_ms": round(ping_ms, 2)}
+        except PyMongoError as e:
+            checks["mongo"] = {"ok": False, "error": str(e)}
+
+        max_pool_size = database.max_pool_size()
+        pools = mongo_pool_listener.snapshot()
+        checked_out = max((pool["checked_out"] for pool in pools.values()), default=0)
+        utilization = checked_out / max_pool_size if max_pool_size else 0.0
+        checks["mongo_pool"] = {
+            "ok": utilization < settings.ready_max_pool_utilization,
+            "max_pool_size": max_pool_size,
+            "utilization": round(utilization, 3),
+            "pools": pools,
+        }
+
+        if not app.state.token_denylist_loaded and checks["mongo"]["ok"]:
+            await run_in_threadpool(load_token_denylist)
+        checks["token_denylist"] = {"ok": app.state.token_denylist_loaded}
+
+        breaker = usda_service.breaker.snapshot()
+        checks["usda"] = {"ok": True, "degraded": breaker["state"] != "closed", "breaker": breaker}
+
+        ready = all(check["ok"] for check in checks.values())
+        return JSONResponse(
+            status_code=200 if ready else 503,
+            content={"status": "ready" if ready else "not_ready", "worker_pid": os.getpid(), "checks": checks}
+        )
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/api/protected")
+    async def protected_route(current_user: dict = Depends(get_current_user)):
+        return {"message": f"Hello {current_user['username']}, this is a protected route!"}
+
+    return app
+
+def __getattr__(name):
+    # `uvicorn server:app` still works; the app is only built when asked for
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+
+    # More than one worker needs caches the workers can share (see gunicorn.conf.py)
+    workers = get_settings().web_concurrency
+    if workers > 1:
+        os.environ.setdefault("CACHE_BACKEND", "sqlite")
+    uvicorn.run("server:create_app", factory=True, host="0.0.0.0", port=8001, workers=workers)
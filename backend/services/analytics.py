@@ -0,0 +1,161 @@
+import numpy as np
+from datetime import date, timedelta
+from typing import Optional
+from models.diary import NutritionAnalytics, MacroDistribution, WeekdayPattern, DailyTrendPoint
+from services.diary_store import daily_totals
+
+# Daily total columns pulled for every day in the range
+TOTAL_FIELDS = ("calories", "protein", "carbs", "fat", "fiber", "sugar", "sodium")
+
+# Energy per gram for the macro split
+MACRO_KCAL_PER_GRAM = {"protein": 4.0, "carbs": 4.0, "fat": 9.0}
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+class DailyTotals:
+    """Columnar daily totals for one contiguous date range"""
+
+    def __init__(self, start: date, days: int):
+        self.start = start
+        self.days = days
+        self.logged = np.zeros(days, dtype=bool)
+        self.columns = {field: np.zeros(days, dtype=np.float64) for field in TOTAL_FIELDS}
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=self.days - 1)
+
+def load_daily_totals(db, user_id: str, start: date, end: date) -> DailyTotals:
+    """Aggregate diary entries into one row per day and fill the columns"""
+    frame = DailyTotals(start, (end - start).days + 1)
+
+    for day, row in daily_totals(db, user_id, start, end, TOTAL_FIELDS):
+        index = (day - start).days
+        frame.logged[index] = True
+        for field in TOTAL_FIELDS:
+            frame.columns[field][index] = row.get(field) or 0
+
+    return frame
+
+def adherence_mask(calories, logged, target, tolerance: float):
+    """Days that were logged and landed within tolerance of the calorie target"""
+    target = np.asarray(target, dtype=np.float64)
+    return logged & (np.abs(calories - target) <= tolerance * target)
+
+def run_lengths(mask):
+    """Current (ending on the last day) and longest run of True along the last axis"""
+    counts = np.cumsum(mask, axis=-1)
+    resets = np.maximum.accumulate(np.where(mask, 0, counts), axis=-1)
+    runs = counts - resets
+    return runs[..., -1], runs.max(axis=-1)
+
+def macro_percentages(protein, carbs, fat):
+    """Share of macro energy coming from protein, carbs and fat, per day"""
+    energy = {
+        "protein": protein * MACRO_KCAL_PER_GRAM["protein"],
+        "carbs": carbs * MACRO_KCAL_PER_GRAM["carbs"],
+        "fat": fat * MACRO_KCAL_PER_GRAM["fat"],
+    }
+    total = energy["protein"] + energy["carbs"] + energy["fat"]
+    safe_total = np.where(total > 0, total, 1.0)
+    return {macro: 100.0 * value / safe_total for macro, value in energy.items()}, total > 0
+
+def rolling_mean(values, logged, window: int):
+    """Trailing mean over the logged days inside each window"""
+    weights = logged.astype(np.float64)
+    padding = [(0, 0)] * (values.ndim - 1) + [(1, 0)]
+    sums = np.pad(np.cumsum(values * weights, axis=-1), padding)
+    counts = np.pad(np.cumsum(weights, axis=-1), padding)
+
+    # Days near the start of the range only have a partial window behind them
+    upper = np.arange(1, values.shape[-1] + 1)
+    lower = np.maximum(upper - window, 0)
+    window_sums = sums[..., upper] - sums[..., lower]
+    window_counts = counts[..., upper] - counts[..., lower]
+    return np.divide(window_sums, window_counts, out=np.zeros_like(window_sums), where=window_counts > 0)
+
+def weekday_means(values, logged, first_weekday: int):
+    """Mean value and number of logged days for each weekday (Monday first)"""
+    weekdays = (first_weekday + np.arange(values.shape[-1])) % 7
+    sums = []
+    counts = []
+    for weekday in range(7):
+        selected = logged & (weekdays == weekday)
+        sums.append(np.where(selected, values, 0).sum(axis=-1))
+        counts.append(selected.sum(axis=-1))
+    sums = np.stack(sums, axis=-1)
+    counts = np.stack(counts, axis=-1)
+    means = np.divide(sums, counts, out=np.zeros_like(sums, dtype=np.float64), where=counts > 0)
+    return means, counts
+
+def summarize(frame: DailyTotals, target_calories: Optional[int], tolerance: float = 0.1, window: int = 7) -> NutritionAnalytics:
+    """Build the analytics response from a filled DailyTotals frame"""
+    logged = frame.logged
+    calories = frame.columns["calories"]
+    days_logged = int(logged.sum())
+
+    # Without a calorie target, streaks fall back to consecutive logged days
+    if target_calories:
+        adherent = adherence_mask(calories, logged, target_calories, tolerance)
+        adherence_rate = float(adherent.sum() / days_logged) if days_logged else 0.0
+    else:
+        adherent = logged
+        adherence_rate = None
+    current_streak, longest_streak = run_lengths(adherent)
+
+    percentages, has_energy = macro_percentages(
+        frame.columns["protein"], frame.columns["carbs"], frame.columns["fat"]
+    )
+    counted = logged & has_energy
+    macro_distribution = {}
+    for macro, values in percentages.items():
+        sample = values[counted]
+        if sample.size:
+            p25, median, p75 = np.percentile(sample, [25, 50, 75])
+            macro_distribution[macro] = MacroDistribution(
+                mean=float(sample.mean()), p25=float(p25), median=float(median), p75=float(p75)
+            )
+        else:
+            macro_distribution[macro] = MacroDistribution(mean=0, p25=0, median=0, p75=0)
+
+    weekday_calories, weekday_counts = weekday_means(calories, logged, frame.start.weekday())
+    weekday_patterns = [
+        WeekdayPattern(
+            weekday=WEEKDAYS[weekday],
+            avg_calories=float(weekday_calories[weekday]),
+            days_logged=int(weekday_counts[weekday])
+        )
+        for weekday in range(7)
+    ]
+
+    rolling = rolling_mean(calories, logged, window)
+    trend = [
+        DailyTrendPoint(
+            date=frame.start + timedelta(days=index),
+            calories=float(calories[index]),
+            rolling_calories=float(rolling[index]),
+            logged=bool(logged[index])
+        )
+        for index in range(frame.days)
+    ]
+
+    averages = {}
+    for field, values in frame.columns.items():
+        averages[field] = float(values[logged].mean()) if days_logged else 0.0
+
+    return NutritionAnalytics(
+        start_date=frame.start,
+        end_date=frame.end,
+        days_in_range=frame.days,
+        days_logged=days_logged,
+        target_calories=target_calories,
+        tolerance=tolerance,
+        adherence_rate=adherence_rate,
+        current_streak=int(current_streak),
+        longest_streak=int(longest_streak),
+        daily_averages=averages,
+        macro_distribution=macro_distribution,
+        weekday_patterns=weekday_patterns,
+        rolling_window=window,
+        trend=trend
+    )
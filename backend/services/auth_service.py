@@ -1,26 +1,67 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from pymongo import MongoClient
 from models.user import UserInDB, TokenData
-import os
+from services.cache import make_cache
+from services.database import get_db
+from settings import get_settings
+import threading
+import time
 import uuid
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-# Get settings from environment
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+settings = get_settings()
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+
+class TokenDenylist:
+    """Oldest token version still accepted, for users who recently revoked their tokens
+
+    Lets routes reject revoked tokens without reading the user document.
+    Tokens expire after ACCESS_TOKEN_EXPIRE_MINUTES, so an entry is only
+    needed for that long after a revocation and the store stays small. It
+    lives in the cache backend, so with CACHE_BACKEND=sqlite a revocation
+    reaches every worker.
+    """
+    
+    def __init__(self, ttl: float, max_size: int = 100000):
+        self.ttl = ttl
+        self._min_versions = make_cache("token_denylist", max_size=max_size, ttl=ttl, stale_ttl=ttl)
+        self._lock = threading.Lock()
+    
+    def revoke(self, user_id: str, min_version: int, revoked_at: Optional[datetime] = None):
+        """Reject this user's tokens with a version below min_version"""
+        revoked = revoked_at.replace(tzinfo=timezone.utc).timestamp() if revoked_at else time.time()
+        remaining = revoked + self.ttl - time.time()
+        if remaining <= 0:
+            return
+        with self._lock:
+            current = self._min_versions.get(user_id)
+            if current is None or current <= min_version:
+                self._min_versions.set(user_id, min_version, ttl=remaining)
+    
+    def is_revoked(self, user_id: str, version: int) -> bool:
+        min_version = self._min_versions.get(user_id)
+        return min_version is not None and version < min_version
+    
+    def load(self, db):
+        """Rebuild from revocations recent enough that their tokens may still be valid"""
+        since = datetime.utcnow() - timedelta(seconds=self.ttl)
+        for user in db.users.find({"tokens_revoked_at": {"$gte": since}},
+                                  {"user_id": 1, "token_version": 1, "tokens_revoked_at": 1}):
+            self.revoke(user["user_id"], user.get("token_version", 0), user["tokens_revoked_at"])
+    
+    def __len__(self):
+        return len(self._min_versions)
+
+token_denylist = TokenDenylist(ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -52,32 +93,56 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def decode_access_token(token: str) -> dict:
+    """Verify a token's signature and expiry and return its claims (raises JWTError)"""
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise credentials_exception()
         token_data = TokenData(username=username)
     except JWTError:
-        raise credentials_exception
+        raise credentials_exception()
     
-    # Get database connection
-    from fastapi import Request
-    mongo_url = os.getenv("MONGO_URL")
-    client = MongoClient(mongo_url)
-    db = client.calorie_tracker
-    
-    user = get_user(db, username=token_data.username)
+    user = get_user(get_db(), username=token_data.username)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
+    # Tokens issued before the user's last logout-all carry an older version
+    if payload.get("ver", 0) < user.token_version:
+        raise credentials_exception()
     return user
 
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
+    """user_id of a valid token, for routes that need nothing else from the user
+
+    The id and token version are read from the token's claims and checked
+    against the in-memory denylist, so no database access is needed.
+    """
+    try:
+        payload = decode_access_token(token)
+    except JWTError:
+        raise credentials_exception()
+    
+    user_id = payload.get("user_id")
+    if user_id is None:
+        # Token issued before user_id was added to the claims
+        user = await get_current_user(token)
+        return user.user_id
+    
+    if token_denylist.is_revoked(user_id, payload.get("ver", 0)):
+        raise credentials_exception()
+    return user_id
+
 def create_user(db, user_data: dict):
     user_id = str(uuid.uuid4())
     user_data["user_id"] = user_id
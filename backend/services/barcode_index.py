@@ -0,0 +1,291 @@
+"""
+Read-only, memory-mapped barcode index: GTIN -> fdc_id of a branded food.
+
+Layout (little-endian): 8-byte magic, uint32 header length, a JSON header,
+then an open-addressing hash table of `capacity` slots (a power of two, at
+most half full), 64-byte aligned:
+
+    keys      uint64[capacity]   GTIN-14 as an integer, 0 = empty slot
+    fdc_ids   uint32[capacity]
+
+A lookup hashes the key and probes linearly, so it costs a couple of slot
+reads whatever the table size, and like the nutrient store the file is
+shared by every worker through the page cache.
+
+Barcodes are stored as GTIN-14: UPC-A, EAN-13, EAN-8 and GTIN-14 codes are
+zero-padded to 14 digits, and codes in the bulk data that lack their check
+digit get it computed. Build from the FoodData Central Branded Foods JSON,
+then fold in newer downloads (later fdc_ids of a GTIN replace earlier ones),
+run from the backend directory:
+    python -m services.barcode_index build FoodData_Central_branded_food_json_*.json -o data/barcodes.bin
+    python -m services.barcode_index update FoodData_Central_branded_food_json_<newer>.json
+Running workers notice the replaced file within BARCODE_INDEX_RELOAD_SECONDS.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Optional
+import numpy as np
+from services.nutrient_store import iter_bulk_foods
+
+MAGIC = b"GTINIDX1"
+ALIGNMENT = 64
+HEADER_SPACE = 4096
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+MASK_64 = (1 << 64) - 1
+
+class InvalidBarcode(ValueError):
+    """Not a GTIN: wrong length, non-digits or a bad check digit"""
+
+def check_digit(digits: str) -> int:
+    """GS1 check digit for a code without its last digit"""
+    total = sum(int(digit) * (3 if position % 2 == 0 else 1) for position, digit in enumerate(reversed(digits)))
+    return (10 - total % 10) % 10
+
+def has_valid_check_digit(code: str) -> bool:
+    return check_digit(code[:-1]) == int(code[-1])
+
+def upc_e_to_upc_a(code: str) -> str:
+    """Expand an 8-digit zero-suppressed UPC-E to its 12-digit UPC-A"""
+    system, digits, check = code[0], code[1:7], code[7]
+    last = digits[5]
+    if last in "012":
+        body = digits[0:2] + last + "0000" + digits[2:5]
+    elif last == "3":
+        body = digits[0:3] + "00000" + digits[3:5]
+    elif last == "4":
+        body = digits[0:4] + "00000" + digits[4]
+    else:
+        body = digits[0:5] + "0000" + last
+    return system + body + check
+
+def gtin_candidates(code: str) -> list:
+    """GTIN-14 keys (as integers) to try for a scanned barcode; raises InvalidBarcode
+
+    Accepts UPC-A, EAN-13, EAN-8 and GTIN-14, with or without leading zeros,
+    spaces or dashes, and the 8-digit UPC-E a scanner reports for small
+    packages. The check digit must be right, and the code not all zeros
+    (0 marks an empty slot in the index).
+    """
+    digits = "".join(character for character in code if character not in " -")
+    if not digits.isdigit() or len(digits) not in (8, 12, 13, 14) or not digits.strip("0"):
+        raise InvalidBarcode(f"'{code}' is not a GTIN")
+    candidates = []
+    if has_valid_check_digit(digits):
+        candidates.append(int(digits))
+    if len(digits) == 8 and digits[0] in "01":
+        upc_a = upc_e_to_upc_a(digits)
+        if has_valid_check_digit(upc_a) and int(upc_a) not in candidates:
+            candidates.append(int(upc_a))
+    if not candidates:
+        raise InvalidBarcode(f"'{code}' has an invalid check digit")
+    return candidates
+
+def bulk_gtin(value) -> Optional[int]:
+    """GTIN-14 of a `gtinUpc` from the bulk data, which is not always clean
+
+    Values with a wrong check digit are taken to be missing it, as the
+    shorter ones in the Branded Foods data are.
+    """
+    digits = "".join(character for character in str(value or "") if character.isdigit())
+    if not 7 <= len(digits) <= 14 or not digits.strip("0"):
+        return None
+    if len(digits) >= 8 and has_valid_check_digit(digits):
+        return int(digits)
+    if len(digits) == 14:
+        return None
+    return int(digits + str(check_digit(digits)))
+
+def slot_of(key: int, mask: int) -> int:
+    # Fibonacci hashing: the top bits of key * 2^64/phi
+    return ((key * HASH_MULTIPLIER) & MASK_64) >> (64 - mask.bit_length())
+
+class BarcodeIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:8] != MAGIC:
+            raise ValueError(f"{path} is not a barcode index")
+        (header_length,) = struct.unpack_from("<I", self._mm, 8)
+        self.header = json.loads(self._mm[12:12 + header_length])
+        self.count = self.header["count"]
+        capacity = self.header["capacity"]
+        self._mask = capacity - 1
+        self.keys = np.frombuffer(self._mm, dtype="<u8", count=capacity, offset=self.header["keys"])
+        self.fdc_ids = np.frombuffer(self._mm, dtype="<u4", count=capacity, offset=self.header["fdc_ids"])
+        # Plain Python lists would copy the table; item() reads one slot straight from the map
+        self._key_at = self.keys.item
+        self._fdc_id_at = self.fdc_ids.item
+
+    def __len__(self):
+        return self.count
+
+    def get(self, gtin: int) -> Optional[int]:
+        """fdc_id stored for a GTIN-14 key, or None"""
+        slot = slot_of(gtin, self._mask)
+        while True:
+            key = self._key_at(slot)
+            if key == 0:
+                return None
+            if key == gtin:
+                return self._fdc_id_at(slot)
+            slot = (slot + 1) & self._mask
+
+    def items(self) -> Iterable[tuple]:
+        occupied = np.nonzero(self.keys)[0]
+        return zip(self.keys[occupied].tolist(), self.fdc_ids[occupied].tolist())
+
+def write_index(path: str, mapping: Dict[int, int], sources: list) -> int:
+    """Write {gtin14: fdc_id} as a hash table at most half full"""
+    capacity = 1 << max(4, (2 * len(mapping) - 1).bit_length())
+    mask = capacity - 1
+    keys = np.zeros(capacity, dtype="<u8")
+    fdc_ids = np.zeros(capacity, dtype="<u4")
+    for gtin, fdc_id in mapping.items():
+        slot = slot_of(gtin, mask)
+        while keys[slot]:
+            slot = (slot + 1) & mask
+        keys[slot] = gtin
+        fdc_ids[slot] = fdc_id
+
+    keys_offset = HEADER_SPACE + 12
+    keys_offset += -keys_offset % ALIGNMENT
+    fdc_ids_offset = keys_offset + keys.nbytes
+    fdc_ids_offset += -fdc_ids_offset % ALIGNMENT
+    header = json.dumps({
+        "version": 1, "count": len(mapping), "capacity": capacity,
+        "keys": keys_offset, "fdc_ids": fdc_ids_offset,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "sources": sources[-20:],
+    }).encode()
+    if len(header) > HEADER_SPACE:
+        raise ValueError("Barcode index header too large")
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.seek(keys_offset)
+        f.write(keys.tobytes())
+        f.seek(fdc_ids_offset)
+        f.write(fdc_ids.tobytes())
+    # Atomic, so workers holding the old map keep reading it until they reload
+    os.replace(temporary, path)
+    return len(mapping)
+
+def merge_bulk(mapping: Dict[int, int], paths) -> int:
+    """Add the GTINs of Branded Foods downloads to `mapping`; returns the records read"""
+    records = 0
+    for path in paths:
+        print(f"Reading {path}", file=sys.stderr)
+        for record in iter_bulk_foods(path):
+            gtin = bulk_gtin(record.get("gtinUpc"))
+            fdc_id = record.get("fdcId")
+            if gtin is None or not fdc_id:
+                continue
+            records += 1
+            # A product re-submitted to FoodData Central gets a new, higher fdc_id
+            if int(fdc_id) > mapping.get(gtin, 0):
+                mapping[gtin] = int(fdc_id)
+    return records
+
+class BarcodeLookup:
+    """Barcode lookups against the index file, reopened when it is replaced"""
+
+    def __init__(self, path: Optional[str], reload_interval: float = 60):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.index: Optional[BarcodeIndex] = None
+        self.hits = 0
+        self.misses = 0
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reload()
+
+    def _reload(self):
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        try:
+            self.index = BarcodeIndex(self.path) if mtime is not None else None
+            self._mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f"Error opening barcode index {self.path}: {e}")
+
+    @property
+    def available(self) -> bool:
+        return self.index is not None
+
+    def lookup(self, code: str) -> Optional[str]:
+        """fdc_id of a scanned barcode, None if unknown; raises InvalidBarcode"""
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.reload_interval:
+                    self._reload()
+        candidates = gtin_candidates(code)
+        index = self.index
+        if index is None:
+            return None
+        for gtin in candidates:
+            fdc_id = index.get(gtin)
+            if fdc_id is not None:
+                self.hits += 1
+                return str(fdc_id)
+        self.misses += 1
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "barcodes": len(self.index) if self.index is not None else 0,
+            "built_at": self.index.header.get("built_at") if self.index is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "barcodes.bin")
+
+# Global instance; lookups find nothing until an index has been built
+barcode_lookup = BarcodeLookup(
+    os.getenv("BARCODE_INDEX_PATH", DEFAULT_INDEX_PATH),
+    reload_interval=float(os.getenv("BARCODE_INDEX_RELOAD_SECONDS", 60))
+)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Build the index from Branded Foods JSON downloads")
+    update_parser = commands.add_parser("update", help="Fold newer downloads into an existing index")
+    for command in (build_parser, update_parser):
+        command.add_argument("inputs", nargs="+")
+        command.add_argument("-o", "--output", default=DEFAULT_INDEX_PATH)
+    args = parser.parse_args()
+
+    mapping, sources = {}, []
+    if args.command == "update":
+        current = BarcodeIndex(args.output)
+        mapping = dict(current.items())
+        sources = current.header.get("sources", [])
+    before = len(mapping)
+    records = merge_bulk(mapping, args.inputs)
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = write_index(args.output, mapping, sources + [os.path.basename(path) for path in args.inputs])
+    print(f"Read {records:,} branded foods; {count:,} barcodes ({count - before:+,}) in {args.output} "
+          f"({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
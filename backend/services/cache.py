@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "calorie-tracker-cache.sqlite3")
+
+class MemoryCache:
+    """Bounded in-process LRU cache with a fresh TTL and a longer stale window
+
+    Entries are served by get() while fresh. Once expired they stay available
+    to get_stale() until stale_ttl passes, so callers can fall back to old data
+    when the upstream source cannot be reached.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600, stale_ttl: float = 86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a fresh value, or None if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def contains(self, key: str) -> bool:
+        """Whether a fresh value is cached, without counting a hit or miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > now
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Get a value even if it expired, as long as it is inside the stale window"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= now:
+                return None
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.monotonic()
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (value, now + ttl, now + max(ttl, self.stale_ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, default=lambda o: {"__datetime__": o.isoformat()} if isinstance(o, datetime) else str(o))
+
+def _decode(text: str) -> Any:
+    return json.loads(text, object_hook=lambda d: datetime.fromisoformat(d["__datetime__"]) if "__datetime__" in d else d)
+
+class SQLiteCache:
+    """Cache shared by all worker processes on a host, kept in one SQLite file
+
+    Same interface as MemoryCache; each cache is a namespace in the file.
+    WAL mode lets readers in every worker run alongside a writer, and there
+    is no per-process copy, so a set or delete in one worker is what every
+    other worker reads next. Expiry uses wall-clock time since it is
+    compared across processes. The size bound is approximate: oldest
+    entries are trimmed every `trim_every` writes.
+    """
+
+    def __init__(self, namespace: str, path: str = DEFAULT_CACHE_PATH, max_size: int = 10000,
+                 ttl: float = 3600, stale_ttl: float = 86400, trim_every: int = 500):
+        self.namespace = namespace
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.trim_every = trim_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, and never one inherited across a fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key TEXT, value TEXT, "
+                "expires REAL, stale_until REAL, updated REAL, PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_updated ON entries (namespace, updated)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _row(self, key: str):
+        return self._connection().execute(
+            "SELECT value, expires, stale_until FROM entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        ).fetchone()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a fresh value, or None if missing or expired"""
+        row = self._row(key)
+        if row is None or row[1] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _decode(row[0])
+
+    def contains(self, key: str) -> bool:
+        """Whether a fresh value is cached, without counting a hit or miss"""
+        row = self._connection().execute(
+            "SELECT 1 FROM entries WHERE namespace = ? AND key = ? AND expires > ?",
+            (self.namespace, key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Get a value even if it expired, as long as it is inside the stale window"""
+        row = self._row(key)
+        if row is None or row[2] <= time.time():
+            return None
+        return _decode(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (self.namespace, key, _encode(value), now + ttl, now + max(ttl, self.stale_ttl), now)
+        )
+        self._writes += 1
+        if self._writes % self.trim_every == 0:
+            self._trim(connection, now)
+
+    def _trim(self, connection: sqlite3.Connection, now: float):
+        connection.execute("DELETE FROM entries WHERE namespace = ? AND stale_until <= ?", (self.namespace, now))
+        connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key IN (SELECT key FROM entries WHERE namespace = ? "
+            "ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_size)
+        )
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+def make_cache(namespace: str, max_size: int = 10000, ttl: float = 3600, stale_ttl: float = 86400):
+    """A cache on the backend chosen by CACHE_BACKEND
+
+    "memory" (default) keeps it per process; "sqlite" shares it between the
+    worker processes on a host through the file at CACHE_PATH.
+    """
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        path = os.getenv("CACHE_PATH", DEFAULT_CACHE_PATH)
+        return SQLiteCache(namespace, path=path, max_size=max_size, ttl=ttl, stale_ttl=stale_ttl)
+    if backend == "memory":
+        return MemoryCache(max_size=max_size, ttl=ttl, stale_ttl=stale_ttl)
+    raise ValueError(f"CACHE_BACKEND must be memory or sqlite, not '{backend}'")
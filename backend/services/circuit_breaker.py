@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import Callable, List
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """Stops calling a failing upstream until it has had time to recover
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    rejects calls immediately. Once `recovery_timeout` seconds pass it goes
+    half-open and lets up to `half_open_max_calls` probe calls through: a
+    successful probe closes it again, a failed one re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probes = 0
+        self._on_close: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def on_close(self, callback: Callable[[], None]):
+        """Register a callback run (outside the lock) whenever the breaker closes after an outage"""
+        self._on_close.append(callback)
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def release(self):
+        """Give back a probe slot for a call that never reached the upstream"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            recovered = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self._probes = 0
+
+        if recovered:
+            for callback in self._on_close:
+                callback()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probes = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == OPEN:
+                retry_in = max(self.recovery_timeout - (time.monotonic() - self.opened_at), 0)
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "retry_in": round(retry_in, 2),
+            }
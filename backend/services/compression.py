@@ -0,0 +1,117 @@
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # gzip only without the Brotli package
+    brotli = None
+
+# Quality for responses compressed per request, not ahead of time: brotli 4
+# and gzip 6 stay well under a millisecond for the largest JSON pages
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+SKIP_CONTENT_TYPES = ("text/event-stream", "image/", "application/gzip", "application/zip")
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """The preferred encoding we support from an Accept-Encoding header, br over gzip"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """ASGI middleware compressing response bodies of at least `min_bytes`
+
+    Only single-message bodies are compressed (every JSON route); streamed
+    responses such as server-sent events pass through untouched so they are
+    not buffered.
+    """
+
+    def __init__(self, app, min_bytes: int = 1024):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it is worth compressing
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = [(name, value) for name, value in start["headers"]]
+            body = message.get("body", b"")
+            if (message.get("more_body", False) or len(body) < self.min_bytes
+                    or not self._compressible(headers)):
+                await send(start)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers = [(name, value) for name, value in headers if name not in (b"content-length", b"vary")]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", self._vary(start["headers"])),
+            ]
+            await send({**start, "headers": headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _compressible(headers) -> bool:
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type" and value.decode("latin-1").startswith(SKIP_CONTENT_TYPES):
+                return False
+        return True
+
+    @staticmethod
+    def _vary(headers) -> bytes:
+        for name, value in headers:
+            if name == b"vary":
+                if b"accept-encoding" in value.lower():
+                    return value
+                return value + b", Accept-Encoding"
+        return b"Accept-Encoding"
@@ -0,0 +1,60 @@
+import threading
+import time
+import pymongo
+from pymongo import MongoClient
+from settings import get_settings
+
+class Database:
+    """One MongoClient (and connection pool) per worker process, created on first use
+
+    Creating the client lazily keeps importing the app free of network
+    setup; the lifespan of the app connects it at startup and closes it at
+    shutdown.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> MongoClient:
+        return self.connect()
+
+    def connect(self) -> MongoClient:
+        """Create the client; pymongo connects in the background and on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    settings = get_settings()
+                    self._client = MongoClient(
+                        settings.mongo_url,
+                        maxPoolSize=settings.mongo_max_pool_size,
+                        serverSelectionTimeoutMS=settings.mongo_timeout_ms,
+                    )
+        return self._client
+
+    def get_db(self):
+        return self.client[get_settings().db_name]
+
+    def ping(self, timeout: float) -> float:
+        """Round trip of a ping command in milliseconds; raises if Mongo does not answer in time"""
+        start = time.perf_counter()
+        with pymongo.timeout(timeout):
+            self.get_db().command("ping")
+        return (time.perf_counter() - start) * 1000
+
+    def max_pool_size(self) -> int:
+        return self.client.options.pool_options.max_pool_size
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+# Global instance
+database = Database()
+
+def get_db():
+    """The calorie_tracker database on the shared client"""
+    return database.get_db()
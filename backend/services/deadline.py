@@ -0,0 +1,38 @@
+"""
+Per-request time budget, carried in a context variable.
+
+A route sets how long its request may take; code further down (the USDA
+client) sizes its own timeouts from what is left. Context variables follow
+the request into run_in_threadpool and into tasks it starts, but not into
+background executors, so prefetching and cache refreshes run unbounded.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, None if it has none"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+@contextmanager
+def budget(seconds: float):
+    """Limit the enclosed work to `seconds`, or less if an outer budget ends sooner"""
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(deadline, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def request_budget(seconds: float):
+    """Dependency giving a route's request a time budget"""
+    async def set_budget():
+        # Set in the request's own context, so the endpoint and its threadpool calls see it
+        _deadline.set(time.monotonic() + seconds)
+    return set_budget
@@ -0,0 +1,168 @@
+"""
+Monthly archive of old diary entries (diary_archive).
+
+One document per user and month holds that month's entries as a single
+zlib-compressed BSON blob, plus the per-day totals analytics needs, so
+ranges of archived days are summed without decompressing anything:
+
+    {_id: "<user_id>:2024-03", user_id, month, version,
+     entry_ids: [...], days: {"2024-03-01": {entries, calories, ...}, ...},
+     entries: <compressed>, compacted_at}
+
+Archived entries keep the entries-layout shape (ISO `date`). Documents are
+rewritten whole under an optimistic `version` check, so the compaction job
+and edits to archived entries never overwrite each other.
+"""
+
+import zlib
+from datetime import date, datetime
+from typing import Iterable, List, Optional
+import bson
+from bson.binary import Binary
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from services.nutrition import NUTRIENT_FIELDS, sum_nutrition
+
+COMPRESSION_LEVEL = 6
+
+# Rewrites retried when another writer changed the month in between
+MAX_WRITE_ATTEMPTS = 5
+
+class ArchiveConflict(Exception):
+    """An archived month kept changing under a rewrite"""
+
+def month_start(day: date) -> datetime:
+    return datetime(day.year, day.month, 1)
+
+def month_id(user_id: str, day: date) -> str:
+    return f"{user_id}:{day.isoformat()[:7]}"
+
+def encode_entries(entries: List[dict]) -> Binary:
+    return Binary(zlib.compress(bson.encode({"entries": entries}), COMPRESSION_LEVEL))
+
+def decode_entries(blob: bytes) -> List[dict]:
+    return bson.decode(zlib.decompress(blob))["entries"]
+
+def day_totals(entries: Iterable[dict]) -> dict:
+    """{iso day: {"entries": n, nutrient: total}} for a month's entries"""
+    by_day = {}
+    for entry in entries:
+        by_day.setdefault(entry["date"], []).append(entry["nutrition"])
+    return {day: {"entries": len(items), **sum_nutrition(items)} for day, items in by_day.items()}
+
+def newest_first(entries: Iterable[dict]) -> List[dict]:
+    return sorted(entries, key=lambda entry: entry["created_at"], reverse=True)
+
+class DiaryArchive:
+    """Reads and rewrites the archived months in diary_archive"""
+
+    def ensure_indexes(self, db):
+        db.diary_archive.create_index([("user_id", ASCENDING), ("month", DESCENDING)])
+        db.diary_archive.create_index([("user_id", ASCENDING), ("entry_ids", ASCENDING)])
+
+    def _write(self, db, current: Optional[dict], user_id: str, month: datetime, entries: List[dict]) -> bool:
+        """Replace a month with `entries` if nobody rewrote it since `current` was read"""
+        if current is None:
+            if not entries:
+                return True
+            try:
+                db.diary_archive.insert_one(self._document(user_id, month, entries, version=1))
+                return True
+            except DuplicateKeyError:
+                return False
+        if not entries:
+            return db.diary_archive.delete_one({"_id": current["_id"], "version": current["version"]}).deleted_count > 0
+        result = db.diary_archive.replace_one(
+            {"_id": current["_id"], "version": current["version"]},
+            self._document(user_id, month, entries, version=current["version"] + 1)
+        )
+        return result.matched_count > 0
+
+    def _document(self, user_id: str, month: datetime, entries: List[dict], version: int) -> dict:
+        entries = newest_first(entries)
+        return {
+            "_id": month_id(user_id, month.date()),
+            "user_id": user_id,
+            "month": month,
+            "version": version,
+            "entry_ids": [entry["entry_id"] for entry in entries],
+            "days": day_totals(entries),
+            "entries": encode_entries(entries),
+            "compacted_at": datetime.utcnow(),
+        }
+
+    def _rewrite(self, db, query: dict, change) -> bool:
+        """Apply `change(entries) -> entries` to the month matching `query`; False if none matches"""
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            current = db.diary_archive.find_one(query)
+            if current is None:
+                return False
+            entries = change(decode_entries(current["entries"]))
+            if self._write(db, current, current["user_id"], current["month"], entries):
+                return True
+        raise ArchiveConflict(f"Archived month {query} changed {MAX_WRITE_ATTEMPTS} times during a rewrite")
+
+    def merge_month(self, db, user_id: str, month: date, entries: List[dict]):
+        """Add (or replace, by entry_id) entries of one month, all in entries-layout shape"""
+        incoming = {entry["entry_id"]: entry for entry in entries}
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            current = db.diary_archive.find_one({"_id": month_id(user_id, month)})
+            archived = decode_entries(current["entries"]) if current else []
+            merged = [entry for entry in archived if entry["entry_id"] not in incoming] + list(incoming.values())
+            if self._write(db, current, user_id, month_start(month), merged):
+                return
+        raise ArchiveConflict(f"Archived month {month_id(user_id, month)} kept changing during compaction")
+
+    def find_entries(self, db, user_id: str, day: Optional[date] = None, meal_type: Optional[str] = None) -> List[dict]:
+        """Archived entries of one day, or of every archived month, newest first"""
+        if day:
+            months = db.diary_archive.find({"_id": month_id(user_id, day), f"days.{day.isoformat()}": {"$exists": True}},
+                                           {"entries": 1})
+        else:
+            months = db.diary_archive.find({"user_id": user_id}, {"entries": 1}).sort("month", -1)
+        entries = []
+        for month in months:
+            entries.extend(decode_entries(month["entries"]))
+        if day:
+            entries = [entry for entry in entries if entry["date"] == day.isoformat()]
+        if meal_type:
+            entries = [entry for entry in entries if entry["meal_type"] == meal_type]
+        return newest_first(entries)
+
+    def get_entry(self, db, user_id: str, entry_id: str) -> Optional[dict]:
+        month = db.diary_archive.find_one({"user_id": user_id, "entry_ids": entry_id}, {"entries": 1})
+        if month is None:
+            return None
+        return next((entry for entry in decode_entries(month["entries"]) if entry["entry_id"] == entry_id), None)
+
+    def update_entry(self, db, user_id: str, entry_id: str, fields: dict) -> bool:
+        def change(entries):
+            return [{**entry, **fields} if entry["entry_id"] == entry_id else entry for entry in entries]
+        return self._rewrite(db, {"user_id": user_id, "entry_ids": entry_id}, change)
+
+    def delete_entry(self, db, user_id: str, entry_id: str) -> bool:
+        def change(entries):
+            return [entry for entry in entries if entry["entry_id"] != entry_id]
+        return self._rewrite(db, {"user_id": user_id, "entry_ids": entry_id}, change)
+
+    def delete_entries(self, db, user_id: str, month: date, entry_ids: Iterable[str]) -> bool:
+        """Remove entries from one archived month"""
+        entry_ids = set(entry_ids)
+        def change(entries):
+            return [entry for entry in entries if entry["entry_id"] not in entry_ids]
+        return self._rewrite(db, {"_id": month_id(user_id, month)}, change)
+
+    def daily_totals(self, db, user_id: str, start: date, end: date,
+                     fields: Iterable[str] = NUTRIENT_FIELDS) -> Iterable[tuple]:
+        """(day, {field: total}) for archived days in the range, read from the stored totals"""
+        months = db.diary_archive.find(
+            {"user_id": user_id, "month": {"$gte": month_start(start), "$lte": month_start(end)}},
+            {"days": 1}
+        )
+        for month in months:
+            for day, totals in month.get("days", {}).items():
+                day = date.fromisoformat(day)
+                if start <= day <= end:
+                    yield day, {field: totals.get(field, 0) for field in fields}
+
+diary_archive = DiaryArchive()
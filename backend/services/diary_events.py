@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+import json
+import os
+from collections import defaultdict
+from datetime import date
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from services.diary_store import as_date, diary_store
+from services.metrics import registry, Gauge
+from services.nutrition import sum_nutrition
+
+diary_stream_connections = registry.register(Gauge(
+    "diary_stream_connections", "Open /api/diary/stream connections"
+))
+
+# Sent instead of the queued events when a subscriber fell too far behind
+RESYNC = "event: resync\ndata: {}\n\n"
+
+def format_event(event_id: int, event_type: str, data) -> str:
+    """A server-sent event frame"""
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(jsonable_encoder(data), separators=(',', ':'))}\n\n"
+
+class Subscription:
+    """One open stream: a bounded queue of encoded events, None meaning close"""
+
+    __slots__ = ("user_id", "queue")
+
+    def __init__(self, user_id: str, queue_size: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def replace(self, message: Optional[str]):
+        """Drop whatever is queued and leave only `message`"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+class DiaryEventBus:
+    """In-process pub/sub of diary changes, per user
+
+    The diary write paths publish; every open stream of the user gets the
+    event. An event is encoded once and shared by all of a user's
+    subscribers, and publishing never waits: a subscriber whose queue is full
+    has its backlog replaced by a single `resync` event, telling the client to
+    refetch instead of holding memory for a stalled connection. At most
+    `max_per_user` streams are kept per user; opening another closes the
+    oldest. Everything runs on the event loop, so no locking is needed.
+
+    Events only reach streams served by the same worker process; clients
+    refetch on connect and on `resync`, which covers reconnecting to another
+    worker.
+    """
+
+    def __init__(self, queue_size: int = 64, max_per_user: int = 10):
+        self.queue_size = queue_size
+        self.max_per_user = max_per_user
+        self.published = 0
+        self.resyncs = 0
+        self._subscribers = defaultdict(list)
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self.queue_size)
+        subscribers = self._subscribers[user_id]
+        subscribers.append(subscription)
+        diary_stream_connections.inc()
+        if len(subscribers) > self.max_per_user:
+            subscribers.pop(0).replace(None)
+            diary_stream_connections.dec()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        # Absent if it was already closed as the user's oldest stream
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.remove(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+        diary_stream_connections.dec()
+
+    def has_subscribers(self, user_id: str) -> bool:
+        return user_id in self._subscribers
+
+    def publish(self, user_id: str, event_type: str, data) -> int:
+        """Queue an event for the user's open streams; returns how many got it"""
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return 0
+        message = format_event(next(self._ids), event_type, data)
+        self.published += 1
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.resyncs += 1
+                subscription.replace(RESYNC)
+        return len(subscribers)
+
+    def snapshot(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "connections": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+            "resyncs": self.resyncs,
+        }
+
+# Comment lines sent on idle streams, so proxies and clients notice dead connections
+HEARTBEAT_SECONDS = float(os.getenv("DIARY_STREAM_HEARTBEAT_SECONDS", 15))
+
+diary_events = DiaryEventBus(
+    queue_size=int(os.getenv("DIARY_STREAM_QUEUE_SIZE", 64)),
+    max_per_user=int(os.getenv("DIARY_STREAM_MAX_PER_USER", 10))
+)
+
+def _day_totals(db, user_id: str, day: date) -> dict:
+    entries = diary_store.find_entries(db, user_id, day, projection={"nutrition": 1, "_id": 0})
+    return {"date": day, "entries": len(entries), **sum_nutrition(entry["nutrition"] for entry in entries)}
+
+async def publish_diary_change(db, user_id: str, event_type: str, entry: dict):
+    """Send an entry change and the new totals of its day to the user's open streams
+
+    Costs nothing when the user has no stream open. A failure here is only
+    logged: the write it reports has already succeeded.
+    """
+    if not diary_events.has_subscribers(user_id):
+        return
+    try:
+        day = as_date(entry["date"])
+        totals = await run_in_threadpool(_day_totals, db, user_id, day)
+        diary_events.publish(user_id, event_type, {key: value for key, value in entry.items() if key != "_id"})
+        diary_events.publish(user_id, "daily_total", totals)
+    except Exception as e:
+        print(f"Error publishing diary event: {e}")
@@ -0,0 +1,581 @@
+"""
+Storage layouts for diary and weight entries.
+
+  entries   one document per logged food in diary_entries (string `date`),
+            one per weigh-in in weight_entries
+  buckets   one document per user and day in diary_days, holding that day's
+            entries in a map keyed by entry_id, and one per user and month in
+            weight_months; dates are native BSON dates
+  dual      reads from entries, writes to both; used while migrating
+
+DIARY_LAYOUT picks the layout. Whatever the layout, entries older than
+DIARY_ARCHIVE_AFTER_DAYS (rounded down to whole months) can be compacted
+into services.diary_archive; reads of those days fall back to the archive.
+Compaction runs every DIARY_ARCHIVE_INTERVAL_HOURS in one worker, or from
+cron:
+    python -m services.diary_store compact [--after-days 180]
+
+Moving an existing deployment to buckets is done online, run from the
+backend directory:
+    1. deploy with DIARY_LAYOUT=dual, so new writes reach both layouts
+    2. python -m services.diary_store migrate    (backfill; idempotent, resumable)
+    3. python -m services.diary_store verify [--repair]
+    4. deploy with DIARY_LAYOUT=buckets
+The old collections are left in place; drop them once the buckets have
+served traffic for a while.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ASCENDING, DESCENDING, DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from services.diary_archive import DiaryArchive, newest_first
+from services.nutrition import NUTRIENT_FIELDS
+from services.write_batcher import diary_writer
+
+ENTRIES = "entries"
+BUCKETS = "buckets"
+DUAL = "dual"
+
+DUPLICATE_KEY = 11000
+
+# Kept on the bucket, not repeated in every entry of its map
+BUCKET_KEYS = ("_id", "user_id", "date")
+
+def as_date(value) -> date:
+    """Day of a stored `date`: ISO string in the entries layout, datetime in buckets"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+def day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+def day_bucket_id(user_id: str, day: date) -> str:
+    return f"{user_id}:{day.isoformat()}"
+
+def month_bucket_id(user_id: str, day: date) -> str:
+    return f"{user_id}:{day.isoformat()[:7]}"
+
+class EntryLayout:
+    """One document per diary entry and per weight entry"""
+
+    name = ENTRIES
+
+    async def insert_entry(self, db, entry: dict):
+        # Coalesced into insert_many when DIARY_WRITE_COALESCING is on
+        if diary_writer is not None:
+            await diary_writer.insert(entry)
+        else:
+            db.diary_entries.insert_one(entry)
+
+    def find_entries(self, db, user_id: str, day: Optional[date] = None, meal_type: Optional[str] = None,
+                     projection: Optional[dict] = None) -> List[dict]:
+        """A user's entries, newest first; `projection` limits the fields read where the layout allows"""
+        query = {"user_id": user_id}
+        if day:
+            query["date"] = day.isoformat()
+        if meal_type:
+            query["meal_type"] = meal_type
+        return list(db.diary_entries.find(query, projection).sort("created_at", -1))
+
+    def get_entry(self, db, user_id: str, entry_id: str) -> Optional[dict]:
+        return db.diary_entries.find_one({"entry_id": entry_id, "user_id": user_id})
+
+    def update_entry(self, db, user_id: str, entry_id: str, fields: dict) -> bool:
+        result = db.diary_entries.update_one({"entry_id": entry_id, "user_id": user_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    def delete_entry(self, db, user_id: str, entry_id: str) -> bool:
+        return db.diary_entries.delete_one({"entry_id": entry_id, "user_id": user_id}).deleted_count > 0
+
+    def delete_entries(self, db, entries: List[dict]):
+        """Delete entries unless they were updated since they were read"""
+        db.diary_entries.bulk_write([
+            DeleteOne({"entry_id": entry["entry_id"], "user_id": entry["user_id"], "updated_at": entry["updated_at"]})
+            for entry in entries
+        ], ordered=False)
+
+    def existing_entry_ids(self, db, user_id: str, entry_ids: List[str]) -> set:
+        return set(db.diary_entries.distinct("entry_id", {"user_id": user_id, "entry_id": {"$in": entry_ids}}))
+
+    def users_with_entries_before(self, db, day: date) -> List[str]:
+        return db.diary_entries.distinct("user_id", {"date": {"$lt": day.isoformat()}})
+
+    def entry_pipeline(self, db, user_id: str, start: Optional[date] = None, end: Optional[date] = None):
+        """Aggregation over one document per entry (entry fields at the top level); append stages to it"""
+        match = {"user_id": user_id}
+        if start or end:
+            match["date"] = {}
+            if start:
+                match["date"]["$gte"] = start.isoformat()
+            if end:
+                match["date"]["$lte"] = end.isoformat()
+        return db.diary_entries, [{"$match": match}]
+
+    def insert_weight(self, db, entry: dict):
+        db.weight_entries.insert_one(entry)
+
+    def recent_weights(self, db, user_id: str, limit: int) -> List[dict]:
+        return list(db.weight_entries.find({"user_id": user_id}).sort("date", -1).limit(limit))
+
+class BucketLayout:
+    """One document per user and day (diary_days) and per user and month (weight_months)
+
+    A day's summary or entry list is one _id lookup. entry_ids mirrors the
+    keys of the entries map so entries can be found by id alone.
+    """
+
+    name = BUCKETS
+
+    def ensure_indexes(self, db):
+        db.diary_days.create_index([("user_id", ASCENDING), ("date", DESCENDING)])
+        db.diary_days.create_index([("user_id", ASCENDING), ("entry_ids", ASCENDING)])
+        db.weight_months.create_index([("user_id", ASCENDING), ("month", DESCENDING)])
+
+    def bucket_upsert(self, user_id: str, entries: List[dict]) -> UpdateOne:
+        """Upsert of one day's bucket adding (or replacing) `entries`, all from that day"""
+        day = as_date(entries[0]["date"])
+        stored = {entry["entry_id"]: self.to_bucket_entry(entry) for entry in entries}
+        return UpdateOne(
+            {"_id": day_bucket_id(user_id, day)},
+            {
+                "$set": {f"entries.{entry_id}": entry for entry_id, entry in stored.items()},
+                "$setOnInsert": {"user_id": user_id, "date": day_start(day)},
+                "$addToSet": {"entry_ids": {"$each": list(stored)}},
+            },
+            upsert=True
+        )
+
+    def backfill_writes(self, entries: List[dict]) -> List[UpdateOne]:
+        """Writes copying entries into their buckets, leaving entries already there untouched
+
+        Entries in a bucket were dual-written, so they are at least as new
+        as the copy being backfilled. Each write is one conditional upsert, so
+        a bucket deleted in between is recreated rather than missed; it fails
+        with a duplicate key when the entry is already there.
+        """
+        writes = []
+        for entry in entries:
+            day = as_date(entry["date"])
+            writes.append(UpdateOne(
+                {"_id": day_bucket_id(entry["user_id"], day), "entry_ids": {"$ne": entry["entry_id"]}},
+                {"$set": {f"entries.{entry['entry_id']}": self.to_bucket_entry(entry)},
+                 "$push": {"entry_ids": entry["entry_id"]},
+                 "$setOnInsert": {"user_id": entry["user_id"], "date": day_start(day)}},
+                upsert=True
+            ))
+        return writes
+
+    def to_bucket_entry(self, entry: dict) -> dict:
+        return {key: value for key, value in entry.items() if key not in BUCKET_KEYS}
+
+    def from_bucket(self, bucket: dict) -> List[dict]:
+        day = bucket["date"].date().isoformat()
+        return [
+            {**entry, "user_id": bucket["user_id"], "date": day}
+            for entry in bucket.get("entries", {}).values()
+        ]
+
+    async def insert_entry(self, db, entry: dict):
+        db.diary_days.bulk_write([self.bucket_upsert(entry["user_id"], [entry])])
+
+    def find_entries(self, db, user_id: str, day: Optional[date] = None, meal_type: Optional[str] = None,
+                     projection: Optional[dict] = None) -> List[dict]:
+        # A bucket is read whole; callers trim the entries themselves
+        if day:
+            bucket = db.diary_days.find_one({"_id": day_bucket_id(user_id, day)})
+            buckets = [bucket] if bucket else []
+        else:
+            buckets = db.diary_days.find({"user_id": user_id})
+        entries = [entry for bucket in buckets for entry in self.from_bucket(bucket)]
+        if meal_type:
+            entries = [entry for entry in entries if entry["meal_type"] == meal_type]
+        return newest_first(entries)
+
+    def get_entry(self, db, user_id: str, entry_id: str) -> Optional[dict]:
+        bucket = db.diary_days.find_one(
+            {"user_id": user_id, "entry_ids": entry_id},
+            {"user_id": 1, "date": 1, f"entries.{entry_id}": 1}
+        )
+        if bucket is None or entry_id not in bucket.get("entries", {}):
+            return None
+        return self.from_bucket(bucket)[0]
+
+    def update_entry(self, db, user_id: str, entry_id: str, fields: dict) -> bool:
+        result = db.diary_days.update_one(
+            {"user_id": user_id, "entry_ids": entry_id},
+            {"$set": {f"entries.{entry_id}.{key}": value for key, value in fields.items()}}
+        )
+        return result.matched_count > 0
+
+    def delete_entry(self, db, user_id: str, entry_id: str) -> bool:
+        bucket = db.diary_days.find_one_and_update(
+            {"user_id": user_id, "entry_ids": entry_id},
+            {"$unset": {f"entries.{entry_id}": ""}, "$pull": {"entry_ids": entry_id}},
+            projection={"_id": 1}
+        )
+        if bucket is None:
+            return False
+        # Only the bucket just emptied: others of the user may be mid-backfill
+        db.diary_days.delete_one({"_id": bucket["_id"], "entry_ids": {"$size": 0}})
+        return True
+
+    def delete_entries(self, db, entries: List[dict]):
+        """Delete entries unless they were updated since they were read"""
+        bucket_ids = {day_bucket_id(entry["user_id"], as_date(entry["date"])) for entry in entries}
+        db.diary_days.bulk_write([
+            UpdateOne(
+                {"_id": day_bucket_id(entry["user_id"], as_date(entry["date"])),
+                 f"entries.{entry['entry_id']}.updated_at": entry["updated_at"]},
+                {"$unset": {f"entries.{entry['entry_id']}": ""}, "$pull": {"entry_ids": entry["entry_id"]}}
+            )
+            for entry in entries
+        ], ordered=False)
+        db.diary_days.delete_many({"_id": {"$in": list(bucket_ids)}, "entry_ids": {"$size": 0}})
+
+    def existing_entry_ids(self, db, user_id: str, entry_ids: List[str]) -> set:
+        # distinct unwinds entry_ids, so it also returns the other entries of matching buckets
+        found = db.diary_days.distinct("entry_ids", {"user_id": user_id, "entry_ids": {"$in": entry_ids}})
+        return set(found) & set(entry_ids)
+
+    def users_with_entries_before(self, db, day: date) -> List[str]:
+        return db.diary_days.distinct("user_id", {"date": {"$lt": day_start(day)}})
+
+    def entry_pipeline(self, db, user_id: str, start: Optional[date] = None, end: Optional[date] = None):
+        match = {"user_id": user_id}
+        if start or end:
+            match["date"] = {}
+            if start:
+                match["date"]["$gte"] = day_start(start)
+            if end:
+                match["date"]["$lte"] = day_start(end)
+        return db.diary_days, [
+            {"$match": match},
+            {"$project": {"user_id": 1, "date": 1, "entries": {"$objectToArray": "$entries"}}},
+            {"$unwind": "$entries"},
+            {"$addFields": {"entries.v.user_id": "$user_id", "entries.v.date": "$date"}},
+            {"$replaceRoot": {"newRoot": "$entries.v"}},
+        ]
+
+    def insert_weight(self, db, entry: dict):
+        day = as_date(entry["date"])
+        stored = {**self.to_bucket_entry(entry), "date": day_start(day)}
+        db.weight_months.update_one(
+            {"_id": month_bucket_id(entry["user_id"], day)},
+            {
+                "$set": {f"entries.{entry['entry_id']}": stored},
+                "$setOnInsert": {"user_id": entry["user_id"], "month": datetime(day.year, day.month, 1)},
+            },
+            upsert=True
+        )
+
+    def recent_weights(self, db, user_id: str, limit: int) -> List[dict]:
+        weights = []
+        # Newest months first; stop once enough weigh-ins are collected
+        for bucket in db.weight_months.find({"user_id": user_id}).sort("month", -1).batch_size(4):
+            month = sorted(bucket.get("entries", {}).values(), key=lambda entry: entry["date"], reverse=True)
+            weights.extend({**entry, "user_id": user_id, "date": entry["date"].date().isoformat()} for entry in month)
+            if len(weights) >= limit:
+                break
+        return weights[:limit]
+
+class DualWriteLayout(EntryLayout):
+    """Reads from the entries layout and mirrors every write into the buckets"""
+
+    name = DUAL
+
+    def __init__(self):
+        self.buckets = BucketLayout()
+        self.mirror_failures = 0
+
+    def _mirror(self, write, *args):
+        # The entries layout stays authoritative; `verify --repair` fixes what fails here
+        try:
+            write(*args)
+        except Exception as e:
+            self.mirror_failures += 1
+            print(f"Error mirroring diary write to buckets: {e}")
+
+    async def insert_entry(self, db, entry: dict):
+        await super().insert_entry(db, entry)
+        self._mirror(lambda: db.diary_days.bulk_write([self.buckets.bucket_upsert(entry["user_id"], [entry])]))
+
+    def update_entry(self, db, user_id: str, entry_id: str, fields: dict) -> bool:
+        matched = super().update_entry(db, user_id, entry_id, fields)
+        if matched:
+            self._mirror(self.buckets.update_entry, db, user_id, entry_id, fields)
+        return matched
+
+    def delete_entry(self, db, user_id: str, entry_id: str) -> bool:
+        deleted = super().delete_entry(db, user_id, entry_id)
+        if deleted:
+            self._mirror(self.buckets.delete_entry, db, user_id, entry_id)
+        return deleted
+
+    def insert_weight(self, db, entry: dict):
+        super().insert_weight(db, entry)
+        self._mirror(self.buckets.insert_weight, db, entry)
+
+    def delete_entries(self, db, entries: List[dict]):
+        super().delete_entries(db, entries)
+        self._mirror(self.buckets.delete_entries, db, entries)
+
+def compaction_boundary(after_days: int, today: Optional[date] = None) -> date:
+    """First day kept in the hot layout; everything before it may be archived"""
+    cutoff = (today or date.today()) - timedelta(days=after_days)
+    return date(cutoff.year, cutoff.month, 1)
+
+class ArchiveFallback:
+    """A layout whose reads of compacted days fall back to the monthly archive
+
+    Days on or after the compaction boundary are never archived, so reads of
+    recent days (nearly all of them) cost nothing extra. Should the same
+    entry be in both places (an edit racing the compaction job), the hot copy
+    wins and the next compaction run replaces the archived one. Everything
+    not overridden here goes to the hot layout; entry_pipeline, and so the
+    popular-foods and favorites queries, only sees hot entries.
+    """
+
+    def __init__(self, hot, archive: DiaryArchive, after_days: int):
+        self.hot = hot
+        self.archive = archive
+        self.after_days = after_days
+
+    def __getattr__(self, name):
+        return getattr(self.hot, name)
+
+    def find_entries(self, db, user_id: str, day: Optional[date] = None, meal_type: Optional[str] = None,
+                     projection: Optional[dict] = None) -> List[dict]:
+        if day and day >= compaction_boundary(self.after_days):
+            return self.hot.find_entries(db, user_id, day, meal_type, projection)
+        if projection:
+            projection = {**projection, "entry_id": 1}
+        entries = self.hot.find_entries(db, user_id, day, meal_type, projection)
+        hot_ids = {entry["entry_id"] for entry in entries}
+        # Archived entries are older than any hot one, so they go last
+        return entries + [entry for entry in self.archive.find_entries(db, user_id, day, meal_type)
+                          if entry["entry_id"] not in hot_ids]
+
+    def get_entry(self, db, user_id: str, entry_id: str) -> Optional[dict]:
+        return self.hot.get_entry(db, user_id, entry_id) or self.archive.get_entry(db, user_id, entry_id)
+
+    def update_entry(self, db, user_id: str, entry_id: str, fields: dict) -> bool:
+        return self.hot.update_entry(db, user_id, entry_id, fields) or self.archive.update_entry(db, user_id, entry_id, fields)
+
+    def delete_entry(self, db, user_id: str, entry_id: str) -> bool:
+        # Both, so a stale archived copy cannot resurface
+        deleted = self.hot.delete_entry(db, user_id, entry_id)
+        return self.archive.delete_entry(db, user_id, entry_id) or deleted
+
+    def daily_totals(self, db, user_id: str, start: date, end: date, fields: Iterable[str] = NUTRIENT_FIELDS) -> Iterable[tuple]:
+        totals = {}
+        group = {"_id": "$date"}
+        for field in fields:
+            group[field] = {"$sum": f"$nutrition.{field}"}
+        collection, pipeline = self.hot.entry_pipeline(db, user_id, start, end)
+        for row in collection.aggregate(pipeline + [{"$group": group}]):
+            totals[as_date(row["_id"])] = row
+        if start < compaction_boundary(self.after_days):
+            # Stored per day on each archived month; an archived day may also have hot entries
+            for day, row in self.archive.daily_totals(db, user_id, start, end, fields):
+                hot = totals.get(day, {})
+                totals[day] = {field: row[field] + (hot.get(field) or 0) for field in fields}
+        return totals.items()
+
+def make_diary_store(layout: str, archive_after_days: int = 180):
+    layouts = {ENTRIES: EntryLayout, BUCKETS: BucketLayout, DUAL: DualWriteLayout}
+    if layout not in layouts:
+        raise ValueError(f"Unknown DIARY_LAYOUT '{layout}', expected one of {', '.join(layouts)}")
+    return ArchiveFallback(layouts[layout](), DiaryArchive(), archive_after_days)
+
+DIARY_ARCHIVE_AFTER_DAYS = int(os.getenv("DIARY_ARCHIVE_AFTER_DAYS", 180))
+DIARY_ARCHIVE_INTERVAL_HOURS = float(os.getenv("DIARY_ARCHIVE_INTERVAL_HOURS", 0))
+
+# Global instance
+diary_store = make_diary_store(os.getenv("DIARY_LAYOUT", ENTRIES).lower(), DIARY_ARCHIVE_AFTER_DAYS)
+
+def daily_totals(db, user_id: str, start: date, end: date, fields: Iterable[str] = NUTRIENT_FIELDS) -> Iterable[tuple]:
+    """(day, {field: total}) for every logged day in the range, archived days included"""
+    return diary_store.daily_totals(db, user_id, start, end, fields)
+
+# Compaction
+
+def compact(db, store: ArchiveFallback, today: Optional[date] = None) -> int:
+    """Move hot entries before the compaction boundary into the archive; returns the entries moved
+
+    Each month is written to the archive before its entries leave the hot
+    layout, and merging is by entry_id, so an interrupted run loses nothing
+    and simply runs again. An entry updated while its month was being
+    archived stays hot until the next run; one deleted meanwhile is taken
+    out of the archive again.
+    """
+    boundary = compaction_boundary(store.after_days, today)
+    store.archive.ensure_indexes(db)
+    moved = 0
+    for user_id in store.hot.users_with_entries_before(db, boundary):
+        collection, pipeline = store.hot.entry_pipeline(db, user_id, None, boundary - timedelta(days=1))
+        months = {}
+        for entry in collection.aggregate(pipeline):
+            entry = {key: value for key, value in entry.items() if key != "_id"}
+            entry["date"] = as_date(entry["date"]).isoformat()
+            months.setdefault(entry["date"][:7], []).append(entry)
+        for month, entries in sorted(months.items()):
+            month = date.fromisoformat(f"{month}-01")
+            store.archive.merge_month(db, user_id, month, entries)
+            # An entry deleted since it was read found nothing archived to delete, so the
+            # merge just brought it back; deletes from here on see the archived copy
+            ids = [entry["entry_id"] for entry in entries]
+            deleted = set(ids) - store.hot.existing_entry_ids(db, user_id, ids)
+            if deleted:
+                store.archive.delete_entries(db, user_id, month, deleted)
+                entries = [entry for entry in entries if entry["entry_id"] not in deleted]
+            if entries:
+                store.hot.delete_entries(db, entries)
+            moved += len(entries)
+        print(f"Archived {moved:,} diary entries (user {user_id})", file=sys.stderr)
+    return moved
+
+def acquire_lease(db, name: str, seconds: float) -> bool:
+    """Hold a named lease for `seconds`, so one worker of many runs a periodic job"""
+    now = datetime.utcnow()
+    try:
+        db.job_leases.update_one(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {"expires_at": now + timedelta(seconds=seconds), "pid": os.getpid()}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False  # held by another worker
+
+async def compact_periodically(get_db, interval: float):
+    """Run compaction every `interval` seconds in whichever worker holds the lease"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            db = get_db()
+            if await run_in_threadpool(acquire_lease, db, "diary_compaction", interval * 0.9):
+                moved = await run_in_threadpool(compact, db, diary_store)
+                print(f"Diary compaction archived {moved:,} entries")
+        except Exception as e:
+            print(f"Error compacting diary entries: {e}")
+
+# Migration
+
+def backfill(db, batch_size: int = 1000, resume_after=None) -> int:
+    """Copy diary_entries and weight_entries into buckets; returns the entries copied
+
+    Walks diary_entries in _id order, so an interrupted run can resume after
+    the last _id it printed. Entries already in a bucket (dual-written) are
+    kept as they are, and entries deleted while a batch was being copied are
+    removed again right after, so this is safe to run while serving traffic.
+    """
+    buckets = BucketLayout()
+    buckets.ensure_indexes(db)
+    copied = 0
+    query = {"_id": {"$gt": resume_after}} if resume_after is not None else {}
+    cursor = db.diary_entries.find(query).sort("_id", 1).batch_size(batch_size)
+
+    batch = []
+    for entry in cursor:
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            copied += _copy_batch(db, buckets, batch)
+            print(f"Copied {copied:,} diary entries (last _id {batch[-1]['_id']})", file=sys.stderr)
+            batch = []
+    if batch:
+        copied += _copy_batch(db, buckets, batch)
+
+    for weight in db.weight_entries.find():
+        buckets.insert_weight(db, weight)
+    return copied
+
+def _copy_batch(db, buckets: BucketLayout, batch: List[dict]) -> int:
+    writes = buckets.backfill_writes(batch)
+    # An upsert racing a dual write that creates the same bucket fails with a duplicate
+    # key; retried, it updates that bucket. On the retry a duplicate key means the
+    # entry is already in its bucket.
+    for _ in range(2):
+        try:
+            db.diary_days.bulk_write(writes, ordered=False)
+            break
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            writes = [writes[error["index"]] for error in errors]
+
+    # A delete that ran between reading the batch and writing it must not be undone
+    ids = [entry["entry_id"] for entry in batch]
+    remaining = set(db.diary_entries.distinct("entry_id", {"entry_id": {"$in": ids}}))
+    for entry in batch:
+        if entry["entry_id"] not in remaining:
+            buckets.delete_entry(db, entry["user_id"], entry["entry_id"])
+    return len(batch)
+
+def verify(db, repair: bool = False) -> int:
+    """Compare entry ids per user and day between the layouts; returns the days that differ"""
+    buckets = BucketLayout()
+    mismatched = 0
+    days = db.diary_entries.aggregate([
+        {"$group": {"_id": {"user_id": "$user_id", "date": "$date"}, "entry_ids": {"$push": "$entry_id"}}}
+    ], allowDiskUse=True)
+    seen = 0
+    for day in days:
+        seen += 1
+        user_id, day_value = day["_id"]["user_id"], as_date(day["_id"]["date"])
+        bucket = db.diary_days.find_one({"_id": day_bucket_id(user_id, day_value)}, {"entry_ids": 1}) or {}
+        expected, actual = set(day["entry_ids"]), set(bucket.get("entry_ids", []))
+        if expected == actual:
+            continue
+        mismatched += 1
+        print(f"{user_id} {day_value}: {len(expected - actual)} missing, {len(actual - expected)} extra", file=sys.stderr)
+        if repair:
+            entries = list(db.diary_entries.find({"user_id": user_id, "date": day_value.isoformat()}))
+            db.diary_days.delete_one({"_id": day_bucket_id(user_id, day_value)})
+            if entries:
+                db.diary_days.bulk_write([buckets.bucket_upsert(user_id, entries)])
+
+    orphans = db.diary_days.count_documents({}) - seen
+    if orphans > 0:
+        print(f"{orphans} bucket(s) have no entries left in diary_entries", file=sys.stderr)
+        mismatched += orphans
+    return mismatched
+
+def main():
+    from services.database import get_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Backfill the bucket collections from the entries layout")
+    migrate_parser.add_argument("--batch-size", type=int, default=1000)
+    migrate_parser.add_argument("--resume-after", help="Last diary_entries _id copied by an interrupted run")
+    verify_parser = commands.add_parser("verify", help="Compare the two layouts")
+    verify_parser.add_argument("--repair", action="store_true", help="Rebuild buckets that differ from diary_entries")
+    compact_parser = commands.add_parser("compact", help="Archive entries older than the horizon")
+    compact_parser.add_argument("--after-days", type=int, default=DIARY_ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+
+    db = get_db()
+    if args.command == "compact":
+        store = make_diary_store(diary_store.hot.name, args.after_days)
+        print(f"Archived {compact(db, store):,} diary entries into diary_archive")
+    elif args.command == "migrate":
+        from bson import ObjectId
+        resume_after = ObjectId(args.resume_after) if args.resume_after else None
+        print(f"Copied {backfill(db, args.batch_size, resume_after):,} diary entries into diary_days")
+    else:
+        mismatched = verify(db, args.repair)
+        print("Layouts match" if not mismatched else f"{mismatched} day(s) differ{' (repaired)' if args.repair else ''}")
+        sys.exit(1 if mismatched and not args.repair else 0)
+
+if __name__ == "__main__":
+    main()
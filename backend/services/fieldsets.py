@@ -0,0 +1,93 @@
+import typing
+from typing import Optional, Type
+from fastapi import HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+def _nested_model(annotation) -> Optional[Type[BaseModel]]:
+    """The model behind a field annotation such as NutritionInfo or Optional[NutritionInfo]"""
+    candidates = [annotation, *typing.get_args(annotation)]
+    for candidate in candidates:
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+class Fieldset:
+    """A `fields=` sparse fieldset, validated against a response model
+
+    "fdc_id,description,nutrition.calories" keeps those keys only; one level
+    of nesting is supported for sub-models. Without `fields` nothing changes
+    and routes return their full response model.
+    """
+
+    def __init__(self, model: Type[BaseModel], paths: tuple = ()):
+        self.model = model
+        self.paths = paths
+        self._include = {}
+        for path in paths:
+            if len(path) == 1:
+                self._include[path[0]] = True
+            elif self._include.get(path[0]) is not True:
+                self._include.setdefault(path[0], {})[path[1]] = True
+
+    @classmethod
+    def parse(cls, model: Type[BaseModel], fields: Optional[str]) -> "Fieldset":
+        if not fields:
+            return cls(model)
+        paths = []
+        for name in fields.split(","):
+            path = tuple(part.strip() for part in name.strip().split("."))
+            if not path[0]:
+                continue
+            field = model.model_fields.get(path[0])
+            nested = _nested_model(field.annotation) if field is not None else None
+            if field is None or len(path) > 2 or (len(path) == 2 and (nested is None or path[1] not in nested.model_fields)):
+                raise HTTPException(status_code=400, detail=f"Unknown field '{name.strip()}'")
+            paths.append(path)
+        return cls(model, tuple(paths))
+
+    @property
+    def selected(self) -> bool:
+        return bool(self.paths)
+
+    def projection(self) -> Optional[dict]:
+        """Mongo projection for the selected fields, or None for whole documents"""
+        if not self.selected:
+            return None
+        # From the merged include, so "nutrition" and "nutrition.calories" do not collide
+        projection = {}
+        for key, include in self._include.items():
+            if include is True:
+                projection[key] = 1
+            else:
+                projection.update({f"{key}.{name}": 1 for name in include})
+        projection["_id"] = 0
+        return projection
+
+    def apply(self, item) -> dict:
+        """The selected keys of a model instance or a stored document"""
+        if isinstance(item, BaseModel):
+            return item.model_dump(include=self._include)
+        selected = {}
+        for key, include in self._include.items():
+            if key not in item:
+                continue
+            value = item[key]
+            if include is True or not isinstance(value, dict):
+                selected[key] = value
+            else:
+                selected[key] = {name: value[name] for name in include if name in value}
+        return selected
+
+    def response(self, content) -> JSONResponse:
+        """Bypass response_model validation; the content is already trimmed"""
+        return JSONResponse(content=jsonable_encoder(content))
+
+def sparse_fields(model: Type[BaseModel]):
+    """Dependency parsing `fields=` against `model`"""
+    def dependency(fields: Optional[str] = Query(
+        None, description="Comma-separated fields to return, e.g. fdc_id,description,nutrition.calories"
+    )) -> Fieldset:
+        return Fieldset.parse(model, fields)
+    return dependency
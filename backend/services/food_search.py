@@ -0,0 +1,191 @@
+"""
+Food search across the user's diary history, their custom foods and USDA.
+
+The three sources are queried concurrently and whatever has answered by
+the deadline (SEARCH_DEADLINE_MS) is merged: a slow USDA call never holds
+back local results, and keeps running in its thread so the next search hits
+the cache. Only when no local source found anything does the search wait
+for USDA past the deadline, since there would be nothing to show.
+
+Results are ranked by how well the name matches the query, plus a boost
+for foods the user has logged before (more for frequently logged ones) and
+a smaller one for their custom foods; USDA's own relevance order breaks
+ties between USDA foods. Duplicates (the same fdc_id, or the same name and
+brand) keep their best-ranked copy. Local sources are only searched for
+the first page, and history only back SEARCH_HISTORY_DAYS.
+
+History results are converted back to per 100 g, like USDA ones, from the
+grams of the serving last logged; foods logged in units without a known
+weight (recipe servings, say) are left out.
+"""
+
+import asyncio
+import math
+import os
+import re
+from datetime import date, timedelta
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from models.food import FoodItem, FoodSearchResult, NutritionInfo
+from services.diary_store import diary_store
+from services.nutrient_cache import MASS_UNITS, UnitConversionError, grams_for, nutrient_cache
+from services.nutrition import scale_nutrition
+from services.usda_api import usda_service, USDAServiceError
+
+HISTORY = "history"
+CUSTOM = "custom"
+USDA = "usda"
+
+SEARCH_DEADLINE_MS = float(os.getenv("SEARCH_DEADLINE_MS", 800))
+SEARCH_LOCAL_LIMIT = int(os.getenv("SEARCH_LOCAL_LIMIT", 10))
+# Keeps the regex scan of a keystroke's search to recent entries, however long the diary
+SEARCH_HISTORY_DAYS = int(os.getenv("SEARCH_HISTORY_DAYS", 90))
+
+HISTORY_BOOST = 2.0
+CUSTOM_BOOST = 1.0
+
+def name_pattern(query: str) -> dict:
+    return {"$regex": re.escape(query.strip()), "$options": "i"}
+
+def match_score(query: str, name: str) -> float:
+    query, name = query.strip().lower(), (name or "").lower()
+    if name == query:
+        return 3
+    if name.startswith(query):
+        return 2
+    if query in name:
+        return 1.5
+    if all(word in name for word in query.split()):
+        return 1
+    return 0
+
+def logged_grams(db, food: dict) -> Optional[float]:
+    """Grams of a logged serving, None when its unit has no known weight"""
+    size, unit = food.get("serving_size"), (food.get("serving_unit") or "g").strip().lower()
+    if not size:
+        return None
+    if unit in MASS_UNITS:
+        return size * MASS_UNITS[unit]
+    if not (food.get("fdc_id") or "").isdigit():
+        return None
+    # Logging the food cached its profile, so this rarely reaches USDA
+    try:
+        profile = nutrient_cache.get_profile(db, food["fdc_id"])
+        return grams_for(profile, size, unit) if profile else None
+    except (USDAServiceError, UnitConversionError):
+        return None
+
+def find_history(db, user_id: str, query: str, limit: int) -> List[tuple]:
+    """(FoodItem, times logged) for recently logged foods whose name matches, per 100 g"""
+    start = date.today() - timedelta(days=SEARCH_HISTORY_DAYS)
+    diary_entries, pipeline = diary_store.entry_pipeline(db, user_id, start)
+    pipeline += [
+        {"$match": {"food_name": name_pattern(query)}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": "$food_name",
+            "count": {"$sum": 1},
+            "fdc_id": {"$first": "$fdc_id"},
+            "brand": {"$first": "$brand"},
+            "serving_size": {"$first": "$serving_size"},
+            "serving_unit": {"$first": "$serving_unit"},
+            "nutrition": {"$first": "$nutrition"}
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": limit}
+    ]
+    foods = []
+    for food in diary_entries.aggregate(pipeline):
+        grams = logged_grams(db, food)
+        if not grams:
+            continue
+        foods.append((FoodItem(
+            fdc_id=food["fdc_id"] or f"{HISTORY}:{food['_id']}",
+            description=food["_id"],
+            brand_owner=food.get("brand"),
+            serving_size=grams,
+            serving_unit="g",
+            nutrition=NutritionInfo(**scale_nutrition(food.get("nutrition") or {}, 100 / grams)),
+            source=HISTORY
+        ), food["count"]))
+    return foods
+
+def find_custom(db, user_id: str, query: str, limit: int) -> List[FoodItem]:
+    foods = db.custom_foods.find({"user_id": user_id, "name": name_pattern(query)}).limit(limit)
+    return [
+        FoodItem(
+            fdc_id=f"{CUSTOM}:{food['food_id']}",
+            description=food["name"],
+            brand_owner=food.get("brand"),
+            serving_size=food["serving_size"],
+            serving_unit=food["serving_unit"],
+            nutrition=NutritionInfo(**food["nutrition"]),
+            source=CUSTOM
+        )
+        for food in foods
+    ]
+
+def rank(query: str, history: List[tuple], custom: List[FoodItem], usda: List[FoodItem]) -> List[FoodItem]:
+    """Merge the sources best first, dropping duplicates"""
+    scored = [(match_score(query, food.description) + HISTORY_BOOST + math.log1p(count) / 2, food)
+              for food, count in history]
+    scored += [(match_score(query, food.description) + CUSTOM_BOOST, food) for food in custom]
+    scored += [(match_score(query, food.description) + 1 - position / len(usda), food)
+               for position, food in enumerate(usda)]
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    foods, seen = [], set()
+    for _, food in scored:
+        keys = {food.fdc_id, (food.description.strip().lower(), (food.brand_owner or "").strip().lower())}
+        if keys & seen:
+            continue
+        seen |= keys
+        foods.append(food)
+    return foods
+
+async def search_foods(db, user_id: str, query: str, page: int = 1, page_size: int = 20,
+                       deadline_ms: Optional[float] = None) -> FoodSearchResult:
+    """Search every source concurrently; raises USDAServiceError only if nothing else was found"""
+    deadline_ms = SEARCH_DEADLINE_MS if deadline_ms is None else deadline_ms
+    tasks = {USDA: asyncio.ensure_future(run_in_threadpool(usda_service.search_foods, query, page, page_size))}
+    if page == 1:
+        tasks[HISTORY] = asyncio.ensure_future(run_in_threadpool(find_history, db, user_id, query, SEARCH_LOCAL_LIMIT))
+        tasks[CUSTOM] = asyncio.ensure_future(run_in_threadpool(find_custom, db, user_id, query, SEARCH_LOCAL_LIMIT))
+    for task in tasks.values():
+        # Sources that miss the deadline are never awaited; this retrieves their errors
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    await asyncio.wait(tasks.values(), timeout=deadline_ms / 1000)
+    local_found = any(
+        task.done() and not task.exception() and task.result()
+        for name, task in tasks.items() if name != USDA
+    )
+    if not local_found and not tasks[USDA].done():
+        await asyncio.wait([tasks[USDA]])
+
+    results, statuses = {}, {}
+    for name, task in tasks.items():
+        if not task.done():
+            statuses[name] = "timeout"
+        elif task.exception() is not None:
+            statuses[name] = "error"
+            if not isinstance(task.exception(), USDAServiceError):
+                print(f"Error searching {name} foods: {task.exception()}")
+        else:
+            statuses[name] = "ok"
+            results[name] = task.result()
+
+    usda = results.get(USDA)
+    if usda is None and not local_found and statuses[USDA] == "error":
+        raise tasks[USDA].exception()
+
+    usda_foods = [food.model_copy(update={"source": USDA}) for food in usda.foods] if usda else []
+    foods = rank(query, results.get(HISTORY, []), results.get(CUSTOM, []), usda_foods)
+    return FoodSearchResult(
+        foods=foods,
+        total_hits=(usda.total_hits if usda else 0) + sum(food.source != USDA for food in foods),
+        current_page=page,
+        total_pages=usda.total_pages if usda else 1,
+        sources=statuses,
+        partial=any(status != "ok" for status in statuses.values())
+    )
@@ -0,0 +1,324 @@
+import bisect
+import threading
+import time
+from typing import Callable, Iterable, Tuple
+from pymongo import monitoring
+
+# Latency buckets in seconds, shared by all histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                bucket_label = 'le="{}"'.format(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, bucket_label)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+class CallbackMetric:
+    """Metric whose samples are read from existing state at scrape time"""
+
+    def __init__(self, name: str, documentation: str, metric_type: str, labelnames: Tuple[str, ...],
+                 collect: Callable[[], Iterable[Tuple[tuple, float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        for labels, value in self.collect():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status",
+    ("method", "route", "status")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+))
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ("collection", "command")
+))
+mongo_command_failures = registry.register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands by collection and command",
+    ("collection", "command")
+))
+usda_request_duration = registry.register(Histogram(
+    "usda_request_duration_seconds", "USDA FoodData Central call latency by endpoint and outcome",
+    ("endpoint", "outcome")
+))
+usda_errors = registry.register(Counter(
+    "usda_errors_total", "USDA calls that failed or were refused, by endpoint and reason",
+    ("endpoint", "reason")
+))
+usda_extra_calls = registry.register(Counter(
+    "usda_extra_calls_total", "USDA retries and hedged calls, by endpoint and kind (retry, hedge, hedge_won)",
+    ("endpoint", "kind")
+))
+
+_caches = {}
+
+def register_cache(name: str, cache):
+    """Expose a cache's hits/misses counters as cache_requests_total{cache=name}"""
+    _caches[name] = cache
+
+def _collect_cache_requests():
+    for name, cache in list(_caches.items()):
+        yield (name, "hit"), cache.hits
+        yield (name, "miss"), cache.misses
+
+registry.register(CallbackMetric(
+    "cache_requests_total", "Cache lookups by cache and result (hit ratio = hit / total)", "counter",
+    ("cache", "result"), _collect_cache_requests
+))
+
+def is_event_stream(message) -> bool:
+    """Whether an http.response.start message opens a server-sent event stream"""
+    return any(
+        name == b"content-type" and value.startswith(b"text/event-stream")
+        for name, value in message.get("headers", [])
+    )
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency per route template and status
+
+    Event streams stay open for hours, so once one starts it no longer
+    counts as in flight and its duration is not recorded; they are tracked
+    by diary_stream_connections instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        streaming = False
+        http_requests_in_flight.inc()
+
+        async def send_with_status(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if is_event_stream(message):
+                    streaming = True
+                    http_requests_in_flight.dec()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if not streaming:
+                http_requests_in_flight.dec()
+                http_request_duration.observe(
+                    time.perf_counter() - start, scope["method"], self._route_template(scope), str(status_code)
+                )
+
+    def _route_template(self, scope) -> str:
+        # The router stores the matched endpoint in the scope; map it back to
+        # its path template so raw paths (ids, dates) never become labels
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        template = self._routes.get(endpoint)
+        if template is None:
+            template = "unmatched"
+            for route in getattr(scope.get("app"), "routes", []):
+                if getattr(route, "endpoint", None) is endpoint:
+                    template = route.path
+                    break
+            self._routes[endpoint] = template
+        return template
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command by collection and command name"""
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection")
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else "-"
+
+    def succeeded(self, event):
+        collection = self._pop(event)
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._pop(event)
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+        mongo_command_failures.inc(collection, event.command_name)
+
+    def _pop(self, event) -> str:
+        with self._lock:
+            return self._started.pop((event.connection_id, event.request_id), "-")
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Tracks open, checked-out and waited-for connections of each pool"""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _update(self, event, **changes):
+        with self._lock:
+            pool = self._pools.setdefault(event.address, {"open": 0, "checked_out": 0, "waiting": 0})
+            for key, change in changes.items():
+                pool[key] = max(pool[key] + change, 0)
+
+    def pool_created(self, event):
+        self._update(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(event.address, None)
+
+    def connection_created(self, event):
+        self._update(event, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event, waiting=-1)
+
+    def connection_checked_out(self, event):
+        self._update(event, waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._update(event, checked_out=-1)
+
+    def snapshot(self) -> dict:
+        """Per server address ("host:port"): open, checked_out and waiting connections"""
+        with self._lock:
+            return {f"{host}:{port}": dict(pool) for (host, port), pool in self._pools.items()}
+
+mongo_pool_listener = MongoPoolListener()
+
+def _collect_mongo_pool():
+    for address, pool in mongo_pool_listener.snapshot().items():
+        for state, value in pool.items():
+            yield (address, state), value
+
+registry.register(CallbackMetric(
+    "mongo_pool_connections", "MongoDB pool connections by server and state (open, checked_out, waiting)", "gauge",
+    ("address", "state"), _collect_mongo_pool
+))
+
+def register_mongo_listener():
+    """Install the command and pool listeners; affects MongoClients created afterwards"""
+    monitoring.register(MongoCommandListener())
+    monitoring.register(mongo_pool_listener)
+
+def render_metrics() -> str:
+    return registry.render()
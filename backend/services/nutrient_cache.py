@@ -0,0 +1,109 @@
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+from services.nutrition import NUTRIENT_FIELDS, scale_nutrition
+from services.usda_api import usda_service
+from services.metrics import register_cache
+from services.cache import make_cache
+from services.nutrient_store import nutrient_store
+
+# Weight-based units understood for every food, in grams per unit
+MASS_UNITS = {
+    "g": 1.0,
+    "gram": 1.0,
+    "grams": 1.0,
+    "mg": 0.001,
+    "kg": 1000.0,
+    "oz": 28.349523125,
+    "ounce": 28.349523125,
+    "ounces": 28.349523125,
+    "lb": 453.59237,
+    "lbs": 453.59237,
+    "pound": 453.59237,
+}
+
+class UnitConversionError(ValueError):
+    """Raised when a quantity's unit has no known gram weight for the food"""
+
+class NutrientCache:
+    """Per-100g nutrient vectors and portion weights for each fdc_id
+
+    Profiles are kept in a bounded cache (shared by workers when
+    CACHE_BACKEND=sqlite) and persisted to the food_profiles collection, so
+    a food is fetched from USDA only once.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30 * 86400):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._profiles = make_cache("nutrient_profiles", max_size=max_size, ttl=ttl, stale_ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get_profile(self, db, fdc_id: str) -> Optional[dict]:
+        """Get the nutrient profile for a food, fetching it from USDA on first use"""
+        fdc_id = str(fdc_id)
+        if nutrient_store is not None:
+            # Read straight from the shared memory-mapped table when the food is in it
+            profile = nutrient_store.profile(fdc_id)
+            if profile is not None:
+                with self._lock:
+                    self.hits += 1
+                return profile
+        
+        profile = self._profiles.get(fdc_id)
+        with self._lock:
+            if profile is not None:
+                self.hits += 1
+                return profile
+            self.misses += 1
+
+        profile = db.food_profiles.find_one({"fdc_id": fdc_id}, {"_id": 0})
+        if profile is None:
+            food_item = usda_service.get_food_details(fdc_id)
+            if food_item is None:
+                return None
+            profile = build_profile(food_item)
+            db.food_profiles.update_one({"fdc_id": fdc_id}, {"$set": profile}, upsert=True)
+
+        self._profiles.set(fdc_id, profile)
+        return profile
+
+def build_profile(food_item) -> dict:
+    """Flatten a parsed FoodItem into the cached profile document"""
+    return {
+        "fdc_id": food_item.fdc_id,
+        "description": food_item.description,
+        "brand_owner": food_item.brand_owner,
+        "per_100g": {field: getattr(food_item.nutrition, field) or 0 for field in NUTRIENT_FIELDS},
+        "portions": [portion.dict() for portion in food_item.portions],
+        "cached_at": datetime.utcnow()
+    }
+
+def grams_for(profile: dict, quantity: float, unit: str) -> float:
+    """Convert quantity of unit into grams using mass units or the food's portions"""
+    unit = (unit or "g").strip().lower()
+    if unit in MASS_UNITS:
+        return quantity * MASS_UNITS[unit]
+
+    portions = profile.get("portions") or []
+    for portion in portions:
+        if portion["unit"] == unit:
+            return quantity * portion["grams"]
+
+    # "cup" matches "cup, chopped" when there is no plain cup portion
+    for portion in portions:
+        if portion["unit"].split(",")[0].strip() == unit:
+            return quantity * portion["grams"]
+
+    available = ", ".join(sorted(MASS_UNITS.keys() | {portion["unit"] for portion in portions}))
+    raise UnitConversionError(f"Unknown unit '{unit}' for food {profile['fdc_id']} (available: {available})")
+
+def compute_nutrition(profile: dict, quantity: float, unit: str) -> dict:
+    """Nutrition for quantity of unit of a food, scaled from its per-100g vector"""
+    return scale_nutrition(profile["per_100g"], grams_for(profile, quantity, unit) / 100)
+
+# Global instance
+nutrient_cache = NutrientCache(max_size=int(os.getenv("NUTRIENT_CACHE_SIZE", 10000)))
+register_cache("nutrient_profiles", nutrient_cache)
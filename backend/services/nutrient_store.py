@@ -0,0 +1,292 @@
+"""
+Read-only, memory-mapped nutrient table built from the USDA bulk downloads.
+
+Layout (little-endian): 8-byte magic, uint32 header length, a JSON header
+describing each section, then the sections, 64-byte aligned:
+
+    fdc_ids              uint32[n]          sorted, binary-searched
+    nutrients            float32[fields, n] one column per NutritionInfo field, per 100 g
+    serving_size         float32[n]         FoodItem.serving_size
+    serving_unit         uint32[n]          index into the unit table
+    description/brand/category
+                         uint32[n + 1] offsets into a UTF-8 blob (empty = None)
+    portion_start        uint32[n + 1]      slice of the portion arrays per food
+    portion_grams        float32[p]
+    portion_unit         uint32[p]          index into the unit table
+    unit                 uint32[u + 1] offsets into a UTF-8 blob
+
+The file is opened with mmap, so every worker process on a host shares the
+same page-cache pages and a lookup only touches the rows it reads.
+
+Build it from the FoodData Central JSON downloads (Foundation, SR Legacy,
+Survey and/or Branded), run from the backend directory:
+    python -m services.nutrient_store build FoodData_Central_*.json -o data/nutrients.bin
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Optional
+import ijson
+import numpy as np
+from models.food import FoodItem, FoodPortion, NutritionInfo
+from services.nutrition import NUTRIENT_FIELDS
+
+MAGIC = b"NUTRSTR1"
+ALIGNMENT = 64
+STRING_TABLES = ("description", "brand", "category", "unit")
+
+class NutrientStore:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:8] != MAGIC:
+            raise ValueError(f"{path} is not a nutrient store")
+        (header_length,) = struct.unpack_from("<I", self._mm, 8)
+        header = json.loads(self._mm[12:12 + header_length])
+        if tuple(header["fields"]) != NUTRIENT_FIELDS:
+            raise ValueError(f"{path} was built for fields {header['fields']}, rebuild it")
+
+        self.count = header["count"]
+        sections = {
+            name: np.frombuffer(self._mm, dtype=dtype, count=length, offset=offset)
+            for name, (offset, dtype, length) in header["sections"].items()
+        }
+        self.fdc_ids = sections["fdc_ids"]
+        self.nutrients = sections["nutrients"].reshape(len(NUTRIENT_FIELDS), self.count)
+        self.serving_size = sections["serving_size"]
+        self.serving_unit = sections["serving_unit"]
+        self.portion_start = sections["portion_start"]
+        self.portion_grams = sections["portion_grams"]
+        self.portion_unit = sections["portion_unit"]
+        self._strings = {
+            name: (sections[f"{name}_offsets"], header["sections"][f"{name}_blob"][0])
+            for name in STRING_TABLES
+        }
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, fdc_id) -> bool:
+        return self.index_of(fdc_id) >= 0
+
+    def index_of(self, fdc_id) -> int:
+        """Row of a food, or -1 if it is not in the store"""
+        try:
+            key = int(fdc_id)
+        except (TypeError, ValueError):
+            return -1
+        if key < 0 or key > 0xFFFFFFFF:
+            return -1
+        # Same dtype as the column, or numpy would cast the whole index per lookup
+        index = int(np.searchsorted(self.fdc_ids, np.uint32(key)))
+        if index < self.count and self.fdc_ids[index] == key:
+            return index
+        return -1
+
+    def _string(self, table: str, index: int) -> Optional[str]:
+        offsets, base = self._strings[table]
+        start, end = int(offsets[index]), int(offsets[index + 1])
+        if start == end:
+            return None
+        return self._mm[base + start:base + end].decode("utf-8")
+
+    def nutrition(self, index: int) -> dict:
+        """Per-100 g nutrient values of a row"""
+        # Rounded so float32 noise (31.0200004) never reaches responses
+        return {field: round(value, 3) for field, value in zip(NUTRIENT_FIELDS, self.nutrients[:, index].tolist())}
+
+    def portions(self, index: int) -> list:
+        start, end = int(self.portion_start[index]), int(self.portion_start[index + 1])
+        return [
+            {"unit": self._string("unit", int(unit)), "grams": round(grams, 3)}
+            for unit, grams in zip(self.portion_unit[start:end].tolist(), self.portion_grams[start:end].tolist())
+        ]
+
+    def food_item(self, fdc_id) -> Optional[FoodItem]:
+        """The FoodItem get_food_details would return, or None if not stored"""
+        index = self.index_of(fdc_id)
+        if index < 0:
+            return None
+        return FoodItem(
+            fdc_id=str(int(self.fdc_ids[index])),
+            description=self._string("description", index) or "",
+            brand_owner=self._string("brand", index),
+            serving_size=round(float(self.serving_size[index]), 3),
+            serving_unit=self._string("unit", int(self.serving_unit[index])) or "g",
+            nutrition=NutritionInfo(**self.nutrition(index)),
+            food_category=self._string("category", index),
+            portions=[FoodPortion(**portion) for portion in self.portions(index)]
+        )
+
+    def profile(self, fdc_id) -> Optional[dict]:
+        """Nutrient profile in the shape used by nutrient_cache, or None if not stored"""
+        index = self.index_of(fdc_id)
+        if index < 0:
+            return None
+        return {
+            "fdc_id": str(int(self.fdc_ids[index])),
+            "description": self._string("description", index) or "",
+            "brand_owner": self._string("brand", index),
+            "per_100g": self.nutrition(index),
+            "portions": self.portions(index),
+        }
+
+class _StringTable:
+    def __init__(self):
+        self.offsets = [0]
+        self.blob = bytearray()
+        self.index = {}
+
+    def add(self, value: Optional[str]) -> int:
+        self.blob += (value or "").encode("utf-8")
+        self.offsets.append(len(self.blob))
+        return len(self.offsets) - 2
+
+    def intern(self, value: str) -> int:
+        if value not in self.index:
+            self.index[value] = self.add(value)
+        return self.index[value]
+
+def write_store(path: str, foods):
+    """Write parsed FoodItems to a nutrient store file (later duplicates of an fdc_id win)"""
+    # Keep plain tuples, not FoodItems, while reading: bulk files hold millions of foods
+    by_id = {}
+    for food in foods:
+        if food is None or not food.fdc_id.isdigit():
+            continue
+        by_id[int(food.fdc_id)] = (
+            tuple(getattr(food.nutrition, field) or 0 for field in NUTRIENT_FIELDS),
+            food.serving_size or 100,
+            food.serving_unit or "g",
+            food.description,
+            food.brand_owner,
+            food.food_category,
+            tuple((portion.unit, portion.grams) for portion in food.portions),
+        )
+    ids = sorted(by_id)
+    count = len(ids)
+
+    nutrients = np.zeros((len(NUTRIENT_FIELDS), count), dtype=np.float32)
+    serving_size = np.zeros(count, dtype=np.float32)
+    serving_unit = np.zeros(count, dtype=np.uint32)
+    portion_start = [0]
+    portion_grams = []
+    portion_unit = []
+    tables = {name: _StringTable() for name in STRING_TABLES}
+
+    for row, fdc_id in enumerate(ids):
+        values, size, unit, description, brand, category, portions = by_id[fdc_id]
+        nutrients[:, row] = values
+        serving_size[row] = size
+        serving_unit[row] = tables["unit"].intern(unit)
+        tables["description"].add(description)
+        tables["brand"].add(brand)
+        tables["category"].add(category)
+        for portion_name, grams in portions:
+            portion_grams.append(grams)
+            portion_unit.append(tables["unit"].intern(portion_name))
+        portion_start.append(len(portion_grams))
+
+    arrays = {
+        "fdc_ids": np.asarray(ids, dtype=np.uint32),
+        "nutrients": nutrients,
+        "serving_size": serving_size,
+        "serving_unit": serving_unit,
+        "portion_start": np.asarray(portion_start, dtype=np.uint32),
+        "portion_grams": np.asarray(portion_grams, dtype=np.float32),
+        "portion_unit": np.asarray(portion_unit, dtype=np.uint32),
+    }
+    for name, table in tables.items():
+        arrays[f"{name}_offsets"] = np.asarray(table.offsets, dtype=np.uint32)
+        arrays[f"{name}_blob"] = np.frombuffer(bytes(table.blob), dtype=np.uint8)
+
+    # Offsets depend on the header length, which depends on the offsets; reserve room generously
+    reserved = 4096
+    offset = 12 + reserved
+    sections = {}
+    for name, array in arrays.items():
+        offset += -offset % ALIGNMENT
+        sections[name] = [offset, array.dtype.str, int(array.size)]
+        offset += array.nbytes
+    header = json.dumps({"version": 1, "count": count, "fields": list(NUTRIENT_FIELDS), "sections": sections}).encode()
+    if len(header) > reserved:
+        raise ValueError("Nutrient store header too large")
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header.ljust(reserved, b" "))
+        for name, array in arrays.items():
+            f.seek(sections[name][0])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(temporary, path)
+    return count
+
+def bulk_prefix(f) -> str:
+    """ijson prefix of the food records: the items of the first list in the file"""
+    # [...], or {"FoundationFoods": [...]}, {"SRLegacyFoods": [...]}, {"BrandedFoods": [...]}, ...
+    for prefix, event, _ in ijson.parse(f):
+        if event == "start_array":
+            return f"{prefix}.item" if prefix else "item"
+    raise ValueError("No list of foods in the file")
+
+def iter_bulk_foods(path: str):
+    """Raw food records of a FoodData Central bulk JSON download, one at a time
+
+    Branded Foods alone is several GB, so the file is streamed rather than
+    loaded whole.
+    """
+    with open(path, "rb") as f:
+        prefix = bulk_prefix(f)
+        f.seek(0)
+        yield from ijson.items(f, prefix, use_float=True)
+
+def build(paths, output: str) -> int:
+    from services.usda_api import usda_service
+
+    def parsed():
+        for path in paths:
+            print(f"Reading {path}", file=sys.stderr)
+            for record in iter_bulk_foods(path):
+                yield usda_service._parse_food_data(record)
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return write_store(output, parsed())
+
+def open_store(path: Optional[str]) -> Optional[NutrientStore]:
+    """Open the store if the file exists; without one every lookup goes to the API"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return NutrientStore(path)
+    except (OSError, ValueError) as e:
+        print(f"Error opening nutrient store {path}: {e}")
+        return None
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "nutrients.bin")
+
+# Global instance, None until a store has been built
+nutrient_store = open_store(os.getenv("NUTRIENT_STORE_PATH", DEFAULT_STORE_PATH))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Build a store from FoodData Central JSON downloads")
+    build_parser.add_argument("inputs", nargs="+")
+    build_parser.add_argument("-o", "--output", default=DEFAULT_STORE_PATH)
+    args = parser.parse_args()
+
+    count = build(args.inputs, args.output)
+    print(f"Wrote {count:,} foods to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from typing import Iterable
+from models.food import NutritionInfo
+
+# Field order of NutritionInfo, shared by every rollup/scaling helper
+NUTRIENT_FIELDS = tuple(NutritionInfo.model_fields)
+
+def scale_nutrition(nutrition: dict, factor: float) -> dict:
+    """Multiply every nutrient by factor (missing values count as 0)"""
+    return {field: (nutrition.get(field) or 0) * factor for field in NUTRIENT_FIELDS}
+
+def sum_nutrition(items: Iterable[dict]) -> dict:
+    """Add up nutrient dicts field by field"""
+    totals = {field: 0 for field in NUTRIENT_FIELDS}
+    for nutrition in items:
+        for field in NUTRIENT_FIELDS:
+            totals[field] += nutrition.get(field) or 0
+    return totals
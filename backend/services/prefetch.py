@@ -0,0 +1,103 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from services.circuit_breaker import CLOSED
+from services.rate_limiter import BACKGROUND
+from services.usda_api import usda_service, USDAServiceError
+from services.nutrient_store import nutrient_store
+from services.diary_store import diary_store
+
+class Prefetcher:
+    """Warms the USDA details cache in the background at low priority
+
+    At most `concurrency` fetches run at once and at most `max_pending` fdc_ids
+    wait for a worker. Work is dropped instead of queued whenever the service
+    is under load: the breaker is not closed, interactive callers are waiting
+    for quota, or too many interactive calls are already in flight.
+    """
+
+    def __init__(self, service, concurrency: int = 2, max_pending: int = 200, max_in_flight: int = 8):
+        self.service = service
+        self.max_pending = max_pending
+        self.max_in_flight = max_in_flight
+        self.fetched = 0
+        self.skipped = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="usda-prefetch")
+
+    def under_load(self) -> bool:
+        return (
+            self.service.breaker.state != CLOSED
+            or self.service.limiter.queued() > 0
+            or self.service.in_flight >= self.max_in_flight
+        )
+
+    def prefetch_details(self, fdc_ids: Iterable[str]):
+        """Schedule details lookups for foods that are not cached yet"""
+        if self.under_load():
+            return
+
+        for fdc_id in fdc_ids:
+            if not fdc_id or self._is_cached(fdc_id):
+                continue
+            with self._lock:
+                if fdc_id in self._pending or len(self._pending) >= self.max_pending:
+                    continue
+                self._pending.add(fdc_id)
+            self._executor.submit(self._fetch, fdc_id)
+
+    def _is_cached(self, fdc_id: str) -> bool:
+        if nutrient_store is not None and fdc_id in nutrient_store:
+            return True
+        return self.service.details_cache.contains(f"food:{fdc_id}")
+
+    def warm_user_favorites(self, db, user_id: str, limit: int = 20):
+        """Schedule the user's most-logged USDA foods, found off the request path"""
+        if not self.under_load():
+            self._executor.submit(self._warm_favorites, db, user_id, limit)
+
+    def _warm_favorites(self, db, user_id: str, limit: int):
+        diary_entries, pipeline = diary_store.entry_pipeline(db, user_id)
+        pipeline += [
+            {"$match": {"fdc_id": {"$ne": None}}},
+            {"$group": {"_id": "$fdc_id", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit}
+        ]
+        try:
+            self.prefetch_details(row["_id"] for row in diary_entries.aggregate(pipeline))
+        except Exception as e:
+            print(f"Error warming favorite foods: {e}")
+
+    def _fetch(self, fdc_id: str):
+        try:
+            # Re-check: load may have built up while this was queued
+            if self.under_load():
+                self.skipped += 1
+                return
+            if not self._is_cached(fdc_id):
+                self.service.get_food_details(fdc_id, priority=BACKGROUND)
+                self.fetched += 1
+        except USDAServiceError:
+            self.skipped += 1
+        finally:
+            with self._lock:
+                self._pending.discard(fdc_id)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"pending": pending, "fetched": self.fetched, "skipped": self.skipped}
+
+# Global instance
+prefetcher = Prefetcher(
+    usda_service,
+    concurrency=int(os.getenv("PREFETCH_CONCURRENCY", 2)),
+    max_pending=int(os.getenv("PREFETCH_MAX_PENDING", 200)),
+    max_in_flight=int(os.getenv("PREFETCH_MAX_IN_FLIGHT", 8))
+)
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", 3))
+PREFETCH_FAVORITES = int(os.getenv("PREFETCH_FAVORITES", 20))
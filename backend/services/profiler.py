@@ -0,0 +1,192 @@
+import contextvars
+import itertools
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Optional
+from services.metrics import is_event_stream
+
+# Profile token of the request being served, visible to threadpool work it spawns
+_profile_token = contextvars.ContextVar("profile_token", default=None)
+
+_QUEUE_GET_CODE = queue.Queue.get.__code__
+
+# How far from the bottom of a worker thread's stack to look for its copied Context
+_CONTEXT_SEARCH_DEPTH = 6
+
+def _frame_label(code) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+class SamplingProfiler:
+    """Wall-clock stack sampler for in-flight HTTP requests
+
+    A daemon thread wakes every `interval` seconds while at least one request
+    is being profiled and reads every thread's stack. Samples on the event
+    loop are attributed by finding the ProfilerMiddleware frame of the
+    request that is running; samples on threadpool workers are attributed
+    through the request context copied into the worker. Finished profiles are
+    kept in a ring buffer as collapsed stacks ("a;b;c count"), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005, slow_threshold: float = 0.5,
+                 sample_rate: float = 0.0, capacity: int = 50):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+        self.profiles = deque(maxlen=capacity)
+        self._active = {}
+        self._tokens = itertools.count(1)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def begin(self) -> int:
+        token = next(self._tokens)
+        with self._lock:
+            self._active[token] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return token
+
+    def end(self, token: int) -> Counter:
+        with self._lock:
+            return self._active.pop(token, Counter())
+
+    def store(self, method: str, path: str, status_code: int, duration: float, reason: str, samples: Counter):
+        self.profiles.append({
+            "id": next(self._ids),
+            "method": method,
+            "path": path,
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "reason": reason,
+            "sample_count": sum(samples.values()),
+            "interval_ms": self.interval * 1000,
+            "captured_at": datetime.utcnow(),
+            "samples": samples,
+        })
+
+    def get_profile(self, profile_id: int) -> Optional[dict]:
+        for profile in list(self.profiles):
+            if profile["id"] == profile_id:
+                return profile
+        return None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._wakeup.clear()
+                    continue
+                active = dict(self._active)
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                token, stack = self._attribute(frame)
+                samples = active.get(token)
+                if samples is not None:
+                    samples[stack] += 1
+
+    def _attribute(self, frame):
+        """Folded stack of a thread and the profile token it is working for"""
+        frames = []
+        token = None
+        while frame is not None:
+            frames.append(frame)
+            if token is None and frame.f_code is _MIDDLEWARE_CODE:
+                token = frame.f_locals.get("token")
+            frame = frame.f_back
+
+        if token is None:
+            # Threadpool workers run request code inside a copy of its Context;
+            # an idle worker still holds its last Context while blocked on its queue
+            for index in range(len(frames) - 1, max(len(frames) - _CONTEXT_SEARCH_DEPTH, 0) - 1, -1):
+                if index == 0 or frames[index - 1].f_code is _QUEUE_GET_CODE:
+                    break
+                contexts = [v for v in frames[index].f_locals.values() if isinstance(v, contextvars.Context)]
+                if contexts:
+                    token = contexts[0].get(_profile_token)
+                    break
+
+        if token is None:
+            return None, None
+        return token, ";".join(_frame_label(f.f_code) for f in reversed(frames))
+
+    def snapshot(self) -> list:
+        return [
+            {key: value for key, value in profile.items() if key != "samples"}
+            for profile in list(self.profiles)
+        ]
+
+def to_collapsed(profile: dict) -> str:
+    """Render a profile in collapsed-stack format for flamegraph tools"""
+    return "\n".join(f"{stack} {count}" for stack, count in profile["samples"].most_common()) + "\n"
+
+class ProfilerMiddleware:
+    """ASGI middleware that keeps stack profiles of slow or randomly sampled requests
+
+    Profiling of an event stream stops when its response starts: an open
+    stream is not a slow request, and would keep the sampler running.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sampled = random.random() < self.profiler.sample_rate
+        token = self.profiler.begin()
+        context_token = _profile_token.set(token)
+        status_code = 500
+        streaming = False
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if is_event_stream(message):
+                    streaming = True
+                    self.profiler.end(token)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            _profile_token.reset(context_token)
+            samples = self.profiler.end(token)
+            if not streaming and duration >= self.profiler.slow_threshold:
+                self.profiler.store(scope["method"], scope["path"], status_code, duration, "slow", samples)
+            elif not streaming and sampled:
+                self.profiler.store(scope["method"], scope["path"], status_code, duration, "sampled", samples)
+
+_MIDDLEWARE_CODE = ProfilerMiddleware.__call__.__code__
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+
+# Global instance, only created when profiling is switched on
+profiler = SamplingProfiler(
+    interval=float(os.getenv("PROFILER_INTERVAL_MS", 5)) / 1000,
+    slow_threshold=float(os.getenv("PROFILER_SLOW_MS", 500)) / 1000,
+    sample_rate=float(os.getenv("PROFILER_SAMPLE_RATE", 0.0)),
+    capacity=int(os.getenv("PROFILER_CAPACITY", 50))
+) if PROFILER_ENABLED else None
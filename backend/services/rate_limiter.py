@@ -0,0 +1,115 @@
+import bisect
+import itertools
+import threading
+import time
+
+# Request priorities, lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class QuotaRateLimiter:
+    """Token bucket sized to an upstream quota, with a priority wait queue
+
+    Tokens refill continuously at the quota rate. When the bucket is empty,
+    callers queue by priority (then arrival) and wait up to their timeout.
+    Background callers must also leave `background_reserve` tokens in the
+    bucket so they can never starve interactive traffic. The bucket is
+    clamped to the remaining quota the upstream reports in its headers.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float, background_reserve: float = 0):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.background_reserve = background_reserve
+        self.tokens = capacity
+        self.upstream_limit = None
+        self.upstream_remaining = None
+        self.blocked_until = 0.0
+        self.granted = 0
+        self.rejected = 0
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority: int = INTERACTIVE, timeout: float = 0) -> bool:
+        """Take one token, waiting up to timeout seconds; False if none was granted"""
+        deadline = time.monotonic() + timeout
+        ticket = (priority, next(self._sequence))
+        needed = 1 + (self.background_reserve if priority > INTERACTIVE else 0)
+
+        with self._condition:
+            bisect.insort(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == ticket and now >= self.blocked_until and self.tokens >= needed:
+                        self.tokens -= 1
+                        self.granted += 1
+                        return True
+
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    self._condition.wait(min(remaining, self._time_until(needed, now)))
+            finally:
+                self._waiters.remove(ticket)
+                self._condition.notify_all()
+
+    def update_from_headers(self, headers, status_code: int = 200):
+        """Track the quota reported by the upstream (X-RateLimit-* / Retry-After)"""
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        retry_after = headers.get("Retry-After")
+
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            if limit is not None and limit.isdigit():
+                self.upstream_limit = int(limit)
+            if remaining is not None and remaining.isdigit():
+                self.upstream_remaining = int(remaining)
+                self.tokens = min(self.tokens, self.upstream_remaining)
+            if status_code == 429:
+                self.tokens = 0
+                wait = float(retry_after) if retry_after and retry_after.isdigit() else 1 / self.refill_per_second
+                self.blocked_until = max(self.blocked_until, now + wait)
+            self._condition.notify_all()
+
+    def retry_after(self) -> float:
+        """Seconds until an interactive caller could expect a token"""
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            return max(self.blocked_until - now, self._time_until(1, now), 0)
+
+    def queued(self) -> int:
+        """Number of callers currently waiting for a token"""
+        return len(self._waiters)
+
+    def snapshot(self) -> dict:
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "tokens": round(self.tokens, 2),
+                "capacity": self.capacity,
+                "queued": len(self._waiters),
+                "upstream_limit": self.upstream_limit,
+                "upstream_remaining": self.upstream_remaining,
+                "blocked_for": round(max(self.blocked_until - now, 0), 2),
+                "granted": self.granted,
+                "rejected": self.rejected,
+            }
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+
+    def _time_until(self, needed: float, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return max((needed - self.tokens) / self.refill_per_second, 0.001)
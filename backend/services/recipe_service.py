@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import List
+from models.recipe import RecipeIngredient
+from services.nutrition import scale_nutrition, sum_nutrition
+from services.nutrient_cache import nutrient_cache, compute_nutrition, UnitConversionError
+
+class IngredientError(ValueError):
+    """Raised when a recipe ingredient cannot be resolved"""
+
+def resolve_ingredient(db, user_id: str, ingredient: RecipeIngredient) -> dict:
+    """Look up an ingredient once and store its nutrition contribution on it"""
+    if bool(ingredient.fdc_id) == bool(ingredient.food_id):
+        raise IngredientError("Each ingredient needs exactly one of fdc_id or food_id")
+    if ingredient.quantity <= 0:
+        raise IngredientError("Ingredient quantity must be positive")
+
+    if ingredient.food_id:
+        food = db.custom_foods.find_one({"food_id": ingredient.food_id, "user_id": user_id})
+        if not food:
+            raise IngredientError(f"Custom food {ingredient.food_id} not found")
+        return custom_food_contribution(food, ingredient.quantity)
+
+    profile = nutrient_cache.get_profile(db, ingredient.fdc_id)
+    if not profile:
+        raise IngredientError(f"Food {ingredient.fdc_id} not found")
+
+    try:
+        nutrition = compute_nutrition(profile, ingredient.quantity, ingredient.unit)
+    except UnitConversionError as e:
+        raise IngredientError(str(e))
+
+    return {
+        "fdc_id": ingredient.fdc_id,
+        "food_id": None,
+        "quantity": ingredient.quantity,
+        "unit": ingredient.unit,
+        "name": profile["description"],
+        "nutrition": nutrition
+    }
+
+def custom_food_contribution(food: dict, quantity: float) -> dict:
+    """Nutrition of quantity servings of a custom food document"""
+    return {
+        "fdc_id": None,
+        "food_id": food["food_id"],
+        "quantity": quantity,
+        "unit": None,
+        "name": food["name"],
+        "nutrition": scale_nutrition(food["nutrition"], quantity)
+    }
+
+def rollup(ingredients: List[dict], servings: float) -> dict:
+    """Per-serving nutrition from the stored ingredient contributions"""
+    totals = sum_nutrition(ingredient["nutrition"] for ingredient in ingredients)
+    return scale_nutrition(totals, 1 / servings)
+
+def build_recipe_fields(db, user_id: str, ingredients: List[RecipeIngredient], servings: float) -> dict:
+    """Resolve every ingredient and precompute the per-serving nutrition"""
+    if servings <= 0:
+        raise IngredientError("Servings must be positive")
+    if not ingredients:
+        raise IngredientError("A recipe needs at least one ingredient")
+
+    resolved = [resolve_ingredient(db, user_id, ingredient) for ingredient in ingredients]
+    return {
+        "ingredients": resolved,
+        "servings": servings,
+        "nutrition": rollup(resolved, servings)
+    }
+
+def recompute_recipes_for_custom_food(db, food: dict) -> int:
+    """Refresh the rollup of every recipe that uses a changed custom food"""
+    updated = 0
+    for recipe in db.recipes.find({"user_id": food["user_id"], "ingredients.food_id": food["food_id"]}):
+        ingredients = [
+            custom_food_contribution(food, ingredient["quantity"])
+            if ingredient.get("food_id") == food["food_id"] else ingredient
+            for ingredient in recipe["ingredients"]
+        ]
+        db.recipes.update_one(
+            {"recipe_id": recipe["recipe_id"]},
+            {"$set": {
+                "ingredients": ingredients,
+                "nutrition": rollup(ingredients, recipe["servings"]),
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        updated += 1
+    return updated
@@ -0,0 +1,154 @@
+"""
+Per-client request limits for expensive routes.
+
+Each route group has a token bucket per client: the user_id for
+authenticated routes, the client IP otherwise. A refused request gets 429
+with Retry-After. Unlike services/rate_limiter.py, which shares the USDA
+quota between everyone, this stops one client (or script) from using it
+all up, or from pinning the CPU on bcrypt with login attempts.
+
+Limits are "<requests>/<seconds>" (burst = requests) per group, from
+RATE_LIMIT_<GROUP>, e.g. RATE_LIMIT_FOOD_LOOKUP=60/60; "off" disables a
+group. As with the USDA quota, the refill rate is split between worker
+processes; the burst is too, but never below one request per worker.
+
+The client IP is `request.client.host`, which behind nginx or another
+proxy is the proxy's address unless uvicorn trusts its X-Forwarded-For
+(--proxy-headers with --forwarded-allow-ips, or gunicorn's
+forwarded_allow_ips). Otherwise everyone shares one login bucket.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from fastapi import Depends, HTTPException, Request
+from services.auth_service import get_current_user_id
+from services.metrics import Counter, registry
+from settings import get_settings
+
+DEFAULT_LIMITS = {
+    # Search, details and barcode lookups that miss the caches each cost a USDA call
+    "food_lookup": "60/60",
+    # Login and registration each hash a password with bcrypt
+    "auth": "10/60",
+}
+
+rate_limited_requests = registry.register(Counter(
+    "rate_limited_requests_total", "Requests refused by the per-client rate limiter, by route group",
+    ("group",)
+))
+
+def parse_limit(value: str) -> Optional[tuple]:
+    """(capacity, refill per second) for "<requests>/<seconds>", None for "off" """
+    if value.strip().lower() in ("off", "0", ""):
+        return None
+    requests, seconds = value.split("/")
+    per_worker = float(requests) / get_settings().web_concurrency
+    # A bucket that cannot hold one token would refuse every request
+    return max(1.0, per_worker), per_worker / float(seconds)
+
+class ClientRateLimiter:
+    """Token buckets per (group, client), in a bounded LRU map
+
+    A bucket is [tokens, last update]. Buckets idle long enough to have
+    refilled completely are indistinguishable from new ones, so they are
+    dropped from the cold end of the map as requests come in; above
+    `max_buckets` the least recently used bucket goes regardless.
+
+    Only called from the event loop, so no locking.
+    """
+
+    def __init__(self, limits: dict, max_buckets: int = 100000):
+        for group, (capacity, _) in limits.items():
+            if capacity < 1:
+                raise ValueError(f"Rate limit bucket for {group} holds {capacity} tokens, less than one request")
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.evicted = 0
+        self._buckets = OrderedDict()
+        # The slowest refill; a bucket idle this long is full again
+        self._idle_seconds = max((capacity / rate for capacity, rate in limits.values()), default=0)
+
+    def check(self, group: str, client: str, now: Optional[float] = None) -> float:
+        """Take a token; 0 if allowed, else seconds until one is available"""
+        limit = self.limits.get(group)
+        if limit is None:
+            return 0
+        capacity, rate = limit
+        now = time.monotonic() if now is None else now
+        buckets = self._buckets
+        key = (group, client)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = [capacity, now]
+            self._evict(now)
+        else:
+            buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / rate
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while len(buckets) > self.max_buckets:
+            buckets.popitem(last=False)
+            self.evicted += 1
+        # Oldest first, so stop at the first bucket still in use
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest[1] < self._idle_seconds:
+                break
+            buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def snapshot(self) -> dict:
+        return {
+            "buckets": len(self._buckets),
+            "max_buckets": self.max_buckets,
+            "evicted": self.evicted,
+            "limits": {group: round(capacity, 2) for group, (capacity, _) in self.limits.items()},
+        }
+
+def load_limits() -> dict:
+    limits = {}
+    for group, default in DEFAULT_LIMITS.items():
+        limit = parse_limit(os.getenv(f"RATE_LIMIT_{group.upper()}", default))
+        if limit is not None:
+            limits[group] = limit
+    return limits
+
+# Global instance, one per worker process
+request_limiter = ClientRateLimiter(load_limits(), max_buckets=int(os.getenv("RATE_LIMIT_MAX_BUCKETS", 100000)))
+
+def refuse(group: str, retry_after: float) -> HTTPException:
+    rate_limited_requests.inc(group)
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests, please try again shortly",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+def rate_limit_user(group: str):
+    """Dependency limiting an authenticated route group per user"""
+    async def check(user_id: str = Depends(get_current_user_id)) -> str:
+        retry_after = request_limiter.check(group, user_id)
+        if retry_after:
+            raise refuse(group, retry_after)
+        return user_id
+    return check
+
+def rate_limit_ip(group: str):
+    """Dependency limiting an anonymous route group per client IP"""
+    async def check(request: Request):
+        client = request.client.host if request.client else "unknown"
+        retry_after = request_limiter.check(group, client)
+        if retry_after:
+            raise refuse(group, retry_after)
+    return check
@@ -0,0 +1,72 @@
+import random
+import threading
+import time
+from collections import deque
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+class RetryBudget:
+    """Caps retries and hedged calls at a fraction of first attempts
+
+    Every first attempt deposits `ratio` tokens and every extra call
+    withdraws one, so extra upstream load stays below `ratio` however bad
+    things get. `min_per_second` keeps a trickle of retries possible at low
+    traffic; the balance never exceeds `max_balance`.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 0.5, max_balance: float = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self.withdrawn = 0
+        self.refused = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.balance < 1:
+                self.refused += 1
+                return False
+            self.balance -= 1
+            self.withdrawn += 1
+            return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._refill()
+            return {"balance": round(self.balance, 2), "withdrawn": self.withdrawn, "refused": self.refused}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.balance = min(self.max_balance, self.balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+class LatencyWindow:
+    """Percentiles of the last `size` latencies, recomputed every `every` samples"""
+
+    def __init__(self, size: int = 500, every: int = 50, min_samples: int = 50):
+        self.min_samples = min_samples
+        self.every = every
+        self.p95 = None
+        self._samples = deque(maxlen=size)
+        self._since_update = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_update += 1
+            if self._since_update >= self.every and len(self._samples) >= self.min_samples:
+                self._since_update = 0
+                ordered = sorted(self._samples)
+                self.p95 = ordered[int(0.95 * (len(ordered) - 1))]
@@ -1,67 +1,331 @@
 import requests
 import os
 from typing import List, Optional
-from models.food import FoodItem, FoodSearchResult, NutritionInfo
+from models.food import FoodItem, FoodSearchResult, NutritionInfo, FoodPortion
+from services.cache import make_cache
+from services.rate_limiter import QuotaRateLimiter, INTERACTIVE, BACKGROUND
+from services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from services.usda_transport import build_transport
+from services.nutrient_store import nutrient_store
+from services.retry_policy import RetryBudget, LatencyWindow, backoff
+from services import deadline
+from settings import get_settings
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+import threading
+import time
+from services.metrics import (
+    registry, register_cache, CallbackMetric, usda_request_duration, usda_errors, usda_extra_calls
+)
+
+class USDAServiceError(Exception):
+    """Raised when the USDA API cannot answer and nothing usable is cached"""
+
+class USDAUnavailable(USDAServiceError):
+    """Raised without calling the USDA API while its circuit breaker is open"""
+
+class USDATransientError(USDAServiceError):
+    """A failed call that may succeed if repeated: connection error, timeout or 5xx"""
+
+class USDAQuotaExceeded(USDAServiceError):
+    """Raised when the API key's quota is used up and the request could not wait"""
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Time budget of a request that calls USDA, and the least worth starting a call with
+USDA_REQUEST_BUDGET = float(os.getenv("USDA_REQUEST_BUDGET", 5))
+MIN_CALL_SECONDS = 0.05
 
 class USDAAPIService:
-    def __init__(self):
+    def __init__(self, transport=None):
         self.api_key = os.getenv("USDA_API_KEY")
-        self.base_url = "https://api.nal.usda.gov/fdc/v1"
+        # Overridable so load tests can point the service at a local stub
+        self.base_url = os.getenv("USDA_BASE_URL", "https://api.nal.usda.gov/fdc/v1")
+        # Live HTTP by default; record/replay fixtures and inject faults via USDA_TRANSPORT etc.
+        self.transport = transport or build_transport()
+        
+        # FoodData Central allows a fixed number of requests per key per hour,
+        # split evenly between worker processes sharing the key
+        hourly_limit = int(os.getenv("USDA_RATE_LIMIT_PER_HOUR", 1000)) / get_settings().web_concurrency
+        self.limiter = QuotaRateLimiter(
+            capacity=hourly_limit,
+            refill_per_second=hourly_limit / 3600,
+            background_reserve=hourly_limit * float(os.getenv("USDA_BACKGROUND_RESERVE", 0.2))
+        )
+        self.queue_timeout = float(os.getenv("USDA_QUEUE_TIMEOUT", 2.0))
+        
+        self.search_cache = make_cache(
+            "usda_search",
+            max_size=int(os.getenv("USDA_SEARCH_CACHE_SIZE", 5000)),
+            ttl=float(os.getenv("USDA_SEARCH_CACHE_TTL", 3600)),
+            stale_ttl=float(os.getenv("USDA_STALE_TTL", 7 * 86400))
+        )
+        self.details_cache = make_cache(
+            "usda_details",
+            max_size=int(os.getenv("USDA_DETAILS_CACHE_SIZE", 20000)),
+            ttl=float(os.getenv("USDA_DETAILS_CACHE_TTL", 86400)),
+            stale_ttl=float(os.getenv("USDA_STALE_TTL", 7 * 86400))
+        )
+        
+        # Fail fast while the API is down instead of waiting on every request
+        self.connect_timeout = float(os.getenv("USDA_CONNECT_TIMEOUT", 3.05))
+        self.read_timeout = float(os.getenv("USDA_READ_TIMEOUT", 10))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("USDA_BREAKER_FAILURES", 5)),
+            recovery_timeout=float(os.getenv("USDA_BREAKER_RECOVERY", 30)),
+            half_open_max_calls=int(os.getenv("USDA_BREAKER_HALF_OPEN_CALLS", 1))
+        )
+        self.breaker.on_close(self._revalidate_stale)
+        
+        # Transient failures are retried after a jittered backoff, and with USDA_HEDGE a
+        # second call goes out when the first is slower than the recent p95. Both draw
+        # on one budget, so they add at most USDA_RETRY_RATIO extra calls per call.
+        self.max_retries = int(os.getenv("USDA_MAX_RETRIES", 2))
+        self.retry_backoff = float(os.getenv("USDA_RETRY_BACKOFF", 0.1))
+        self.retry_budget = RetryBudget(ratio=float(os.getenv("USDA_RETRY_RATIO", 0.1)))
+        self.hedge = os.getenv("USDA_HEDGE", "false").lower() == "true"
+        self.latency = LatencyWindow()
+        self._hedger = ThreadPoolExecutor(max_workers=int(os.getenv("USDA_HEDGE_THREADS", 32)),
+                                          thread_name_prefix="usda-hedge")
+        
+        # Keys answered from stale cache during an outage, refreshed once it ends
+        self._stale_keys = {}
+        self._stale_lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="usda-refresh")
+        
+        # Interactive calls currently waiting on the API, used as a load signal
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
     
-    def search_foods(self, query: str, page: int = 1, page_size: int = 20) -> FoodSearchResult:
+    def search_foods(self, query: str, page: int = 1, page_size: int = 20, priority: int = INTERACTIVE) -> FoodSearchResult:
         """Search for foods using USDA FoodData Central API"""
-        url = f"{self.base_url}/foods/search"
+        cache_key = f"search:{query.strip().lower()}:{page}:{page_size}"
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return FoodSearchResult(**cached)
         
         params = {
             "query": query,
             "pageSize": page_size,
-            "pageNumber": page,
-            "api_key": self.api_key
+            "pageNumber": page
         }
         
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            foods = []
-            for food_data in data.get("foods", []):
-                food_item = self._parse_food_data(food_data)
-                if food_item:
-                    foods.append(food_item)
-            
-            total_hits = data.get("totalHits", 0)
-            total_pages = (total_hits + page_size - 1) // page_size
-            
-            return FoodSearchResult(
-                foods=foods,
-                total_hits=total_hits,
-                current_page=page,
-                total_pages=total_pages
-            )
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Error searching foods: {e}")
-            return FoodSearchResult(foods=[], total_hits=0, current_page=1, total_pages=1)
+            data = self._get("search", "/foods/search", params, priority)
+        except USDAServiceError as e:
+            stale = self.search_cache.get_stale(cache_key)
+            if stale is not None:
+                print(f"Serving stale search results for '{query}': {e}")
+                self._mark_stale(cache_key, self.search_foods, query, page, page_size, BACKGROUND)
+                return FoodSearchResult(**stale)
+            raise
+        
+        foods = []
+        for food_data in data.get("foods", []):
+            food_item = self._parse_food_data(food_data)
+            if food_item:
+                foods.append(food_item)
+        
+        total_hits = data.get("totalHits", 0)
+        total_pages = (total_hits + page_size - 1) // page_size
+        
+        result = FoodSearchResult(
+            foods=foods,
+            total_hits=total_hits,
+            current_page=page,
+            total_pages=total_pages
+        )
+        self.search_cache.set(cache_key, result.dict())
+        return result
     
-    def get_food_details(self, fdc_id: str) -> Optional[FoodItem]:
+    def get_food_details(self, fdc_id: str, priority: int = INTERACTIVE) -> Optional[FoodItem]:
         """Get detailed information about a specific food item"""
-        url = f"{self.base_url}/food/{fdc_id}"
+        # Foods in the bulk-download store never need the API
+        if nutrient_store is not None:
+            food_item = nutrient_store.food_item(fdc_id)
+            if food_item is not None:
+                return food_item
         
-        params = {
-            "api_key": self.api_key
-        }
+        cache_key = f"food:{fdc_id}"
+        cached = self.details_cache.get(cache_key)
+        if cached is not None:
+            return FoodItem(**cached)
         
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            return self._parse_food_data(data)
-            
+            data = self._get("food", f"/food/{fdc_id}", {}, priority)
+        except USDAServiceError as e:
+            stale = self.details_cache.get_stale(cache_key)
+            if stale is not None:
+                print(f"Serving stale details for food {fdc_id}: {e}")
+                self._mark_stale(cache_key, self.get_food_details, fdc_id, BACKGROUND)
+                return FoodItem(**stale)
+            raise
+        
+        if data is None:
+            return None
+        
+        food_item = self._parse_food_data(data)
+        if food_item:
+            self.details_cache.set(cache_key, food_item.dict())
+        return food_item
+    
+    def _get(self, endpoint: str, path: str, params: dict, priority: int = INTERACTIVE) -> Optional[dict]:
+        """Rate-limited GET against the USDA API; None when the resource does not exist"""
+        if priority != INTERACTIVE:
+            return self._request(endpoint, path, params, priority)
+        
+        with self._in_flight_lock:
+            self.in_flight += 1
+        try:
+            return self._request(endpoint, path, params, priority)
+        finally:
+            with self._in_flight_lock:
+                self.in_flight -= 1
+    
+    def _request(self, endpoint: str, path: str, params: dict, priority: int) -> Optional[dict]:
+        """One call, retried on transient failures while the retry and time budgets allow"""
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(endpoint, path, params, priority)
+            except USDATransientError:
+                attempt += 1
+                delay = backoff(attempt, self.retry_backoff, cap=2.0)
+                left = deadline.remaining()
+                if (attempt > self.max_retries or (left is not None and left < delay + MIN_CALL_SECONDS)
+                        or not self.retry_budget.withdraw()):
+                    raise
+                usda_extra_calls.inc(endpoint, "retry")
+                time.sleep(delay)
+    
+    def _attempt(self, endpoint: str, path: str, params: dict, priority: int) -> Optional[dict]:
+        # Never outlive the request: timeouts and the quota wait shrink to its remaining budget
+        left = deadline.remaining()
+        if left is not None and left < MIN_CALL_SECONDS:
+            usda_errors.inc(endpoint, "deadline")
+            raise USDAServiceError("Request budget used up before calling the USDA API")
+        timeout = (self.connect_timeout, self.read_timeout) if left is None else (
+            min(self.connect_timeout, left), min(self.read_timeout, left)
+        )
+        
+        if not self.breaker.allow_request():
+            usda_errors.inc(endpoint, "breaker_open")
+            raise USDAUnavailable("USDA API circuit breaker is open")
+        
+        # Interactive callers may queue briefly, background callers never wait
+        queue_timeout = self.queue_timeout if priority == INTERACTIVE else 0
+        if not self.limiter.acquire(priority, queue_timeout if left is None else min(queue_timeout, left)):
+            self.breaker.release()
+            usda_errors.inc(endpoint, "quota_queue_full")
+            raise USDAQuotaExceeded("USDA API quota exhausted", self.limiter.retry_after())
+        
+        started = time.perf_counter()
+        try:
+            response = self._send(endpoint, f"{self.base_url}{path}", {**params, "api_key": self.api_key},
+                                  timeout, priority)
         except requests.exceptions.RequestException as e:
-            print(f"Error getting food details: {e}")
+            print(f"Error calling USDA API {path}: {e}")
+            self.breaker.record_failure()
+            reason = "timeout" if isinstance(e, requests.exceptions.Timeout) else "connection"
+            usda_request_duration.observe(time.perf_counter() - started, endpoint, reason)
+            usda_errors.inc(endpoint, reason)
+            raise USDATransientError(f"USDA API request failed: {e}")
+        
+        status_code = response.status_code
+        elapsed = time.perf_counter() - started
+        usda_request_duration.observe(elapsed, endpoint, f"{status_code // 100}xx")
+        self.limiter.update_from_headers(response.headers, status_code)
+        if status_code >= 500:
+            print(f"Error calling USDA API {path}: HTTP {status_code}")
+            self.breaker.record_failure()
+            usda_errors.inc(endpoint, "http_5xx")
+            raise USDATransientError(f"USDA API returned HTTP {status_code}")
+        
+        # Anything below 500 means the API is up, even a quota rejection
+        self.breaker.record_success()
+        self.latency.observe(elapsed)
+        if status_code == 429:
+            usda_errors.inc(endpoint, "rate_limited")
+            raise USDAQuotaExceeded("USDA API rate limit reached", self.limiter.retry_after())
+        if status_code == 404:
             return None
+        
+        try:
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error calling USDA API {path}: {e}")
+            usda_errors.inc(endpoint, "bad_response")
+            raise USDAServiceError(f"USDA API request failed: {e}")
+    
+    def _send(self, endpoint: str, url: str, params: dict, timeout, priority: int):
+        """transport.get, hedged with a second call once the first is slower than the recent p95"""
+        p95 = self.latency.p95
+        if not self.hedge or p95 is None:
+            return self.transport.get(url, params, timeout)
+        
+        first = self._hedger.submit(self.transport.get, url, params, timeout)
+        try:
+            return first.result(timeout=p95)
+        except FutureTimeout:
+            pass
+        # A hedge never waits for quota and is not sent to a struggling API or past the deadline
+        left = deadline.remaining()
+        if (self.breaker.state != CLOSED or (left is not None and left < p95)
+                or not self.retry_budget.withdraw()):
+            return first.result()
+        if not self.limiter.acquire(priority, 0):
+            return first.result()
+        usda_extra_calls.inc(endpoint, "hedge")
+        second = self._hedger.submit(self.transport.get, url, params, timeout)
+        
+        done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = first if first in done else second
+        if winner.exception() is not None:
+            # The other call may still succeed; the loser's result is dropped either way
+            winner = second if winner is first else first
+        if winner is second:
+            usda_extra_calls.inc(endpoint, "hedge_won")
+        return winner.result()
+    
+    def _mark_stale(self, cache_key: str, refresh, *args):
+        """Remember how to refresh a key that was answered from stale cache"""
+        with self._stale_lock:
+            if len(self._stale_keys) < self.search_cache.max_size:
+                self._stale_keys[cache_key] = (refresh, args)
+    
+    def _revalidate_stale(self):
+        """Refresh everything served stale during the outage, in the background"""
+        with self._stale_lock:
+            pending = list(self._stale_keys.values())
+            self._stale_keys.clear()
+        
+        for refresh, args in pending:
+            self._refresher.submit(self._refresh_quietly, refresh, *args)
+    
+    def _refresh_quietly(self, refresh, *args):
+        try:
+            refresh(*args)
+        except USDAServiceError as e:
+            print(f"Background refresh failed: {e}")
+    
+    def snapshot(self) -> dict:
+        """Breaker, quota and cache state for health and metrics endpoints"""
+        with self._stale_lock:
+            pending = len(self._stale_keys)
+        return {
+            "breaker": self.breaker.snapshot(),
+            "limiter": self.limiter.snapshot(),
+            "stale_pending_refresh": pending,
+            "retry_budget": self.retry_budget.snapshot(),
+            "latency_p95_ms": round(self.latency.p95 * 1000, 1) if self.latency.p95 is not None else None,
+            "caches": {
+                "search": {"size": len(self.search_cache), "hits": self.search_cache.hits, "misses": self.search_cache.misses},
+                "details": {"size": len(self.details_cache), "hits": self.details_cache.hits, "misses": self.details_cache.misses},
+            }
+        }
     
     def _parse_food_data(self, food_data: dict) -> Optional[FoodItem]:
         """Parse USDA food data into our FoodItem model"""
@@ -86,6 +350,10 @@ class USDAAPIService:
                 if "portionDescription" in portion:
                     serving_unit = portion["portionDescription"]
             
+            # Details nest the category as an object, search results return its name
+            if isinstance(food_category, dict):
+                food_category = food_category.get("description")
+            
             return FoodItem(
                 fdc_id=fdc_id,
                 description=description,
@@ -93,7 +361,8 @@ class USDAAPIService:
                 serving_size=serving_size,
                 serving_unit=serving_unit,
                 nutrition=nutrition,
-                food_category=food_category
+                food_category=food_category,
+                portions=self._parse_portions(food_data)
             )
             
         except Exception as e:
@@ -116,14 +385,69 @@ class USDAAPIService:
         }
         
         for nutrient in nutrients:
-            nutrient_id = nutrient.get("nutrient", {}).get("id")
-            amount = nutrient.get("amount", 0)
+            # Details nest {"nutrient": {"id"}, "amount"}, search results are flat
+            if "nutrient" in nutrient:
+                nutrient_id = nutrient["nutrient"].get("id")
+                amount = nutrient.get("amount", 0)
+            else:
+                nutrient_id = nutrient.get("nutrientId")
+                amount = nutrient.get("value", 0)
             
             if nutrient_id in nutrient_mapping:
                 field_name = nutrient_mapping[nutrient_id]
                 setattr(nutrition, field_name, amount)
         
         return nutrition
+    
+    def _parse_portions(self, food_data: dict) -> List[FoodPortion]:
+        """Parse every household portion into per-unit gram weights"""
+        portions = []
+        
+        for portion in food_data.get("foodPortions") or []:
+            grams = portion.get("gramWeight")
+            if not grams:
+                continue
+            
+            amount = portion.get("amount") or 1
+            measure = (portion.get("measureUnit") or {}).get("name")
+            modifier = portion.get("modifier")
+            if modifier and modifier.isdigit():
+                # SR Legacy stores numeric measure codes in modifier
+                modifier = None
+            
+            if measure and measure != "undetermined":
+                unit = f"{measure}, {modifier}" if modifier else measure
+            else:
+                unit = modifier or portion.get("portionDescription")
+                # Survey foods describe the amount inline, e.g. "1 cup"
+                if unit and not modifier:
+                    head, _, rest = unit.partition(" ")
+                    try:
+                        amount = float(head)
+                        unit = rest or unit
+                    except ValueError:
+                        pass
+            
+            if unit and amount > 0:
+                portions.append(FoodPortion(unit=unit.strip().lower(), grams=grams / amount))
+        
+        # Branded foods carry one label serving in grams (or ml, taken as grams)
+        serving_size = food_data.get("servingSize")
+        serving_unit = (food_data.get("servingSizeUnit") or "").lower()
+        if serving_size and serving_unit in ("g", "grm", "ml", "mlt"):
+            portions.append(FoodPortion(unit="serving", grams=serving_size))
+        
+        return portions
 
 # Global instance
-usda_service = USDAAPIService()
\ No newline at end of file
+usda_service = USDAAPIService()
+register_cache("usda_search", usda_service.search_cache)
+register_cache("usda_details", usda_service.details_cache)
+registry.register(CallbackMetric(
+    "usda_circuit_breaker_state", "1 for the current USDA circuit breaker state", "gauge", ("state",),
+    lambda: [((state,), int(usda_service.breaker.state == state)) for state in (CLOSED, OPEN, HALF_OPEN)]
+))
+registry.register(CallbackMetric(
+    "usda_quota_tokens", "Tokens left in the USDA quota bucket", "gauge", (),
+    lambda: [((), round(usda_service.limiter.tokens, 2))]
+))
@@ -0,0 +1,204 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlencode, urlparse
+import requests
+
+# Headers worth keeping in fixtures (the limiter reads the rate-limit ones)
+RECORDED_HEADERS = ("Content-Type", "Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining")
+
+DEFAULT_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "usda")
+
+class FixtureMissing(requests.exceptions.ConnectionError):
+    """Raised on replay when no response was recorded for a request"""
+
+class FixtureResponse:
+    """The parts of requests.Response that USDAAPIService uses"""
+
+    def __init__(self, status_code: int, headers: dict, text: str):
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}", response=self)
+
+class LiveTransport:
+    """Calls the real API"""
+
+    def __init__(self):
+        self.session = requests.Session()
+
+    def get(self, url: str, params: dict, timeout):
+        return self.session.get(url, params=params, timeout=timeout)
+
+class FixtureStore:
+    """Recorded responses, one gzipped JSON file per request
+
+    Requests are keyed by path and query parameters, without the API key,
+    so fixtures recorded with one key replay with any other (or none).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, params: dict) -> str:
+        path = urlparse(url).path
+        query = urlencode(sorted((k, str(v)) for k, v in params.items() if k != "api_key"))
+        return f"{path}?{query}"
+
+    def _path(self, key: str) -> str:
+        readable = re.sub(r"[^A-Za-z0-9]+", "_", key).strip("_")[:60]
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        return os.path.join(self.directory, f"{readable}-{digest}.json.gz")
+
+    def load(self, key: str) -> Optional[dict]:
+        with self._lock:
+            if key in self._loaded:
+                return self._loaded[key]
+        try:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._loaded[key] = record
+        return record
+
+    def save(self, key: str, status_code: int, headers, text: str):
+        record = {
+            "request": key,
+            "status_code": status_code,
+            "headers": {name: headers[name] for name in RECORDED_HEADERS if name in headers},
+            "text": text,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # Write then rename so concurrent replays never read a partial file
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(temporary, "wt", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(temporary, path)
+        with self._lock:
+            self._loaded[key] = record
+
+class RecordingTransport:
+    """Calls the real API and stores every response it gets back"""
+
+    def __init__(self, store: FixtureStore, inner=None):
+        self.store = store
+        self.inner = inner or LiveTransport()
+
+    def get(self, url: str, params: dict, timeout):
+        response = self.inner.get(url, params, timeout)
+        # Server errors are transient; keep the last good answer for replay
+        if response.status_code < 500:
+            self.store.save(FixtureStore.key(url, params), response.status_code, response.headers, response.text)
+        return response
+
+class ReplayTransport:
+    """Answers from recorded fixtures only, never touching the network"""
+
+    def __init__(self, store: FixtureStore):
+        self.store = store
+
+    def get(self, url: str, params: dict, timeout):
+        key = FixtureStore.key(url, params)
+        record = self.store.load(key)
+        if record is None:
+            raise FixtureMissing(f"No recorded USDA response for {key}")
+        return FixtureResponse(record["status_code"], record["headers"], record["text"])
+
+def parse_latency(spec: str):
+    """Latency sampler from "fixed:80", "uniform:20:200", "normal:80:20" or "lognormal:80:0.5" (ms)"""
+    kind, *values = spec.split(":")
+    values = [float(value) for value in values]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(rng.gauss(values[0], values[1]), 0) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        # Median of values[0] ms with a long right tail, like real API latency
+        return lambda rng: values[0] * rng.lognormvariate(0, values[1]) / 1000
+    raise ValueError(f"Invalid latency spec '{spec}'")
+
+class FaultInjectingTransport:
+    """Adds latency and failures in front of another transport
+
+    `errors` lists the failure kinds drawn from when a request fails:
+    an HTTP status code ("503", "429"), "timeout" or "connection". With a
+    fixed seed the same sequence of requests sees the same faults.
+    """
+
+    def __init__(self, inner, latency=None, error_rate: float = 0.0, errors=("503",),
+                 retry_after: int = 1, seed: Optional[int] = None):
+        self.inner = inner
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = tuple(errors)
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get(self, url: str, params: dict, timeout):
+        with self._lock:
+            delay = self.latency(self._rng) if self.latency else 0
+            error = self._rng.choice(self.errors) if self._rng.random() < self.error_rate else None
+
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout(f"Injected latency of {delay:.3f}s exceeded the read timeout")
+        time.sleep(delay)
+
+        if error == "timeout":
+            raise requests.exceptions.ReadTimeout("Injected timeout")
+        if error == "connection":
+            raise requests.exceptions.ConnectionError("Injected connection failure")
+        if error is not None:
+            status_code = int(error)
+            headers = {"Retry-After": str(self.retry_after)} if status_code == 429 else {}
+            return FixtureResponse(status_code, headers, json.dumps({"error": "injected failure"}))
+        return self.inner.get(url, params, timeout)
+
+def build_transport():
+    """Transport selected by USDA_TRANSPORT (live, record or replay) plus optional fault injection"""
+    mode = os.getenv("USDA_TRANSPORT", "live").lower()
+    directory = os.getenv("USDA_FIXTURES", DEFAULT_FIXTURES_DIR)
+    if mode == "live":
+        transport = LiveTransport()
+    elif mode == "record":
+        transport = RecordingTransport(FixtureStore(directory))
+    elif mode == "replay":
+        transport = ReplayTransport(FixtureStore(directory))
+    else:
+        raise ValueError(f"USDA_TRANSPORT must be live, record or replay, not '{mode}'")
+
+    latency = os.getenv("USDA_INJECT_LATENCY")
+    error_rate = float(os.getenv("USDA_INJECT_ERROR_RATE", 0))
+    if latency or error_rate:
+        seed = os.getenv("USDA_INJECT_SEED")
+        transport = FaultInjectingTransport(
+            transport,
+            latency=parse_latency(latency) if latency else None,
+            error_rate=error_rate,
+            errors=[kind.strip() for kind in os.getenv("USDA_INJECT_ERRORS", "503").split(",")],
+            retry_after=int(os.getenv("USDA_INJECT_RETRY_AFTER", 1)),
+            seed=int(seed) if seed is not None else None
+        )
+    return transport
@@ -0,0 +1,126 @@
+import asyncio
+import os
+from typing import Callable, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError, PyMongoError
+from services.database import get_db
+from services.metrics import registry, Histogram
+
+# Documents per insert_many call
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+write_batch_size = registry.register(Histogram(
+    "mongo_write_batch_size", "Documents per coalesced insert_many by collection",
+    ("collection",), buckets=BATCH_SIZE_BUCKETS
+))
+
+class WriteError(Exception):
+    """Raised to a caller whose document was not written"""
+
+class InsertBatcher:
+    """Coalesces inserts arriving within `linger` seconds into one unordered insert_many
+
+    Callers await insert(); each is answered only once the batch holding its
+    document has been acknowledged under `write_concern`, and only its own
+    write error (say a duplicate key) is raised to it. A batch is written as
+    soon as it holds `max_batch` documents or its first document has waited
+    `linger` seconds. Batches are written in the threadpool, so the event loop
+    keeps gathering the next one meanwhile.
+    """
+
+    def __init__(self, get_collection: Callable, max_batch: int = 100, linger: float = 0.005,
+                 write_concern: Optional[WriteConcern] = None):
+        self.get_collection = get_collection
+        self.max_batch = max_batch
+        self.linger = linger
+        self.write_concern = write_concern
+        self.batches = 0
+        self.documents = 0
+        self.failed = 0
+        self._pending: List[tuple] = []
+        self._timer = None
+        self._writes = set()
+
+    async def insert(self, document: dict):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((document, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._flush)
+        await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._write(batch))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: list):
+        collection = self.get_collection()
+        if self.write_concern is not None:
+            collection = collection.with_options(write_concern=self.write_concern)
+        write_batch_size.observe(len(batch), collection.name)
+
+        errors = {}
+        try:
+            await run_in_threadpool(collection.insert_many, [document for document, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            concern_errors = e.details.get("writeConcernErrors")
+            if concern_errors:
+                # Inserted, but not acknowledged as durable; nobody gets an ack
+                message = concern_errors[0].get("errmsg", "write concern failed")
+                errors = {index: WriteError(message) for index in range(len(batch))}
+            for error in e.details.get("writeErrors", []):
+                errors[error["index"]] = WriteError(error.get("errmsg", "write failed"))
+        except PyMongoError as e:
+            errors = {index: WriteError(str(e)) for index in range(len(batch))}
+
+        self.batches += 1
+        self.documents += len(batch) - len(errors)
+        self.failed += len(errors)
+        for index, (_, future) in enumerate(batch):
+            # The caller may have gone away (client disconnected)
+            if future.done():
+                continue
+            if index in errors:
+                future.set_exception(errors[index])
+            else:
+                future.set_result(None)
+
+    async def drain(self):
+        """Write whatever is pending and wait for batches in flight; used at shutdown"""
+        self._flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "documents": self.documents,
+            "failed": self.failed,
+            "avg_batch_size": round((self.documents + self.failed) / self.batches, 2) if self.batches else 0.0,
+        }
+
+def parse_write_concern(w: str, journal: Optional[str]) -> WriteConcern:
+    """WriteConcern from env-style strings: w is a number or a tag such as "majority" """
+    j = None if journal is None else journal.lower() == "true"
+    return WriteConcern(w=int(w) if w.isdigit() else w, j=j)
+
+# Opt-in (DIARY_WRITE_COALESCING=true); without it every entry is its own insert_one
+DIARY_WRITE_COALESCING = os.getenv("DIARY_WRITE_COALESCING", "false").lower() == "true"
+
+# Global instance
+diary_writer = InsertBatcher(
+    lambda: get_db().diary_entries,
+    max_batch=int(os.getenv("DIARY_WRITE_BATCH_SIZE", 100)),
+    linger=float(os.getenv("DIARY_WRITE_LINGER_MS", 5)) / 1000,
+    write_concern=parse_write_concern(os.getenv("DIARY_WRITE_CONCERN", "1"), os.getenv("DIARY_WRITE_JOURNAL"))
+) if DIARY_WRITE_COALESCING else None
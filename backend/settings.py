@@ -0,0 +1,44 @@
+"""
+Application settings, read from the environment (and .env) once per process.
+
+Import `get_settings()` instead of calling os.getenv for anything listed
+here. Service tunables (USDA_*, PREFETCH_*, CACHE_* ...) are still read by
+the services that own them, after this module has loaded .env.
+"""
+
+import os
+from functools import lru_cache
+from typing import List
+from dotenv import load_dotenv
+
+# The only place .env is loaded; everything importing settings sees its values
+load_dotenv()
+
+class Settings:
+    def __init__(self):
+        self.mongo_url = os.getenv("MONGO_URL")
+        self.db_name = os.getenv("DB_NAME", "calorie_tracker")
+        # One pool per worker process, shared by every request
+        self.mongo_max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+        self.mongo_timeout_ms = int(os.getenv("MONGO_TIMEOUT_MS", 5000))
+
+        self.secret_key = os.getenv("SECRET_KEY")
+        self.algorithm = os.getenv("ALGORITHM")
+        self.access_token_expire_minutes = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+        self.admin_token = os.getenv("ADMIN_TOKEN")
+
+        self.cors_origins: List[str] = [
+            origin.strip() for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",") if origin.strip()
+        ]
+        self.web_concurrency = max(int(os.getenv("WEB_CONCURRENCY", 1)), 1)
+        # Smaller responses are sent uncompressed; 0 switches compression off
+        self.compression_min_bytes = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+
+        # /api/ready fails above these
+        self.ready_max_ping_ms = float(os.getenv("READY_MAX_PING_MS", 250))
+        self.ready_max_pool_utilization = float(os.getenv("READY_MAX_POOL_UTILIZATION", 0.9))
+        self.ready_timeout_ms = int(os.getenv("READY_TIMEOUT_MS", 1000))
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    return Settings()
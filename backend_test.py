@@ -6,6 +6,8 @@ Tests all authentication, food search, and diary management endpoints
 
 import requests
 import json
+import sys
+import uuid
 from datetime import date, datetime
 import os
 from dotenv import load_dotenv
@@ -83,6 +85,24 @@ class BackendTester:
             self.log_result("Health Check", False, f"Connection error: {str(e)}")
         return False
     
+    def test_readiness_check(self):
+        """Test the readiness probe reports Mongo and the USDA breaker"""
+        try:
+            response = self.session.get(f"{API_BASE}/ready")
+            if response.status_code == 200:
+                data = response.json()
+                checks = data.get("checks", {})
+                if data.get("status") == "ready" and checks.get("mongo", {}).get("ok") and "usda" in checks:
+                    self.log_result("Readiness Check", True, f"Ready, Mongo ping {checks['mongo'].get('ping_ms')} ms")
+                    return True
+                else:
+                    self.log_result("Readiness Check", False, "Unexpected readiness response", data)
+            else:
+                self.log_result("Readiness Check", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Readiness Check", False, f"Connection error: {str(e)}")
+        return False
+    
     def test_user_registration(self):
         """Test user registration endpoint"""
         try:
@@ -238,6 +258,7 @@ class BackendTester:
                     if response.status_code == 200:
                         data = response.json()
                         if "fdc_id" in data and "nutrition" in data:
+                            self.fdc_id = fdc_id
                             self.log_result("Food Details", True, f"Retrieved details for FDC ID: {fdc_id}", 
                                           {"description": data.get("description"), "calories": data["nutrition"].get("calories")})
                             return True
@@ -253,6 +274,28 @@ class BackendTester:
             self.log_result("Food Details", False, f"Request error: {str(e)}")
         return False
     
+    def test_barcode_lookup(self):
+        """Test barcode lookup endpoint"""
+        try:
+            response = self.session.get(f"{API_BASE}/food/barcode/023700043024")
+            if response.status_code != 400:
+                self.log_result("Barcode Lookup", False, f"Bad check digit gave HTTP {response.status_code}", response.text)
+                return False
+            
+            response = self.session.get(f"{API_BASE}/food/barcode/023700043023")
+            if response.status_code == 200 and "nutrition" in response.json():
+                self.log_result("Barcode Lookup", True, "Found food for UPC 023700043023", 
+                              {"fdc_id": response.json()["fdc_id"]})
+                return True
+            if response.status_code in (404, 503):
+                # The index is built offline from the USDA bulk data and may be missing or not list this UPC
+                self.log_result("Barcode Lookup", True, f"Barcode not indexed here (HTTP {response.status_code})")
+                return True
+            self.log_result("Barcode Lookup", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Barcode Lookup", False, f"Request error: {str(e)}")
+        return False
+    
     def test_custom_food_creation(self):
         """Test custom food creation endpoint"""
         try:
@@ -280,6 +323,7 @@ class BackendTester:
             if response.status_code == 200:
                 data = response.json()
                 if "food_id" in data and data["name"] == custom_food_data["name"]:
+                    self.custom_food_id = data["food_id"]
                     self.log_result("Custom Food Creation", True, "Custom food created successfully", 
                                   {"food_id": data["food_id"], "name": data["name"]})
                     return True
@@ -291,6 +335,51 @@ class BackendTester:
             self.log_result("Custom Food Creation", False, f"Request error: {str(e)}")
         return False
     
+    def test_recipe_logging(self):
+        """Test recipe creation, rollup recomputation and logging endpoints"""
+        if not hasattr(self, 'custom_food_id'):
+            self.log_result("Recipe Logging", False, "No custom food ID available from creation test")
+            return False
+        
+        try:
+            recipe_data = {
+                "name": "Smoothie Bowl",
+                "servings": 2,
+                "ingredients": [{"food_id": self.custom_food_id, "quantity": 2}]
+            }
+            response = self.session.post(f"{API_BASE}/recipes", json=recipe_data)
+            if response.status_code != 200:
+                self.log_result("Recipe Logging", False, f"HTTP {response.status_code} creating recipe", response.text)
+                return False
+            recipe = response.json()
+            
+            # Changing the ingredient must refresh the stored per-serving rollup
+            self.session.put(f"{API_BASE}/food/custom/{self.custom_food_id}", 
+                           json={"nutrition": {"calories": 400, "protein": 30}})
+            recipe = self.session.get(f"{API_BASE}/recipes/{recipe['recipe_id']}").json()
+            if recipe["nutrition"]["calories"] != 400:
+                self.log_result("Recipe Logging", False, "Recipe rollup not recomputed", recipe)
+                return False
+            
+            log_data = {"date": str(date.today()), "meal_type": "breakfast", "servings": 1}
+            response = self.session.post(f"{API_BASE}/recipes/{recipe['recipe_id']}/log", json=log_data)
+            if response.status_code != 200 or response.json().get("recipe_id") != recipe["recipe_id"]:
+                self.log_result("Recipe Logging", False, f"HTTP {response.status_code} logging recipe", response.text)
+                return False
+            
+            # Changing the servings logged must rescale the entry's totals
+            entry_id = response.json()["entry_id"]
+            response = self.session.put(f"{API_BASE}/diary/entries/{entry_id}", json={"serving_size": 2})
+            if response.status_code == 200 and response.json()["nutrition"]["calories"] == 800:
+                self.log_result("Recipe Logging", True, "Recipe created, recomputed, logged and resized", 
+                              {"recipe_id": recipe["recipe_id"], "calories": response.json()["nutrition"]["calories"]})
+                return True
+            else:
+                self.log_result("Recipe Logging", False, f"HTTP {response.status_code} resizing logged recipe", response.text)
+        except Exception as e:
+            self.log_result("Recipe Logging", False, f"Request error: {str(e)}")
+        return False
+    
     def test_diary_entry_creation(self):
         """Test diary entry creation endpoint"""
         try:
@@ -333,6 +422,43 @@ class BackendTester:
             self.log_result("Diary Entry Creation", False, f"Request error: {str(e)}")
         return False
     
+    def test_server_side_nutrition(self):
+        """Test diary entry creation and resize with nutrition computed from fdc_id"""
+        if not hasattr(self, 'fdc_id'):
+            self.log_result("Server-side Nutrition", False, "No FDC ID available from food details test")
+            return False
+        
+        try:
+            entry_data = {
+                "date": str(date.today()),
+                "meal_type": "snack",
+                "fdc_id": self.fdc_id,
+                "serving_size": 100,
+                "serving_unit": "g"
+            }
+            response = self.session.post(f"{API_BASE}/diary/entries", json=entry_data)
+            if response.status_code != 200:
+                self.log_result("Server-side Nutrition", False, f"HTTP {response.status_code} creating entry", response.text)
+                return False
+            entry = response.json()
+            
+            response = self.session.put(f"{API_BASE}/diary/entries/{entry['entry_id']}", json={"serving_size": 200})
+            if response.status_code == 200:
+                resized = response.json()
+                expected = round(entry["nutrition"]["calories"] * 2, 3)
+                if round(resized["nutrition"]["calories"], 3) == expected:
+                    self.log_result("Server-side Nutrition", True, "Nutrition computed and rescaled server-side", 
+                                  {"food_name": entry["food_name"], "calories_200g": resized["nutrition"]["calories"]})
+                    self.session.delete(f"{API_BASE}/diary/entries/{entry['entry_id']}")
+                    return True
+                else:
+                    self.log_result("Server-side Nutrition", False, "Nutrition not rescaled with serving size", resized)
+            else:
+                self.log_result("Server-side Nutrition", False, f"HTTP {response.status_code} resizing entry", response.text)
+        except Exception as e:
+            self.log_result("Server-side Nutrition", False, f"Request error: {str(e)}")
+        return False
+    
     def test_diary_entries_retrieval(self):
         """Test diary entries retrieval endpoint"""
         try:
@@ -357,6 +483,122 @@ class BackendTester:
             self.log_result("Diary Entries Retrieval", False, f"Request error: {str(e)}")
         return False
     
+    def test_diary_stream(self):
+        """Test that diary changes are pushed over the event stream"""
+        try:
+            stream = requests.get(f"{API_BASE}/diary/stream", params={"token": self.access_token},
+                                  stream=True, timeout=10)
+            if stream.status_code != 200:
+                self.log_result("Diary Stream", False, f"HTTP {stream.status_code}", stream.text)
+                return False
+            
+            with stream:
+                lines = stream.iter_lines(decode_unicode=True)
+                if next(lines) != "retry: 3000" or next(lines) != "event: ready":
+                    self.log_result("Diary Stream", False, "Stream did not start with a ready event")
+                    return False
+                
+                response = self.session.post(f"{API_BASE}/diary/entries", json={
+                    "date": str(date.today()),
+                    "meal_type": "snack",
+                    "food_name": "Apple",
+                    "serving_size": 1,
+                    "serving_unit": "piece",
+                    "nutrition": {"calories": 95, "protein": 0.5, "carbs": 25, "fat": 0.3,
+                                  "fiber": 4.4, "sugar": 19, "sodium": 2}
+                })
+                if response.status_code != 200:
+                    self.log_result("Diary Stream", False, f"HTTP {response.status_code} creating entry", response.text)
+                    return False
+                entry_id = response.json()["entry_id"]
+                
+                events = {}
+                event_type = None
+                for line in lines:
+                    if line.startswith("event: "):
+                        event_type = line[7:]
+                    elif line.startswith("data: ") and event_type:
+                        events[event_type] = json.loads(line[6:])
+                    if "entry_created" in events and "daily_total" in events:
+                        break
+            
+            self.session.delete(f"{API_BASE}/diary/entries/{entry_id}")
+            if events["entry_created"].get("entry_id") == entry_id and events["daily_total"].get("calories", 0) >= 95:
+                self.log_result("Diary Stream", True, "Entry and daily total pushed to the open stream", 
+                              {"daily_calories": events["daily_total"]["calories"]})
+                return True
+            self.log_result("Diary Stream", False, "Unexpected stream events", events)
+        except Exception as e:
+            self.log_result("Diary Stream", False, f"Request error: {str(e)}")
+        return False
+    
+    def test_unified_search(self):
+        """Test that search includes the user's own foods ahead of USDA results"""
+        try:
+            response = self.session.get(f"{API_BASE}/food/search", params={"query": "smoothie"})
+            if response.status_code != 200:
+                self.log_result("Unified Search", False, f"HTTP {response.status_code}", response.text)
+                return False
+            
+            data = response.json()
+            sources = [food.get("source") for food in data["foods"]]
+            if "usda" not in data.get("sources", {}):
+                self.log_result("Unified Search", False, "Missing per-source status", data)
+            elif not data["foods"] or sources[0] not in ("custom", "history"):
+                self.log_result("Unified Search", False, "Own foods not ranked first", sources)
+            else:
+                return self.check_history_per_100g(data)
+        except Exception as e:
+            self.log_result("Unified Search", False, f"Request error: {str(e)}")
+        return False
+    
+    def check_history_per_100g(self, smoothie_search):
+        """History results carry nutrition per 100 g, like USDA ones, whatever serving was logged"""
+        entry = self.session.post(f"{API_BASE}/diary/entries", json={
+            "date": str(date.today()), "meal_type": "snack", "food_name": "Probe Granola",
+            "serving_size": 200, "serving_unit": "g", "nutrition": {"calories": 300}
+        }).json()
+        try:
+            response = self.session.get(f"{API_BASE}/food/search", params={"query": "probe granola"})
+            history = [food for food in response.json()["foods"] if food.get("source") == "history"]
+            if not history or round(history[0]["nutrition"]["calories"], 3) != 150:
+                self.log_result("Unified Search", False, "History result not per 100 g", history)
+                return False
+            self.log_result("Unified Search", True, f"First result from {smoothie_search['foods'][0]['source']}", 
+                          {"sources": smoothie_search["sources"], "partial": smoothie_search.get("partial")})
+            return True
+        finally:
+            self.session.delete(f"{API_BASE}/diary/entries/{entry['entry_id']}")
+    
+    def test_sparse_fieldsets(self):
+        """Test fields= selection and compression of the diary entries endpoint"""
+        try:
+            params = {
+                "date_filter": str(date.today()),
+                "fields": "entry_id,nutrition.calories"
+            }
+            
+            response = self.session.get(f"{API_BASE}/diary/entries", params=params,
+                                        headers={"Accept-Encoding": "gzip"})
+            
+            if response.status_code == 200:
+                data = response.json()
+                if isinstance(data, list) and data and all(set(entry) == {"entry_id", "nutrition"} 
+                                                          and set(entry["nutrition"]) == {"calories"} for entry in data):
+                    bad = self.session.get(f"{API_BASE}/diary/entries", params={"fields": "no_such_field"})
+                    if bad.status_code == 400:
+                        self.log_result("Sparse Fieldsets", True, f"Trimmed {len(data)} entries to the selected fields", 
+                                      {"content_encoding": response.headers.get("content-encoding")})
+                        return True
+                    self.log_result("Sparse Fieldsets", False, f"Unknown field gave HTTP {bad.status_code}", bad.text)
+                else:
+                    self.log_result("Sparse Fieldsets", False, "Entries not trimmed to the selected fields", data)
+            else:
+                self.log_result("Sparse Fieldsets", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Sparse Fieldsets", False, f"Request error: {str(e)}")
+        return False
+    
     def test_daily_nutrition_summary(self):
         """Test daily nutrition summary endpoint"""
         try:
@@ -377,6 +619,28 @@ class BackendTester:
             self.log_result("Daily Nutrition Summary", False, f"Request error: {str(e)}")
         return False
     
+    def test_nutrition_analytics(self):
+        """Test nutrition adherence analytics endpoint"""
+        try:
+            today = date.today()
+            start = date(today.year - 1, today.month, 1)
+            response = self.session.get(f"{API_BASE}/diary/analytics", 
+                                      params={"start_date": str(start), "end_date": str(today)})
+            
+            if response.status_code == 200:
+                data = response.json()
+                if "adherence_rate" in data and len(data.get("trend", [])) == data.get("days_in_range"):
+                    self.log_result("Nutrition Analytics", True, f"Retrieved analytics for {data['days_in_range']} days", 
+                                  {"adherence_rate": data["adherence_rate"], "longest_streak": data.get("longest_streak")})
+                    return True
+                else:
+                    self.log_result("Nutrition Analytics", False, "Invalid response format", data)
+            else:
+                self.log_result("Nutrition Analytics", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Nutrition Analytics", False, f"Request error: {str(e)}")
+        return False
+    
     def test_diary_entry_update(self):
         """Test diary entry update endpoint"""
         if not hasattr(self, 'entry_id'):
@@ -463,6 +727,28 @@ class BackendTester:
             self.log_result("Weight History", False, f"Request error: {str(e)}")
         return False
     
+    def test_dashboard(self):
+        """Test the combined dashboard endpoint"""
+        try:
+            response = self.session.get(f"{API_BASE}/dashboard", params={"date": date.today().isoformat()})
+            
+            if response.status_code == 200:
+                data = response.json()
+                sections = ("user", "summary", "weight_entries", "popular_foods")
+                missing = [section for section in sections if data.get(section) is None]
+                timing = response.headers.get("Server-Timing", "")
+                if not missing and "summary;dur=" in timing:
+                    self.log_result("Dashboard", True, f"All sections returned ({timing})",
+                                  {"weight_entries": len(data["weight_entries"]), "popular_foods": len(data["popular_foods"])})
+                    return True
+                else:
+                    self.log_result("Dashboard", False, f"Missing sections {missing} or Server-Timing header", data)
+            else:
+                self.log_result("Dashboard", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Dashboard", False, f"Request error: {str(e)}")
+        return False
+    
     def test_popular_foods(self):
         """Test popular foods endpoint"""
         try:
@@ -506,6 +792,119 @@ class BackendTester:
             self.log_result("Diary Entry Deletion", False, f"Request error: {str(e)}")
         return False
     
+    def test_logout_all_sessions(self):
+        """Test that logout-all revokes existing tokens"""
+        try:
+            old_token = self.access_token
+            response = self.session.post(f"{API_BASE}/auth/logout-all")
+            if response.status_code != 200:
+                self.log_result("Logout All Sessions", False, f"HTTP {response.status_code}", response.text)
+                return False
+            
+            # Both the id-only and full-user dependencies must reject the old token
+            for path in ("/diary/entries", "/auth/me"):
+                response = self.session.get(f"{API_BASE}{path}")
+                if response.status_code != 401:
+                    self.log_result("Logout All Sessions", False, f"Revoked token still accepted by {path}",
+                                  {"status": response.status_code})
+                    return False
+            
+            # Log back in so later tests keep working
+            response = self.session.post(
+                f"{API_BASE}/auth/login",
+                data={"username": self.test_user_data["username"], "password": self.test_user_data["password"]}
+            )
+            if response.status_code != 200 or response.json()["access_token"] == old_token:
+                self.log_result("Logout All Sessions", False, "Could not log in again", response.text)
+                return False
+            self.access_token = response.json()["access_token"]
+            self.set_auth_header()
+            
+            response = self.session.get(f"{API_BASE}/diary/entries")
+            if response.status_code == 200:
+                self.log_result("Logout All Sessions", True, "Old token revoked, new token accepted")
+                return True
+            self.log_result("Logout All Sessions", False, f"New token rejected: HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Logout All Sessions", False, f"Request error: {str(e)}")
+        return False
+    
+    def test_login_rate_limit(self):
+        """Test that repeated logins from one client are refused with Retry-After"""
+        try:
+            # Runs last: it uses up this client's login allowance for the next minute
+            for attempt in range(1, 31):
+                response = requests.post(f"{API_BASE}/auth/login",
+                                         data={"username": "rate_limit_probe", "password": "wrong-password"})
+                if response.status_code == 429 and attempt == 1:
+                    # A fresh bucket holds at least one token however many workers there are
+                    self.log_result("Login Rate Limit", False, "First login refused", dict(response.headers))
+                    return False
+                if response.status_code == 429:
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit() and int(retry_after) >= 1:
+                        self.log_result("Login Rate Limit", True, f"Refused after {attempt} attempts", 
+                                      {"retry_after": retry_after})
+                        return True
+                    self.log_result("Login Rate Limit", False, "429 without a usable Retry-After", dict(response.headers))
+                    return False
+                if response.status_code != 401:
+                    self.log_result("Login Rate Limit", False, f"HTTP {response.status_code}", response.text)
+                    return False
+            self.log_result("Login Rate Limit", False, "30 failed logins were never refused")
+        except Exception as e:
+            self.log_result("Login Rate Limit", False, f"Request error: {str(e)}")
+        return False
+    
+    def test_compaction_delete_race(self):
+        """Test that an entry deleted while its month is being compacted stays deleted"""
+        try:
+            # Runs the compaction job directly, on a scratch database next to the app's
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+            from services.database import database
+            from services.diary_archive import DiaryArchive
+            from services.diary_store import ArchiveFallback, BucketLayout, EntryLayout, compact
+
+            class DeletingArchive(DiaryArchive):
+                """Deletes an entry through the store just before its month is merged"""
+                def merge_month(self, db, user_id, month, entries):
+                    if store.hot.get_entry(db, user_id, deleted_id):
+                        store.delete_entry(db, user_id, deleted_id)
+                    super().merge_month(db, user_id, month, entries)
+
+            now = datetime.utcnow()
+            for layout in (EntryLayout(), BucketLayout()):
+                db = database.client[f"compaction_probe_{uuid.uuid4().hex[:8]}"]
+                try:
+                    user_id = "compaction_probe"
+                    entries = [
+                        {"entry_id": str(uuid.uuid4()), "user_id": user_id, "date": "2020-01-15", "meal_type": "lunch",
+                         "food_name": f"Probe food {index}", "nutrition": {"calories": 100.0},
+                         "created_at": now, "updated_at": now}
+                        for index in range(3)
+                    ]
+                    deleted_id = entries[0]["entry_id"]
+                    if isinstance(layout, BucketLayout):
+                        db.diary_days.bulk_write([layout.bucket_upsert(user_id, entries)])
+                    else:
+                        db.diary_entries.insert_many([dict(entry) for entry in entries])
+                    store = ArchiveFallback(layout, DeletingArchive(), after_days=180)
+
+                    moved = compact(db, store)
+                    remaining = {entry["entry_id"] for entry in store.find_entries(db, user_id, date(2020, 1, 15))}
+                    expected = {entry["entry_id"] for entry in entries[1:]}
+                    if moved != 2 or remaining != expected:
+                        self.log_result("Compaction Delete Race", False, f"{layout.name}: deleted entry came back",
+                                      {"moved": moved, "remaining": sorted(remaining)})
+                        return False
+                finally:
+                    database.client.drop_database(db.name)
+            self.log_result("Compaction Delete Race", True, "Entry deleted mid-compaction stayed deleted")
+            return True
+        except Exception as e:
+            self.log_result("Compaction Delete Race", False, f"Error: {str(e)}")
+        return False
+    
     def run_all_tests(self):
         """Run all backend API tests"""
         print(f"🚀 Starting comprehensive backend API tests...")
@@ -516,21 +915,33 @@ class BackendTester:
         # Test sequence
         tests = [
             ("Health Check", self.test_health_check),
+            ("Readiness Check", self.test_readiness_check),
             ("User Registration", self.test_user_registration),
             ("User Login", self.test_user_login),
             ("Get Current User", self.test_get_current_user),
             ("Update User Profile", self.test_update_user_profile),
             ("Food Search", self.test_food_search),
             ("Food Details", self.test_food_details),
+            ("Barcode Lookup", self.test_barcode_lookup),
             ("Custom Food Creation", self.test_custom_food_creation),
+            ("Recipe Logging", self.test_recipe_logging),
             ("Diary Entry Creation", self.test_diary_entry_creation),
+            ("Server-side Nutrition", self.test_server_side_nutrition),
             ("Diary Entries Retrieval", self.test_diary_entries_retrieval),
+            ("Sparse Fieldsets", self.test_sparse_fieldsets),
+            ("Unified Search", self.test_unified_search),
+            ("Diary Stream", self.test_diary_stream),
             ("Daily Nutrition Summary", self.test_daily_nutrition_summary),
+            ("Nutrition Analytics", self.test_nutrition_analytics),
             ("Diary Entry Update", self.test_diary_entry_update),
             ("Weight Logging", self.test_weight_logging),
             ("Weight History", self.test_weight_history),
+            ("Dashboard", self.test_dashboard),
             ("Popular Foods", self.test_popular_foods),
             ("Diary Entry Deletion", self.test_diary_entry_deletion),
+            ("Logout All Sessions", self.test_logout_all_sessions),
+            ("Compaction Delete Race", self.test_compaction_delete_race),
+            ("Login Rate Limit", self.test_login_rate_limit),
         ]
         
         passed = 0
@@ -3,7 +3,7 @@ import { Plus, Info } from 'lucide-react';
 import { formatCalories, formatMacros } from '../utils/helpers';
 
 const FoodCard = ({ food, onAddToMeal, onViewDetails, showAddButton = true }) => {
-  const { description, brand_owner, nutrition, serving_size, serving_unit } = food;
+  const { description, brand_owner, nutrition, serving_size, serving_unit, source } = food;
 
   const handleAddClick = (e) => {
     e.stopPropagation();
@@ -32,6 +32,8 @@ const FoodCard = ({ food, onAddToMeal, onViewDetails, showAddButton = true }) =>
           )}
           <p className="text-xs text-gray-500">
             Per {serving_size} {serving_unit}
+            {source === 'history' && ' · logged before'}
+            {source === 'custom' && ' · your food'}
           </p>
         </div>
         
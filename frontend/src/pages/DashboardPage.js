@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { Link } from 'react-router-dom';
-import { diaryAPI } from '../utils/api';
+import { dashboardAPI } from '../utils/api';
 import { formatCalories, formatMacros, getMotivationalMessage } from '../utils/helpers';
 import { Calendar, Target, TrendingUp, Plus, Apple, Utensils, Moon, Coffee } from 'lucide-react';
 import NutritionProgress from '../components/NutritionProgress';
@@ -12,6 +12,7 @@ const DashboardPage = () => {
   const { user } = useAuth();
   const [dailySummary, setDailySummary] = useState(null);
   const [weightEntries, setWeightEntries] = useState([]);
+  const [profile, setProfile] = useState(null);
   const [loading, setLoading] = useState(true);
   const [selectedDate, setSelectedDate] = useState(new Date().toISOString().split('T')[0]);
 
@@ -22,13 +23,16 @@ const DashboardPage = () => {
   const fetchDashboardData = async () => {
     try {
       setLoading(true);
-      const [summaryResponse, weightResponse] = await Promise.all([
-        diaryAPI.getDailySummary(selectedDate),
-        diaryAPI.getWeightEntries(7)
-      ]);
+      // One round-trip: the backend fetches every section concurrently
+      const response = await dashboardAPI.getDashboard(selectedDate, 7);
+      const data = response.data;
 
-      setDailySummary(summaryResponse.data);
-      setWeightEntries(weightResponse.data);
+      setProfile(data.user);
+      setDailySummary(data.summary);
+      setWeightEntries(data.weight_entries || []);
+      if (Object.keys(data.errors || {}).length > 0) {
+        console.error('Dashboard sections failed:', data.errors);
+      }
     } catch (error) {
       console.error('Error fetching dashboard data:', error);
       toast.error('Failed to load dashboard data');
@@ -38,8 +42,10 @@ const DashboardPage = () => {
   };
 
   const calculateCalorieGoal = () => {
-    if (user?.target_calories) {
-      return user.target_calories;
+    // The dashboard payload carries the freshest profile
+    const targetCalories = profile?.target_calories ?? user?.target_calories;
+    if (targetCalories) {
+      return targetCalories;
     }
     // Default goal based on user profile
     return 2000;
@@ -17,11 +17,22 @@ const DiaryPage = () => {
 
   useEffect(() => {
     fetchDailySummary();
+
+    // Changes made in other sessions (phone, other tabs) arrive as events instead of polling
+    const stream = diaryAPI.openStream();
+    const refreshIfShown = (event) => {
+      if (JSON.parse(event.data).date === selectedDate) {
+        fetchDailySummary(false);
+      }
+    };
+    stream.addEventListener('daily_total', refreshIfShown);
+    stream.addEventListener('resync', () => fetchDailySummary(false));
+    return () => stream.close();
   }, [selectedDate]);
 
-  const fetchDailySummary = async () => {
+  const fetchDailySummary = async (showSpinner = true) => {
     try {
-      setLoading(true);
+      if (showSpinner) setLoading(true);
       const response = await diaryAPI.getDailySummary(selectedDate);
       setDailySummary(response.data);
     } catch (error) {
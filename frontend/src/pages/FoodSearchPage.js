@@ -91,7 +91,8 @@ const FoodSearchPage = () => {
       const entryData = {
         date: new Date().toISOString().split('T')[0],
         meal_type: selectedMeal,
-        fdc_id: selectedFood.fdc_id,
+        // Your own foods in search results (custom:..., history:...) have no USDA id
+        fdc_id: /^\d+$/.test(selectedFood.fdc_id || '') ? selectedFood.fdc_id : null,
         food_name: selectedFood.description,
         brand: selectedFood.brand_owner,
         serving_size: selectedFood.serving_size * servingSize,
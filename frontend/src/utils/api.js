@@ -53,6 +53,7 @@ export const foodAPI = {
   searchFoods: (query, page = 1, pageSize = 20) => 
     api.get('/food/search', { params: { query, page, page_size: pageSize } }),
   getFoodDetails: (fdcId) => api.get(`/food/details/${fdcId}`),
+  getFoodByBarcode: (gtin) => api.get(`/food/barcode/${encodeURIComponent(gtin)}`),
   createCustomFood: (foodData) => api.post('/food/custom', foodData),
   getCustomFoods: () => api.get('/food/custom'),
   deleteCustomFood: (foodId) => api.delete(`/food/custom/${foodId}`),
@@ -68,6 +69,14 @@ export const diaryAPI = {
   deleteEntry: (entryId) => api.delete(`/diary/entries/${entryId}`),
   logWeight: (weightData) => api.post('/diary/weight', weightData),
   getWeightEntries: (limit = 30) => api.get('/diary/weight', { params: { limit } }),
+  // Server-sent diary changes; EventSource cannot send headers, so the token goes in the URL
+  openStream: () =>
+    new EventSource(`${API_BASE_URL}/api/diary/stream?token=${encodeURIComponent(localStorage.getItem('token') || '')}`),
+};
+
+export const dashboardAPI = {
+  getDashboard: (date, weightLimit = 7) =>
+    api.get('/dashboard', { params: { date, weight_limit: weightLimit } }),
 };
 
 export default api;
\ No newline at end of file